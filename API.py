@@ -1,16 +1,65 @@
-import pyairtable
 import os
 import json
+import threading
 from datetime import datetime, timedelta, date
+from functools import wraps
+from metrics import count_upstream, span
+from log import get_logger
 
-with open('api_keys.json') as f:
-   api_keys = json.load(f)
-    
-api_key = api_keys["AIRTABLE_API_KEY"].replace(" ", "")
-base_id = api_keys["AIRTABLE_BASE_ID"]
+API_KEYS_PATH = os.environ.get("RECOMMENDA_API_KEYS", "api_keys.json")
 
-api = pyairtable.Api(api_key)
+_api_keys = None
 
+def load_api_keys():
+   """api_keys.json, read on first use rather than when the module is imported"""
+   global _api_keys
+   if _api_keys is None:
+      with open(API_KEYS_PATH) as f:
+         _api_keys = json.load(f)
+   return _api_keys
+
+def __getattr__(name):
+   # `from API import base_id` keeps working, but only reads api_keys.json when it is executed
+   if name == "api_keys":
+      return load_api_keys()
+   if name == "api_key":
+      return load_api_keys()["AIRTABLE_API_KEY"].replace(" ", "")
+   if name == "base_id":
+      return load_api_keys()["AIRTABLE_BASE_ID"]
+   raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class LazyApi:
+   """Stands in for pyairtable.Api; pyairtable (about half a second of imports) is loaded on the first call"""
+   def __init__(self):
+      self._api = None
+      self._lock = threading.Lock()
+
+   def _client(self):
+      if self._api is None:
+         with self._lock:
+            if self._api is None:
+               import pyairtable
+               self._api = pyairtable.Api(load_api_keys()["AIRTABLE_API_KEY"].replace(" ", ""))
+      return self._api
+
+   def __getattr__(self, name):
+      return getattr(self._client(), name)
+
+api = LazyApi()
+log = get_logger("airtable")
+
+def _upstream(table):
+   """Count and time every call of a list_*_records function as one Airtable request"""
+   def decorator(fn):
+      @wraps(fn)
+      def wrapper(api, base_id, record_id=None):
+         count_upstream(table, 'all' if record_id is None else 'get')
+         with span("airtable"):
+            return fn(api, base_id, record_id)
+      return wrapper
+   return decorator
+
+@_upstream('Sport')
 def list_sport_records(api, base_id, sport_id = None):
    """ 
       sport_id example: 'recGfphnFce1DEBhE'
@@ -21,6 +70,7 @@ def list_sport_records(api, base_id, sport_id = None):
       records = api.table(base_id, 'Sport').all(view='Grid view')
    return records
 
+@_upstream('Momčadi')
 def list_teams_records(api, base_id, team_id=None):
    """ 
       team_id example : 'recbBO2dEP83DqOuF'
@@ -31,6 +81,7 @@ def list_teams_records(api, base_id, team_id=None):
       records = api.table(base_id, 'Momčadi').all(view='Grid view')
    return records
 
+@_upstream('Kategorija')
 def list_category_records(api, base_id, category_id=None):
    """ 
       category_id example : 'reczS4xKNcQ9TFauy'
@@ -41,6 +92,7 @@ def list_category_records(api, base_id, category_id=None):
       records = api.table(base_id, 'Kategorija').all(view='Grid view')
    return records
 
+@_upstream('Događanje')
 def list_events_records(api, base_id, event_id=None):
    """ 
       event_id example : 'rec2c8QDkYPO9q4JA'
@@ -51,6 +103,7 @@ def list_events_records(api, base_id, event_id=None):
       records = api.table(base_id, 'Događanje').all(view='Grid view')
    return records
       
+@_upstream('Tournaments')
 def list_tournaments_records(api, base_id, tournament_id=None):
    """ 
       tournament_id example : 'recxbA9SfiL57VLkB'
@@ -61,6 +114,7 @@ def list_tournaments_records(api, base_id, tournament_id=None):
       records = api.table(base_id, 'Tournaments').all(view='Grid view')
    return records
 
+@_upstream('Lokacije')
 def list_locations_records(api, base_id, location_id=None):
    """ 
       location_id example : 'recyRV88nRMAZIEuE'
@@ -71,6 +125,7 @@ def list_locations_records(api, base_id, location_id=None):
       records = api.table(base_id, 'Lokacije').all(view='Grid view')
    return records
 
+@_upstream('Officials')
 def list_officials_records(api, base_id, official_id=None):
    if official_id is not None:
       records = api.table(base_id, 'Officials').get(official_id)
@@ -79,24 +134,33 @@ def list_officials_records(api, base_id, official_id=None):
    return records
 
 
-def get_similar_upcoming_matches(api, base_id, sport_id=None, location_id=None, team_id=None, days_ahead=7):
+def upcoming_matches_formula(days_ahead=7):
    today = datetime.now().date()
    end_date = today + timedelta(days=days_ahead)
 
    today_str = today.isoformat()
    end_date_str = end_date.isoformat()
 
-   date_condition = f"AND(IS_AFTER({{Match Date}}, '{today_str}'), IS_BEFORE({{Match Date}}, '{end_date_str}'))"
+   return f"AND(IS_AFTER({{Match Date}}, '{today_str}'), IS_BEFORE({{Match Date}}, '{end_date_str}'))"
+
+def get_similar_upcoming_matches(api, base_id, sport_id=None, location_id=None, team_id=None, days_ahead=7):
+   date_condition = upcoming_matches_formula(days_ahead)
 
    try:
-      records = api.table(base_id, 'Događanje').all(
-         formula=date_condition,
-         sort=["Match Date"]
-      )
+      count_upstream('Događanje', 'all')
+      with span("airtable"):
+         records = api.table(base_id, 'Događanje').all(
+            formula=date_condition,
+            sort=["Match Date"]
+         )
       if not records: return []
    except Exception as e:
       return []
    
+   return filter_matches(records, sport_id=sport_id, location_id=location_id, team_id=team_id)
+
+def filter_matches(records, sport_id=None, location_id=None, team_id=None):
+   """Narrow match records by sport, then team, then location, falling back to the wider set when a filter matches nothing"""
    if sport_id is not None:
       sport_ids = sport_id if isinstance(sport_id, list) else [sport_id]
       
@@ -171,16 +235,18 @@ def get_events_by_date_range(api, base_id, start_date, end_date, sport_id=None,
       
       date_condition = f"AND(IS_SAME_OR_AFTER(DATETIME_FORMAT({{Match Date}}, 'YYYY-MM-DD'), '{start_date_formatted}'), IS_BEFORE(DATETIME_FORMAT({{Match Date}}, 'YYYY-MM-DD'), '{end_date_formatted}', FALSE))"
       
-   print(f"Date condition: {date_condition}")
+   log.debug("events_by_date_range", formula=date_condition)
    try:
-      records = api.table(base_id, 'Događanje').all(
-         formula=date_condition,
-         sort=["Match Date"]
-      )
+      count_upstream('Događanje', 'all')
+      with span("airtable"):
+         records = api.table(base_id, 'Događanje').all(
+            formula=date_condition,
+            sort=["Match Date"]
+         )
       if not records: 
          return []
    except Exception as e:
-      print(f"Error fetching events by date range: {e}")
+      log.warning("events_by_date_range_failed", formula=date_condition, error=str(e))
       return []
    
    if sport_id is not None:
@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict
+import API
+
+class _Missing:
+   """Negative cache entry: remembers the error raised for an ID that does not exist"""
+   __slots__ = ("error",)
+
+   def __init__(self, error):
+      self.error = error
+
+def _is_not_found(error):
+   response = getattr(error, "response", None)
+   return getattr(response, "status_code", None) == 404
+
+class TTLCache:
+   """Thread-safe LRU cache with a per-entry time-to-live and hit/miss counters"""
+   def __init__(self, ttl, maxsize, negative_ttl=None):
+      self.ttl = ttl
+      self.maxsize = maxsize
+      self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+      self.entries = OrderedDict()
+      self.lock = threading.Lock()
+      self.hits = 0
+      self.misses = 0
+      self.negative_hits = 0
+
+   def get(self, key):
+      """Return (found, value); expired entries count as misses"""
+      with self.lock:
+         entry = self.entries.get(key)
+         if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+               self.entries.move_to_end(key)
+               if isinstance(value, _Missing):
+                  self.negative_hits += 1
+               else:
+                  self.hits += 1
+               return True, value
+            del self.entries[key]
+         self.misses += 1
+         return False, None
+
+   def set(self, key, value):
+      ttl = self.negative_ttl if isinstance(value, _Missing) else self.ttl
+      with self.lock:
+         self.entries[key] = (time.monotonic() + ttl, value)
+         self.entries.move_to_end(key)
+         while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+   def clear(self):
+      with self.lock:
+         self.entries.clear()
+
+   def stats(self):
+      with self.lock:
+         return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl
+         }
+
+# table -> (ttl seconds, max entries)
+TABLE_CACHE_SETTINGS = {
+   'Sport': (3600, 256),
+   'Momčadi': (3600, 4096),
+   'Kategorija': (3600, 256),
+   'Lokacije': (3600, 1024),
+   'Officials': (3600, 1024),
+   'Tournaments': (600, 1024),
+   'Događanje': (60, 4096),
+}
+NEGATIVE_TTL = 300
+
+caches = {
+   table: TTLCache(ttl, maxsize, negative_ttl=min(ttl, NEGATIVE_TTL))
+   for table, (ttl, maxsize) in TABLE_CACHE_SETTINGS.items()
+}
+
+def cached_records(table, fetch):
+   """Wrap one of the API.list_*_records functions with the read-through cache of `table`"""
+   cache = caches[table]
+
+   def lookup(api, base_id, record_id=None):
+      key = (base_id, record_id)
+      found, value = cache.get(key)
+      if found:
+         if isinstance(value, _Missing):
+            raise value.error
+         return value
+      try:
+         value = fetch(api, base_id, record_id)
+      except Exception as e:
+         if record_id is not None and _is_not_found(e):
+            cache.set(key, _Missing(e))
+         raise
+      cache.set(key, value)
+      return value
+
+   lookup.__name__ = fetch.__name__
+   lookup.__doc__ = fetch.__doc__
+   lookup.cache = cache
+   return lookup
+
+list_sport_records = cached_records('Sport', API.list_sport_records)
+list_teams_records = cached_records('Momčadi', API.list_teams_records)
+list_category_records = cached_records('Kategorija', API.list_category_records)
+list_events_records = cached_records('Događanje', API.list_events_records)
+list_tournaments_records = cached_records('Tournaments', API.list_tournaments_records)
+list_locations_records = cached_records('Lokacije', API.list_locations_records)
+list_officials_records = cached_records('Officials', API.list_officials_records)
+
+def cache_stats():
+   return {table: cache.stats() for table, cache in caches.items()}
+
+def clear_caches():
+   for cache in caches.values():
+      cache.clear()
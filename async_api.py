@@ -0,0 +1,113 @@
+import asyncio
+from urllib.parse import quote
+import httpx
+from API import filter_matches, upcoming_matches_formula
+from metrics import count_upstream, span, timed
+from log import get_logger
+from request_context import mark_incomplete
+
+log = get_logger("async_api")
+
+AIRTABLE_URL = "https://api.airtable.com/v0"
+
+class AsyncAirtable:
+   """Asyncio Airtable client on a pooled httpx connection, with a bound on in-flight requests"""
+   def __init__(self, api_key, base_id, max_in_flight=8, timeout=10.0):
+      self.api_key = api_key
+      self.base_id = base_id
+      self.max_in_flight = max_in_flight
+      self.timeout = timeout
+      self.semaphore = asyncio.Semaphore(max_in_flight)
+      self.client = None
+
+   def _client(self):
+      if self.client is None:
+         self.client = httpx.AsyncClient(
+            base_url=f"{AIRTABLE_URL}/{self.base_id}",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+            timeout=self.timeout
+         )
+      return self.client
+
+   async def aclose(self):
+      if self.client is not None:
+         await self.client.aclose()
+         self.client = None
+
+   async def _get(self, path, params=None):
+      async with self.semaphore:
+         with span("airtable"):
+            response = await self._client().get(path, params=params)
+      response.raise_for_status()
+      return response.json()
+
+   async def get_record(self, table, record_id):
+      """Fetch one record, or None if it does not exist or could not be fetched (429, 5xx, timeout)"""
+      count_upstream(table, 'get')
+      try:
+         return await self._get(f"/{quote(table)}/{record_id}")
+      except httpx.HTTPStatusError as e:
+         if e.response.status_code != 404:
+            log.warning("record_fetch_failed", table=table, record_id=record_id, status=e.response.status_code)
+            mark_incomplete()
+         return None
+      except httpx.HTTPError as e:
+         log.warning("record_fetch_failed", table=table, record_id=record_id, error=str(e))
+         mark_incomplete()
+         return None
+
+   async def get_records(self, table, record_ids):
+      """Fetch many records concurrently; returns {record_id: record} for the ones that exist"""
+      record_ids = list(dict.fromkeys(rid for rid in record_ids if rid))
+      records = await asyncio.gather(*(self.get_record(table, rid) for rid in record_ids))
+      return {rid: record for rid, record in zip(record_ids, records) if record}
+
+   async def list_records(self, table, formula=None, sort=None):
+      """Fetch every record of a table (following pagination), optionally filtered and sorted"""
+      params = {}
+      if formula:
+         params["filterByFormula"] = formula
+      for i, field in enumerate(sort or []):
+         params[f"sort[{i}][field]"] = field
+         params[f"sort[{i}][direction]"] = "asc"
+
+      records = []
+      while True:
+         count_upstream(table, 'all')
+         page = await self._get(f"/{quote(table)}", params=params)
+         records.extend(page.get("records", []))
+         if not page.get("offset"):
+            return records
+         params["offset"] = page["offset"]
+
+   async def get_similar_upcoming_matches(self, sport_id=None, location_id=None, team_id=None, days_ahead=7):
+      """Async counterpart of API.get_similar_upcoming_matches"""
+      try:
+         records = await self.list_records('Događanje', formula=upcoming_matches_formula(days_ahead), sort=["Match Date"])
+         if not records: return []
+      except Exception:
+         return []
+      return filter_matches(records, sport_id=sport_id, location_id=location_id, team_id=team_id)
+
+   @timed("enrichment")
+   async def prefetch_match_entities(self, catalog, matches):
+      """Resolve the home/away teams and sports of `matches` that the catalog does not hold yet, concurrently"""
+      team_ids, sport_ids = set(), set()
+      for match in matches:
+         fields = match.get('fields', {})
+         team_ids.update(fields.get('Home Team', [])[:1])
+         team_ids.update(fields.get('Away Team', [])[:1])
+         sport_ids.update(fields.get('Sport', [])[:1])
+
+      missing_teams = [tid for tid in team_ids if not catalog.has('teams', tid)]
+      missing_sports = [sid for sid in sport_ids if not catalog.has('sports', sid)]
+      if not missing_teams and not missing_sports:
+         return
+
+      teams, sports = await asyncio.gather(
+         self.get_records('Momčadi', missing_teams),
+         self.get_records('Sport', missing_sports)
+      )
+      catalog.add('teams', teams.values())
+      catalog.add('sports', sports.values())
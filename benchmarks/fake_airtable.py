@@ -0,0 +1,159 @@
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+# table names as used by API.py
+SPORT_TABLE = 'Sport'
+TEAMS_TABLE = 'Momčadi'
+CATEGORY_TABLE = 'Kategorija'
+EVENTS_TABLE = 'Događanje'
+TOURNAMENTS_TABLE = 'Tournaments'
+LOCATIONS_TABLE = 'Lokacije'
+OFFICIALS_TABLE = 'Officials'
+
+_DATE_RANGE = re.compile(r"IS_AFTER\(\{Match Date\}, '([\d-]+)'\), IS_BEFORE\(\{Match Date\}, '([\d-]+)'\)")
+
+def _record_id(prefix, i):
+   return f"rec{prefix}{i:011d}"
+
+def _logo(name):
+   return [{"url": f"https://example.invalid/logos/{name}.png"}]
+
+class FakeTable:
+   def __init__(self, airtable, name):
+      self.airtable = airtable
+      self.name = name
+
+   def get(self, record_id):
+      self.airtable._call(self.name, "get")
+      record = self.airtable.tables[self.name].get(record_id)
+      if record is None:
+         raise KeyError(f"{self.name} has no record {record_id}")
+      return record
+
+   def all(self, view=None, formula=None, sort=None, **kwargs):
+      self.airtable._call(self.name, "all")
+      records = list(self.airtable.tables[self.name].values())
+      if formula:
+         match = _DATE_RANGE.search(formula)
+         if match is None:
+            raise ValueError(f"FakeAirtable cannot evaluate formula {formula!r}")
+         after, before = match.groups()
+         records = [record for record in records if after < record['fields'].get('Match Date', '') < before]
+      for field in reversed(sort or []):
+         records.sort(key=lambda record: record['fields'].get(field, ''))
+      return records
+
+class FakeAirtable:
+   """Local, in-memory stand-in for pyairtable.Api with the same table(base_id, name).get/.all surface.
+
+      Every request sleeps `latency` seconds (plus uniform `jitter`) to model the network round
+      trip, and is counted per (table, method) so benchmarks can report upstream calls.
+   """
+   def __init__(self, num_sports=20, num_teams=400, num_locations=60, num_matches=3000, num_tournaments=200,
+                days_ahead=30, latency=0.0, jitter=0.0, seed=0):
+      self.latency = latency
+      self.jitter = jitter
+      self.calls = {}
+      self.lock = threading.Lock()
+      self._rng = random.Random(seed)
+      self.tables = self._generate(num_sports, num_teams, num_locations, num_matches, num_tournaments, days_ahead)
+
+   def table(self, base_id, name):
+      return FakeTable(self, name)
+
+   def _call(self, table, method):
+      with self.lock:
+         key = f"{table}.{method}"
+         self.calls[key] = self.calls.get(key, 0) + 1
+      delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+      if delay > 0:
+         time.sleep(delay)
+
+   def reset_calls(self):
+      with self.lock:
+         self.calls = {}
+
+   def ids(self, name):
+      return list(self.tables[name].keys())
+
+   def _generate(self, num_sports, num_teams, num_locations, num_matches, num_tournaments, days_ahead):
+      rng = random.Random(0)
+      sports = {
+         _record_id("Sport", i): {"id": _record_id("Sport", i), "fields": {"Sport Name": f"Sport {i}"}}
+         for i in range(num_sports)
+      }
+      sport_ids = list(sports)
+      categories = {
+         _record_id("Kateg", i): {"id": _record_id("Kateg", i), "fields": {"Name": f"Category {i}"}}
+         for i in range(10)
+      }
+      category_ids = list(categories)
+      locations = {
+         _record_id("Lokac", i): {"id": _record_id("Lokac", i), "fields": {"Name": f"Location {i}", "City": "zagreb"}}
+         for i in range(num_locations)
+      }
+      location_ids = list(locations)
+
+      teams = {}
+      for i in range(num_teams):
+         team_id = _record_id("Team", i)
+         teams[team_id] = {"id": team_id, "fields": {
+            "Team Name": f"Team {i}",
+            "Team Logo": _logo(team_id),
+            "Sport": [sport_ids[i % num_sports]],
+            "Category": [rng.choice(category_ids)],
+            "Matches (Home Team)": [],
+            "Matches (Away Team)": []
+         }}
+      teams_by_sport = {}
+      for team_id, team in teams.items():
+         teams_by_sport.setdefault(team["fields"]["Sport"][0], []).append(team_id)
+
+      today = date.today()
+      events = {}
+      for i in range(num_matches):
+         event_id = _record_id("Event", i)
+         sport_id = rng.choice(sport_ids)
+         home, away = rng.sample(teams_by_sport[sport_id], 2) if len(teams_by_sport.get(sport_id, [])) > 1 else (None, None)
+         fields = {
+            # a few past matches so date filters have something to drop
+            "Match Date": (today + timedelta(days=rng.randint(-3, days_ahead))).isoformat(),
+            "Match Time": f"{rng.randint(9, 21):02d}:00",
+            "Sport": [sport_id],
+            "Location": [rng.choice(location_ids)],
+            "Kategorija": [rng.choice(category_ids)]
+         }
+         if home:
+            fields["Home Team"] = [home]
+            fields["Away Team"] = [away]
+            teams[home]["fields"]["Matches (Home Team)"].append(event_id)
+            teams[away]["fields"]["Matches (Away Team)"].append(event_id)
+         events[event_id] = {"id": event_id, "fields": fields}
+
+      event_ids = list(events)
+      tournaments = {}
+      for i in range(num_tournaments):
+         tournament_id = _record_id("Tourn", i)
+         start = today + timedelta(days=rng.randint(0, days_ahead))
+         tournaments[tournament_id] = {"id": tournament_id, "fields": {
+            "Tournament Name": f"Tournament {i}",
+            "Start Date": start.isoformat(),
+            "End Date": (start + timedelta(days=rng.randint(0, 3))).isoformat(),
+            "Sport": [rng.choice(sport_ids)],
+            "Kategorija": [rng.choice(category_ids)],
+            "Location": [rng.choice(location_ids)],
+            "Matches": rng.sample(event_ids, min(4, len(event_ids)))
+         }}
+
+      return {
+         SPORT_TABLE: sports,
+         TEAMS_TABLE: teams,
+         CATEGORY_TABLE: categories,
+         EVENTS_TABLE: events,
+         TOURNAMENTS_TABLE: tournaments,
+         LOCATIONS_TABLE: locations,
+         OFFICIALS_TABLE: {}
+      }
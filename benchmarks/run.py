@@ -0,0 +1,200 @@
+"""Benchmarks for the recommender and click-tracking hot paths against a fake, latency-injecting Airtable.
+
+   python -m benchmarks.run --sizes 100,1000,10000 --latency 0.02 --out before.json
+   python -m benchmarks.run --sizes 100,1000,10000 --latency 0.02 --out after.json --compare before.json
+
+Every size gets a fresh synthetic profile database written to a temporary directory.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from benchmarks.fake_airtable import FakeAirtable, EVENTS_TABLE, TEAMS_TABLE, TOURNAMENTS_TABLE
+from benchmarks.synthetic import generate_users, write_database
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+
+def install_fake_airtable(airtable):
+   """Point every module-level `api` at the fake and drop anything cached from a previous run"""
+   import API
+   import airtable_cache
+   import click_tracker
+   import recommender
+   API.api = airtable
+   recommender.api = airtable
+   click_tracker.api = airtable
+   airtable_cache.clear_caches()
+
+def _summary(samples, errors, calls):
+   samples_ms = sorted(sample * 1000 for sample in samples)
+   result = {"calls": len(samples_ms), "errors": errors, "upstream_calls": calls}
+   if samples_ms:
+      result.update({
+         "mean_ms": statistics.fmean(samples_ms),
+         "p50_ms": samples_ms[len(samples_ms) // 2],
+         "p95_ms": samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))],
+         "min_ms": samples_ms[0],
+         "max_ms": samples_ms[-1]
+      })
+   return result
+
+def time_calls(airtable, fn, args_list, setup=None):
+   """Call fn(*args) for every args tuple, timing each call; setup() runs untimed before each call"""
+   samples, errors = [], 0
+   airtable.reset_calls()
+   for args in args_list:
+      if setup is not None:
+         setup()
+      start = time.perf_counter()
+      try:
+         fn(*args)
+      except Exception:
+         errors += 1
+      samples.append(time.perf_counter() - start)
+   return _summary(samples, errors, dict(airtable.calls))
+
+def run_size(n, args, airtable):
+   from API import base_id
+   from catalog import Catalog
+   from click_tracker import ClickTracker
+   from match_store import UpcomingMatchesStore
+   from profiles import ProfileRepository
+   from recommender import Recommender
+   from storage import open_store
+
+   install_fake_airtable(airtable)
+   rng = random.Random(args.seed)
+   results = {}
+   with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, f"users.{args.store}")
+      start = time.perf_counter()
+      write_database(path, generate_users(n, airtable, seed=args.seed))
+      results["generate_database"] = _summary([time.perf_counter() - start], 0, {})
+
+      start = time.perf_counter()
+      store = open_store(path)
+      profiles = ProfileRepository(store)
+      results["load_profiles"] = _summary([time.perf_counter() - start], 0, {})
+
+      catalog = Catalog(airtable, base_id)
+      catalog.load()
+      match_store = UpcomingMatchesStore(airtable, base_id)
+      match_store.sync()
+
+      airtable.reset_calls()
+      start = time.perf_counter()
+      recommender = Recommender(path, catalog.sport_ids(), catalog.location_ids(), catalog=catalog,
+                                match_store=match_store, profiles=profiles, workers=args.workers)
+      results["recommender_init"] = _summary([time.perf_counter() - start], 0, dict(airtable.calls))
+
+      # load_profiles + recommender_init again, with profiles encoded while the snapshot is read
+      start = time.perf_counter()
+      Recommender(path, catalog.sport_ids(), catalog.location_ids(), catalog=catalog, match_store=match_store,
+                  profiles=ProfileRepository(open_store(path), load=False), workers=args.workers).close()
+      results["streaming_init"] = _summary([time.perf_counter() - start], 0, {})
+
+      results["_build_user_similarity_matrix"] = time_calls(
+         airtable, recommender._build_user_similarity_matrix, [()] * args.repeat)
+
+      user_ids = list(profiles.users.keys())
+      sample = [(user_id,) for user_id in rng.sample(user_ids, min(args.sample, len(user_ids)))]
+      clear = recommender.recommendation_cache.clear
+      sport_names = [record['fields'].get('Sport Name', '') for record in catalog.records('sports')]
+
+      results["_get_similar_users"] = time_calls(airtable, recommender._get_similar_users, sample)
+      results["get_homepage_recommendations"] = time_calls(airtable, recommender.get_homepage_recommendations, sample, clear)
+      results["get_sport_recommendations"] = time_calls(
+         airtable, recommender.get_sport_recommendations, [(user_id, rng.choice(sport_names)) for user_id, in sample], clear)
+      results["get_event_recommendations"] = time_calls(airtable, recommender.get_event_recommendations, sample, clear)
+      results["get_tournament_recommendations"] = time_calls(airtable, recommender.get_tournament_recommendations, sample, clear)
+      results["get_real_time_match_recommendations"] = time_calls(
+         airtable, recommender.get_real_time_match_recommendations, sample, clear)
+
+      tracker = ClickTracker(path, recommender=recommender, catalog=catalog, profiles=profiles)
+      event_ids = airtable.ids(EVENTS_TABLE)
+      team_ids = airtable.ids(TEAMS_TABLE)
+      tournament_ids = airtable.ids(TOURNAMENTS_TABLE)
+      sport_ids = catalog.sport_ids()
+      results["track_event_click"] = time_calls(
+         airtable, tracker.track_event_click, [(user_id, rng.choice(event_ids)) for user_id, in sample])
+      results["track_team_click"] = time_calls(
+         airtable, tracker.track_team_click, [(user_id, rng.choice(team_ids)) for user_id, in sample])
+      results["track_sport_click"] = time_calls(
+         airtable, tracker.track_sport_click, [(user_id, rng.choice(sport_ids)) for user_id, in sample])
+      results["track_tournament_click"] = time_calls(
+         airtable, tracker.track_tournament_click, [(user_id, rng.choice(tournament_ids)) for user_id, in sample])
+      # the next similar-users lookup pays for re-encoding the users the clicks above touched
+      results["_get_similar_users_after_clicks"] = time_calls(airtable, recommender._get_similar_users, sample[:1])
+
+      recommender.close()
+      profiles.compact()
+      store.close()
+   return results
+
+def _git_revision():
+   try:
+      return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+def compare(old, new):
+   """Print mean-time ratios new/old for every benchmark present in both result files"""
+   old_runs = {run["users"]: run["benchmarks"] for run in old["runs"]}
+   print(f"{'users':>8}  {'benchmark':<40} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+   for run in new["runs"]:
+      before = old_runs.get(run["users"], {})
+      for name, result in run["benchmarks"].items():
+         if name in before and "mean_ms" in result and before[name].get("mean_ms"):
+            old_ms, new_ms = before[name]["mean_ms"], result["mean_ms"]
+            print(f"{run['users']:>8}  {name:<40} {old_ms:>10.3f} {new_ms:>10.3f} {new_ms / old_ms:>7.2f}")
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Benchmark recommender and click-tracking hot paths")
+   parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated user counts")
+   parser.add_argument("--sample", type=int, default=50, help="users timed per per-user benchmark")
+   parser.add_argument("--repeat", type=int, default=3, help="repetitions of the similarity build")
+   parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake Airtable request")
+   parser.add_argument("--jitter", type=float, default=0.0, help="uniform extra latency in seconds")
+   parser.add_argument("--store", choices=["json", "msgpack", "db"], default="json", help="profile store backend")
+   parser.add_argument("--workers", type=int, default=1, help="Recommender worker processes")
+   parser.add_argument("--seed", type=int, default=0)
+   parser.add_argument("--out", help="write JSON results here (default: stdout)")
+   parser.add_argument("--compare", help="earlier results file to compare against")
+   args = parser.parse_args(argv)
+
+   airtable = FakeAirtable(latency=args.latency, jitter=args.jitter, seed=args.seed)
+   report = {
+      "meta": {
+         "revision": _git_revision(),
+         "created_at": datetime.now().isoformat(),
+         "python": platform.python_version(),
+         "numpy": np.__version__,
+         "platform": platform.platform(),
+         "args": vars(args)
+      },
+      "runs": []
+   }
+   for n in (int(size) for size in args.sizes.split(",")):
+      print(f"Benchmarking {n} users...", file=sys.stderr)
+      report["runs"].append({"users": n, "benchmarks": run_size(n, args, airtable)})
+
+   if args.out:
+      with open(args.out, 'w', encoding='utf-8') as f:
+         json.dump(report, f, indent=4)
+   else:
+      print(json.dumps(report, indent=4))
+
+   if args.compare:
+      with open(args.compare, 'r', encoding='utf-8') as f:
+         compare(json.load(f), report)
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,145 @@
+import json
+import random
+from datetime import datetime, timedelta
+from benchmarks.fake_airtable import EVENTS_TABLE, LOCATIONS_TABLE, SPORT_TABLE, TEAMS_TABLE, TOURNAMENTS_TABLE
+from snapshot import snapshot_format, write_msgpack_users
+
+AGES = ['PRESCHOOL', 'PRIMARY_SCHOOL', 'JUNIORS', 'ADULTS', 'VETERANS']
+DISTRICTS = ['centar', 'trešnjevka', 'maksimir', 'dubrava', 'knežija', 'novi zagreb', 'sesvete', 'črnomerec']
+
+def _count(counts, key, amount=1):
+   counts[key] = counts.get(key, 0) + amount
+
+def _liked_match(event, sport_names, team_names, rng):
+   fields = event['fields']
+   sport_id = fields['Sport'][0]
+   home = fields.get('Home Team', [None])[0]
+   away = fields.get('Away Team', [None])[0]
+   return {
+      "event_id": event['id'],
+      "event_type": "MATCH",
+      "event_time": fields.get('Match Time'),
+      "event_date": fields['Match Date'],
+      "sport_id": sport_id,
+      "sport_name": sport_names.get(sport_id, ""),
+      "home_team_id": home,
+      "away_team_id": away,
+      "home_team": team_names.get(home, ""),
+      "away_team": team_names.get(away, ""),
+      "category_id": fields.get('Kategorija', [None])[0],
+      "location_id": fields.get('Location', [None])[0],
+      "timestamp": (datetime.now() - timedelta(days=rng.randint(0, 90))).isoformat()
+   }
+
+def _liked_tournament(tournament, sport_names, rng):
+   fields = tournament['fields']
+   sport_id = fields['Sport'][0]
+   return {
+      "event_id": tournament['id'],
+      "event_type": "TOURNAMENT",
+      "start_date": fields.get('Start Date'),
+      "end_date": fields.get('End Date'),
+      "sport_id": sport_id,
+      "sport_name": sport_names.get(sport_id, ""),
+      "tournament_name": fields.get('Tournament Name', ""),
+      "category_id": fields.get('Kategorija', [None])[0],
+      "location_id": fields.get('Location', [None])[0],
+      "match_ids": fields.get('Matches', []),
+      "timestamp": (datetime.now() - timedelta(days=rng.randint(0, 90))).isoformat()
+   }
+
+def generate_users(n, airtable, seed=0, max_events=8, prefix="bench_user"):
+   """Yield (user_id, profile) pairs in the ClickTracker.initialize_user schema, with click history.
+
+      Profiles look like the output of initialize_user followed by a few random track_*_click calls
+      against the records of `airtable` (a FakeAirtable).
+   """
+   rng = random.Random(seed)
+   tables = airtable.tables
+   sport_ids = list(tables[SPORT_TABLE])
+   team_ids = list(tables[TEAMS_TABLE])
+   event_ids = list(tables[EVENTS_TABLE])
+   tournament_ids = list(tables[TOURNAMENTS_TABLE])
+   sport_names = {sport_id: record['fields']['Sport Name'] for sport_id, record in tables[SPORT_TABLE].items()}
+   team_names = {team_id: record['fields']['Team Name'] for team_id, record in tables[TEAMS_TABLE].items()}
+
+   for i in range(n):
+      user_id = f"{prefix}_{i}"
+      interests = rng.sample(sport_ids, rng.randint(1, min(3, len(sport_ids))))
+      user = {
+         "user_id": user_id,
+         "age": rng.choice(AGES),
+         "city": "zagreb",
+         "district": rng.choice(DISTRICTS),
+         "user_name": f"User {i}",
+         "sport_interests": interests,
+         "sports_liked_count": {sport_id: 1 for sport_id in interests},
+         "teams_liked": [],
+         "team_liked_sport": {},
+         "team_liked_location": {},
+         "player_liked_sports_count": {},
+         "events_liked": [],
+         "training_liked_teams": [],
+         "training_sports_liked": {},
+         "training_location": [],
+         "event_type_priority": ["match", "tournament"],
+         "events_clicked": {},
+         "sports_clicked": {},
+         "teams_clicked": {}
+      }
+
+      for _ in range(rng.randint(0, max_events)):
+         if tournament_ids and rng.random() < 0.2:
+            event = _liked_tournament(tables[TOURNAMENTS_TABLE][rng.choice(tournament_ids)], sport_names, rng)
+            user["events_liked"].append(event)
+            _count(user["sports_liked_count"], event["sport_id"])
+            continue
+         event = _liked_match(tables[EVENTS_TABLE][rng.choice(event_ids)], sport_names, team_names, rng)
+         user["events_liked"].append(event)
+         _count(user["events_clicked"], event["event_id"])
+         _count(user["sports_clicked"], event["sport_id"])
+         _count(user["sports_liked_count"], event["sport_id"])
+         if event["sport_id"] not in user["sport_interests"]:
+            user["sport_interests"].append(event["sport_id"])
+         for team_id in (event["home_team_id"], event["away_team_id"]):
+            if team_id:
+               if team_id not in user["teams_liked"]:
+                  user["teams_liked"].append(team_id)
+               _count(user["teams_clicked"], team_id)
+               _count(user["team_liked_sport"], event["sport_id"])
+
+      for team_id in rng.sample(team_ids, rng.randint(0, 2)):
+         if team_id not in user["teams_liked"]:
+            user["teams_liked"].append(team_id)
+         _count(user["teams_clicked"], team_id)
+
+      yield user_id, user
+
+def write_database(path, users, batch_size=5000):
+   """Write (user_id, profile) pairs to `path` in the format open_store() expects for its extension"""
+   if snapshot_format(path) == "msgpack":
+      write_msgpack_users(path, users)
+      return
+   if str(path).endswith(('.db', '.sqlite', '.sqlite3')):
+      from storage import SQLiteProfileStore
+      store = SQLiteProfileStore(path)
+      batch = {}
+      for user_id, profile in users:
+         batch[user_id] = profile
+         if len(batch) >= batch_size:
+            store.put_many(batch)
+            batch = {}
+      if batch:
+         store.put_many(batch)
+      store.close()
+      return
+
+   with open(path, 'w', encoding='utf-8') as f:
+      f.write('{"users": {')
+      for i, (user_id, profile) in enumerate(users):
+         if i:
+            f.write(',')
+         f.write(json.dumps(user_id, ensure_ascii=False))
+         f.write(':')
+         f.write(json.dumps(profile, ensure_ascii=False))
+      f.write('}}')
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import API
+import airtable_cache
+from log import get_logger
+from request_context import mark_incomplete
+
+log = get_logger("catalog")
+
+class Catalog:
+   """In-memory copy of the small, slowly changing Airtable tables, indexed by record ID.
+
+      Each table is fetched once with `.all()` and refreshed in a background thread. IDs that are
+      not in the snapshot (created after the last refresh) fall back to the cached per-ID lookup.
+      With a `cache_path` every successful load is also saved locally, so a restart can begin
+      from load_cached() and leave the Airtable fetch to the refresh thread.
+   """
+   TABLES = {
+      'sports': (API.list_sport_records, airtable_cache.list_sport_records),
+      'teams': (API.list_teams_records, airtable_cache.list_teams_records),
+      'locations': (API.list_locations_records, airtable_cache.list_locations_records),
+   }
+
+   def __init__(self, api, base_id, refresh_interval=600, cache_path=None):
+      self.api = api
+      self.base_id = base_id
+      self.refresh_interval = refresh_interval
+      self.cache_path = cache_path
+      self.source = None
+      self.tables = {}
+      self.lock = threading.Lock()
+      self._stop = threading.Event()
+      self._thread = None
+
+   def load(self):
+      """Fetch every table in full and swap in the new indexes"""
+      tables = {}
+      for name, (list_all, _) in self.TABLES.items():
+         records = list_all(self.api, self.base_id)
+         tables[name] = {record['id']: record for record in records}
+      with self.lock:
+         self.tables = tables
+         self.source = "airtable"
+      if self.cache_path:
+         self._write_cache(tables)
+
+   def load_cached(self):
+      """Swap in the tables saved by the last successful load(); False if there is no usable cache"""
+      if not self.cache_path or not os.path.exists(self.cache_path):
+         return False
+      try:
+         with open(self.cache_path, 'r', encoding='utf-8') as f:
+            tables = json.load(f)
+      except (OSError, ValueError) as e:
+         log.warning("catalog_cache_unreadable", path=self.cache_path, error=str(e))
+         return False
+      if not all(name in tables for name in self.TABLES):
+         return False
+      with self.lock:
+         self.tables = tables
+         self.source = "cache"
+      return True
+
+   def _write_cache(self, tables):
+      tmp_path = f"{self.cache_path}.tmp"
+      try:
+         with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tables, f, ensure_ascii=False)
+         os.replace(tmp_path, self.cache_path)
+      except OSError as e:
+         log.warning("catalog_cache_write_failed", path=self.cache_path, error=str(e))
+
+   def _ensure_loaded(self):
+      if not self.tables:
+         self.load()
+
+   def start_refresh(self, immediate=False):
+      """Reload every `refresh_interval` seconds in a daemon thread; `immediate` also reloads right away"""
+      if self._thread is not None:
+         return
+      self._stop.clear()
+      self._thread = threading.Thread(target=self._refresh_loop, args=(immediate,), name="catalog-refresh", daemon=True)
+      self._thread.start()
+
+   def stop_refresh(self):
+      self._stop.set()
+      self._thread = None
+
+   def _refresh_loop(self, immediate):
+      if immediate:
+         self._refresh()
+      while not self._stop.wait(self.refresh_interval):
+         self._refresh()
+
+   def _refresh(self):
+      try:
+         self.load()
+      except Exception as e:
+         log.warning("catalog_refresh_failed", error=str(e))
+
+   def _get(self, name, record_id, fetch=True):
+      if not record_id:
+         return None
+      self._ensure_loaded()
+      record = self.tables[name].get(record_id)
+      if record is not None or not fetch:
+         return record
+
+      _, lookup = self.TABLES[name]
+      try:
+         record = lookup(self.api, self.base_id, record_id)
+      except Exception:
+         mark_incomplete()
+         return None
+      if record:
+         with self.lock:
+            self.tables[name][record_id] = record
+      return record
+
+   def has(self, name, record_id):
+      self._ensure_loaded()
+      return record_id in self.tables[name]
+
+   def add(self, name, records):
+      """Insert records fetched elsewhere (e.g. by the async client) into a table's index"""
+      self._ensure_loaded()
+      with self.lock:
+         for record in records:
+            self.tables[name][record['id']] = record
+
+   # fetch=False only reads the in-memory snapshot, for callers on the event loop
+   def get_sport(self, sport_id, fetch=True):
+      return self._get('sports', sport_id, fetch)
+
+   def get_team(self, team_id, fetch=True):
+      return self._get('teams', team_id, fetch)
+
+   def get_location(self, location_id):
+      return self._get('locations', location_id)
+
+   def records(self, name):
+      self._ensure_loaded()
+      return list(self.tables[name].values())
+
+   def sport_ids(self):
+      self._ensure_loaded()
+      return list(self.tables['sports'].keys())
+
+   def location_ids(self):
+      self._ensure_loaded()
+      return list(self.tables['locations'].keys())
+
+   def stats(self):
+      stats = {name: len(records) for name, records in self.tables.items()}
+      stats["source"] = self.source
+      return stats
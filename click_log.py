@@ -0,0 +1,96 @@
+import json
+import os
+from event_catalog import to_json
+from snapshot import iter_snapshot, snapshot_format, write_snapshot
+
+def _log_path(snapshot_path):
+   return f"{snapshot_path}.log"
+
+def _replay(log_path):
+   """Yield (user_id, profile) for every complete entry of the log"""
+   if not os.path.exists(log_path):
+      return
+   with open(log_path, 'r', encoding='utf-8') as f:
+      for line in f:
+         try:
+            entry = json.loads(line)
+         except json.JSONDecodeError:
+            # torn write at the tail of the log
+            break
+         yield entry["user_id"], entry["profile"]
+
+def iter_database(snapshot_path):
+   """Yield (user_id, profile) from the latest snapshot, then the click log updates written after it.
+
+      A user updated in the log is yielded again; the later profile wins.
+   """
+   yield from iter_snapshot(snapshot_path)
+   yield from _replay(_log_path(snapshot_path))
+
+def load_database(snapshot_path):
+   """Read the latest snapshot and replay the click log written after it"""
+   return {"users": dict(iter_database(snapshot_path))}
+
+class ClickLog:
+   """Append-only log of user profile updates on top of a periodically compacted snapshot.
+
+      Each mutation appends one JSON line with the user's full profile, so the cost of a click
+      depends on the size of that profile rather than the whole database. Every `compact_every`
+      entries the in-memory database is written to the snapshot and the log is truncated.
+      The snapshot is JSON, or msgpack when its path ends in .msgpack (see snapshot.py).
+   """
+   def __init__(self, snapshot_path, compact_every=500, fsync=False):
+      self.snapshot_path = snapshot_path
+      self.log_path = _log_path(snapshot_path)
+      self.compact_every = compact_every
+      self.fsync = fsync
+      self.db = None
+      self.pending = 0
+      self._log = None
+
+   def load(self):
+      """Load snapshot + log; if the log had entries they are folded into a new snapshot"""
+      for _ in self.iter_load():
+         pass
+      return self.db
+
+   def iter_load(self, users=None):
+      """load() one profile at a time: yield each (user_id, profile) as it is stored into `users` (the db's users)"""
+      users = {} if users is None else users
+      self.db = {"users": users}
+      for user_id, profile in iter_database(self.snapshot_path):
+         users[user_id] = profile
+         yield user_id, profile
+      if not os.path.exists(self.snapshot_path) or (os.path.exists(self.log_path) and os.path.getsize(self.log_path)):
+         self.compact()
+
+   def _handle(self):
+      if self._log is None:
+         self._log = open(self.log_path, 'a', encoding='utf-8')
+      return self._log
+
+   def append(self, user_id, profile):
+      log = self._handle()
+      log.write(json.dumps({"user_id": user_id, "profile": profile}, ensure_ascii=False, separators=(',', ':'), default=to_json))
+      log.write("\n")
+      log.flush()
+      if self.fsync:
+         os.fsync(log.fileno())
+      self.pending += 1
+      if self.pending >= self.compact_every:
+         self.compact()
+
+   def compact(self):
+      """Write the in-memory database as the new snapshot and start an empty log"""
+      tmp_path = f"{self.snapshot_path}.tmp"
+      write_snapshot(tmp_path, self.db, snapshot_format(self.snapshot_path))
+      os.replace(tmp_path, self.snapshot_path)
+      if self._log is not None:
+         self._log.close()
+      self._log = open(self.log_path, 'w', encoding='utf-8')
+      self.pending = 0
+
+   def close(self):
+      if self._log is not None:
+         self._log.close()
+         self._log = None
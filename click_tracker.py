@@ -1,35 +1,65 @@
 import json
 import os
 from datetime import datetime
-from API import api, base_id, list_sport_records, list_teams_records, list_events_records, list_tournaments_records, list_category_records, list_locations_records
+from API import api, base_id
+from airtable_cache import list_events_records, list_tournaments_records
+from catalog import Catalog
+from storage import open_store
+from profiles import ProfileRepository
+from metrics import timed
+from log import get_logger
+from request_context import memoized, remember
+from event_history import record_event
 from recommender import Recommender
 
+log = get_logger("click_tracker")
+
+def _first(value):
+   """Date and time fields come back as plain strings or, for lookup fields, as one-element lists"""
+   if isinstance(value, list):
+      return value[0] if value else None
+   return value
+
 class ClickTracker:
-   def __init__(self, database_path='user_clicks.json', recommender=None):
+   def __init__(self, database_path='user_clicks.json', recommender=None, catalog=None, store=None, profiles=None):
       self.user_db_path = database_path
-      self._load_or_create_db()
       self.recommender = recommender
+      if profiles is None:
+         if recommender is not None:
+            profiles = recommender.profiles
+         else:
+            profiles = ProfileRepository(store if store is not None else open_store(database_path))
+      self.profiles = profiles
+      if catalog is None:
+         catalog = recommender.catalog if recommender is not None else Catalog(api, base_id)
+      self.catalog = catalog
+      self._load_or_create_db()
       
    def _load_or_create_db(self):
-      """Load existing click database or create new one if it doesn't exist"""
-      if os.path.exists(self.user_db_path):
-         with open(self.user_db_path, 'r', encoding='utf-8') as f:
-               self.user_db = json.load(f)
+      """Share the live profile dict of the profile repository"""
+      self.user_db = {"users": self.profiles.users}
+   
+   @timed("profile_save")
+   def _save_db(self, user_id=None):
+      """Persist the user's updated profile (notifying the recommender), or compact the whole store"""
+      if user_id is not None:
+         self.profiles.save(user_id)
       else:
-         self.user_db = {"users": {}}
-         self._save_db()
+         self.profiles.compact()
    
-   def _save_db(self):
-      with open(self.user_db_path, 'w', encoding='utf-8') as f:
-         json.dump(self.user_db, f, indent=4, ensure_ascii=False)
-      if self.recommender:
-         self.recommender._load_database()
+   @timed("profile_save")
+   def _update(self, user_id, apply):
+      """Apply apply(profile) -> profile to the user's latest stored profile and persist it in one step"""
+      user = self.profiles.update(user_id, apply)
+      remember("profile", user_id, user)
+      return user
    
    def initialize_user(self, user_id, user_data =  None):
       """Initialize a new user with profile data"""
-      users = self.user_db["users"]
-      if user_id not in users:
-         users[user_id] = {
+      def apply(user):
+         if user is not None:
+            return user
+         user = {
                "user_id": user_id,
                "age": "DEFAULT", 
                "city": None,
@@ -52,67 +82,74 @@ class ClickTracker:
          }
          
          if user_data is not None:
-            users[user_id]["user_name"] = user_data.get("user_name")
-            users[user_id]["age"] = user_data.get("age", 25)
-            users[user_id]["city"] = user_data.get("city", "").lower() if user_data.get("city") else None
-            users[user_id]["district"] = user_data.get("district", "").lower() if user_data.get("district") else None
-            users[user_id]["sport_interests"] = user_data.get("sport_interests", [])
-            users[user_id]["event_type_priority"] = user_data.get("event_type_priority", ["match", "tournament"])
+            user["user_name"] = user_data.get("user_name")
+            user["age"] = user_data.get("age", 25)
+            user["city"] = user_data.get("city", "").lower() if user_data.get("city") else None
+            user["district"] = user_data.get("district", "").lower() if user_data.get("district") else None
+            user["sport_interests"] = user_data.get("sport_interests", [])
+            user["event_type_priority"] = user_data.get("event_type_priority", ["match", "tournament"])
             
-            for sport_id in users[user_id]["sport_interests"]:
-               users[user_id]["sports_liked_count"][sport_id] = 1
+            for sport_id in user["sport_interests"]:
+               user["sports_liked_count"][sport_id] = 1
+         return user
                
-      self._save_db()
-      if self.recommender:
-         self.recommender._load_database()
-      return users[user_id]
+      return self._update(user_id, apply)
    
    def update_user(self, user_id, user_data):
       """Update user profile data"""
-      users = self.user_db["users"]
-      if user_id in users:
+      def apply(user):
          if "user_name" in user_data:
-            users[user_id]["user_name"] = user_data["user_name"]
+            user["user_name"] = user_data["user_name"]
          if "age" in user_data:
-            users[user_id]["age"] = user_data["age"]
+            user["age"] = user_data["age"]
          if "city" in user_data:
-            users[user_id]["city"] = user_data["city"].lower()
+            user["city"] = user_data["city"].lower()
          if "district" in user_data:
-            users[user_id]["district"] = user_data["district"].lower()
+            user["district"] = user_data["district"].lower()
          if "sport_interests" in user_data:
-            users[user_id]["sport_interests"] = user_data["sport_interests"]
+            user["sport_interests"] = user_data["sport_interests"]
          if "event_type_priority" in user_data:
-            users[user_id]["event_type_priority"] = user_data["event_type_priority"]
+            user["event_type_priority"] = user_data["event_type_priority"]
          if 'sport_type_preference' in user_data:
-            users[user_id]["sport_type_preference"] = user_data["sport_type_preference"]
-         self._save_db()
-         return users[user_id]
+            user["sport_type_preference"] = user_data["sport_type_preference"]
+         return user
+
+      if user_id in self.profiles:
+         return self._update(user_id, apply)
    
+   @timed("profile_load")
    def get_user(self, user_id):
-      users = self.user_db["users"]
-      if user_id not in users:
-         return self.initialize_user(user_id, None)
-      return users[user_id]
+      user = memoized("profile", user_id, self.profiles.get)
+      if user is None:
+         user = self.initialize_user(user_id, None)
+         remember("profile", user_id, user)
+      return user
+   
+   def _get_team(self, team_id):
+      return memoized("team", team_id, self.catalog.get_team)
+   
+   def _get_sport(self, sport_id):
+      return memoized("sport", sport_id, self.catalog.get_sport)
 
    def track_event_click(self, user_id, event_id):
       user = self.get_user(user_id)
       
       try:
-         event_data = list_events_records(api, base_id, event_id)
+         event_data = memoized("event", event_id, lambda record_id: list_events_records(api, base_id, record_id))
          
          event_fields = event_data.get("fields", {})
          
-         event_time = event_fields.get("Match Time", [None])[0] if "Match Time" in event_fields else None
-         event_date = event_fields.get("Match Date", [None])[0] if "Match Date" in event_fields else None
+         event_time = _first(event_fields.get("Match Time"))
+         event_date = _first(event_fields.get("Match Date"))
          location_id = event_fields.get("Location", [None])[0] if "Location" in event_fields else None
          home_team_id = event_fields.get("Home Team", [None])[0] if "Home Team" in event_fields else None
          away_team_id = event_fields.get("Away Team", [None])[0] if "Away Team" in event_fields else None
          sport_id = event_fields.get("Sport", [None])[0] if "Sport" in event_fields else None
          category_id = event_fields.get("Kategorija", [None])[0] if "Kategorija" in event_fields else None
 
-         sport_info = list_sport_records(api, base_id, sport_id) if sport_id else {}
-         home_team_info = list_teams_records(api, base_id, home_team_id) if home_team_id else {}
-         away_team_info = list_teams_records(api, base_id, away_team_id) if away_team_id else {}
+         sport_info = self._get_sport(sport_id) or {}
+         home_team_info = self._get_team(home_team_id) or {}
+         away_team_info = self._get_team(away_team_id) or {}
          
          sport_name = sport_info.get("fields", {}).get("Sport Name", "") if sport_info else ""
          
@@ -132,51 +169,56 @@ class ClickTracker:
                "timestamp": datetime.now().isoformat()
          }
          
-         if event_id not in user["events_clicked"]:
-               user["events_clicked"][event_id] = 0
-         user["events_clicked"][event_id] += 1
+         def apply(user):
+            if event_id not in user["events_clicked"]:
+                  user["events_clicked"][event_id] = 0
+            user["events_clicked"][event_id] += 1
          
-         user["events_liked"].append(event_metadata)
+            record_event(user, event_metadata)
          
-         if sport_id:
-               if sport_id not in user["sports_clicked"]:
-                  user["sports_clicked"][sport_id] = 0
-               user["sports_clicked"][sport_id] += 1
+            if sport_id:
+                  if sport_id not in user["sports_clicked"]:
+                     user["sports_clicked"][sport_id] = 0
+                  user["sports_clicked"][sport_id] += 1
                
-               if sport_id not in user["sports_liked_count"]:
-                  user["sports_liked_count"][sport_id] = 0
-               user["sports_liked_count"][sport_id] += 1
+                  if sport_id not in user["sports_liked_count"]:
+                     user["sports_liked_count"][sport_id] = 0
+                  user["sports_liked_count"][sport_id] += 1
                
-               if sport_id not in user["sport_interests"]:
-                  user["sport_interests"].append(sport_id)
+                  if sport_id not in user["sport_interests"]:
+                     user["sport_interests"].append(sport_id)
          
-         for team_id in [home_team_id, away_team_id]:
-               if team_id:
-                  if team_id not in user["teams_liked"]:
-                     user["teams_liked"].append(team_id)
+            for team_id in [home_team_id, away_team_id]:
+                  if team_id:
+                     if team_id not in user["teams_liked"]:
+                        user["teams_liked"].append(team_id)
                   
-                  if team_id not in user["teams_clicked"]:
-                     user["teams_clicked"][team_id] = 0
-                  user["teams_clicked"][team_id] += 1
+                     if team_id not in user["teams_clicked"]:
+                        user["teams_clicked"][team_id] = 0
+                     user["teams_clicked"][team_id] += 1
                   
-                  if sport_id:
-                     if sport_id not in user["team_liked_sport"]:
-                        user["team_liked_sport"][sport_id] = 0
-                     user["team_liked_sport"][sport_id] += 1
+                     if sport_id:
+                        if sport_id not in user["team_liked_sport"]:
+                           user["team_liked_sport"][sport_id] = 0
+                        user["team_liked_sport"][sport_id] += 1
          
-         self._save_db()
+            return user
+
+         self._update(user_id, apply)
                   
          return event_metadata
          
       except Exception as e:
-         print(f"Error tracking event click: {e}")
+         log.warning("track_event_click_failed", user_id=user_id, event_id=event_id, error=str(e))
          return None
 
    def track_team_click(self, user_id, team_id):
       user = self.get_user(user_id)
       
       try:
-         team_data = list_teams_records(api, base_id, team_id)
+         team_data = self._get_team(team_id)
+         if team_data is None:
+            return None
          
          team_fields = team_data.get("fields", {})
          team_name = team_fields.get("Team Name", "")
@@ -186,37 +228,44 @@ class ClickTracker:
          sport_ids = team_fields.get("Sport", []) if isinstance(team_fields.get("Sport"), list) else [team_fields.get("Sport")]
          team_category_id = team_fields.get("Category", [None])[0] if "Category" in team_fields else None
 
-         if team_id not in user["teams_clicked"]:
-               user["teams_clicked"][team_id] = 0
-         user["teams_clicked"][team_id] += 1
-         
-         if team_id not in user["teams_liked"]:
-               user["teams_liked"].append(team_id)
-         
+         # look the sports up before the update, so no upstream call runs inside its transaction
          sport_names = []  
+         liked_sport_ids = []
          for sport_id in sport_ids:
                if sport_id:
                   try:
-                     sport_info = list_sport_records(api, base_id, sport_id)
+                     sport_info = self._get_sport(sport_id)
                      if sport_info and "fields" in sport_info:
                            sport_name = sport_info["fields"].get("Sport Name", "")
                            if sport_name:
                               sport_names.append(sport_name)  
-                              
-                           if sport_id not in user["team_liked_sport"]:
-                              user["team_liked_sport"][sport_id] = 0
-                           user["team_liked_sport"][sport_id] += 1
-                           
-                           if sport_id not in user["sports_liked_count"]:
-                              user["sports_liked_count"][sport_id] = 0
-                           user["sports_liked_count"][sport_id] += 1
-                           
-                           if sport_id not in user["sport_interests"]:
-                              user["sport_interests"].append(sport_id)
+                           liked_sport_ids.append(sport_id)
                   except Exception as e:
-                     print(f"Error processing sport {sport_id} for team {team_id}: {e}")
+                     log.warning("track_team_sport_failed", user_id=user_id, team_id=team_id, sport_id=sport_id, error=str(e))
+
+         def apply(user):
+            if team_id not in user["teams_clicked"]:
+                  user["teams_clicked"][team_id] = 0
+            user["teams_clicked"][team_id] += 1
+         
+            if team_id not in user["teams_liked"]:
+                  user["teams_liked"].append(team_id)
+         
+            for sport_id in liked_sport_ids:
+                  if sport_id not in user["team_liked_sport"]:
+                     user["team_liked_sport"][sport_id] = 0
+                  user["team_liked_sport"][sport_id] += 1
+               
+                  if sport_id not in user["sports_liked_count"]:
+                     user["sports_liked_count"][sport_id] = 0
+                  user["sports_liked_count"][sport_id] += 1
+               
+                  if sport_id not in user["sport_interests"]:
+                     user["sport_interests"].append(sport_id)
          
-         self._save_db()
+            return user
+
+         self._update(user_id, apply)
                         
          return {
                "team_id": team_id,
@@ -229,26 +278,28 @@ class ClickTracker:
          }
          
       except Exception as e:
-         print(f"Error tracking team click: {e}")
+         log.warning("track_team_click_failed", user_id=user_id, team_id=team_id, error=str(e))
          return None
 
    def track_sport_click(self, user_id, sport_id):
       user = self.get_user(user_id)
       try:
-         if sport_id:
-            print(f"Sport ID: {sport_id}")
-            if sport_id not in user["sports_clicked"]:
-               user["sports_clicked"][sport_id] = 0
-            user["sports_clicked"][sport_id] += 1
+         def apply(user):
+            if sport_id:
+               if sport_id not in user["sports_clicked"]:
+                  user["sports_clicked"][sport_id] = 0
+               user["sports_clicked"][sport_id] += 1
             
-            if sport_id not in user["sports_liked_count"]:
-               user["sports_liked_count"][sport_id] = 0
-            user["sports_liked_count"][sport_id] += 1
+               if sport_id not in user["sports_liked_count"]:
+                  user["sports_liked_count"][sport_id] = 0
+               user["sports_liked_count"][sport_id] += 1
             
-            if sport_id not in user["sport_interests"]:
-               user["sport_interests"].append(sport_id)
-         print(f"User {user_id} clicked on sport {sport_id}.")       
-         self._save_db()
+               if sport_id not in user["sport_interests"]:
+                  user["sport_interests"].append(sport_id)
+            log.debug("sport_click", user_id=user_id, sport_id=sport_id)
+            return user
+
+         self._update(user_id, apply)
                      
          return {
                "sport_id": sport_id,
@@ -256,18 +307,19 @@ class ClickTracker:
          }
          
       except Exception as e:
-         print(f"Error tracking sport click: {e}")
+         log.warning("track_sport_click_failed", user_id=user_id, sport_id=sport_id, error=str(e))
          return None
    
    def track_tournament_click(self, user_id, tournament_id):
       user = self.get_user(user_id)
       try:
-         tournament_data = list_tournaments_records(api, base_id, tournament_id)
+         tournament_data = memoized("tournament", tournament_id,
+                                     lambda record_id: list_tournaments_records(api, base_id, record_id))
          
          tournament_fields = tournament_data.get("fields", {})
          tournament_name = tournament_fields.get("Tournament Name", "") 
-         start_date = tournament_fields.get("Start Date", [None])[0] if "Start Date" in tournament_fields else None
-         end_date = tournament_fields.get("End Date", [None])[0] if "End Date" in tournament_fields else None
+         start_date = _first(tournament_fields.get("Start Date"))
+         end_date = _first(tournament_fields.get("End Date"))
          sport_id = tournament_fields.get("Sport", [None])[0] if "Sport" in tournament_fields else None
          category_id = tournament_fields.get("Kategorija", [None])[0] if "Kategorija" in tournament_fields else None
          location_id = tournament_fields.get("Location", [None])[0] if "Location" in tournament_fields else None
@@ -275,7 +327,7 @@ class ClickTracker:
          
          sport_name = ""
          if sport_id:
-               sport_info = list_sport_records(api, base_id, sport_id)
+               sport_info = self._get_sport(sport_id)
                if sport_info and "fields" in sport_info:
                   sport_name = sport_info["fields"].get("Sport Name", "")
          
@@ -293,45 +345,50 @@ class ClickTracker:
                "timestamp": datetime.now().isoformat()
          }
          
-         user["events_liked"].append(tournament_metadata)
+         def apply(user):
+            record_event(user, tournament_metadata)
          
-         if sport_id:
-               if sport_id not in user["sports_liked_count"]:
-                  user["sports_liked_count"][sport_id] = 0
-               user["sports_liked_count"][sport_id] += 1
+            if sport_id:
+                  if sport_id not in user["sports_liked_count"]:
+                     user["sports_liked_count"][sport_id] = 0
+                  user["sports_liked_count"][sport_id] += 1
                
-               if sport_id not in user["sport_interests"]:
-                  user["sport_interests"].append(sport_id)
+                  if sport_id not in user["sport_interests"]:
+                     user["sport_interests"].append(sport_id)
          
-         if "tournament" not in user["event_type_priority"] and "TOURNAMENT" not in user["event_type_priority"]:
-               user["event_type_priority"].append("tournament")
+            if "tournament" not in user["event_type_priority"] and "TOURNAMENT" not in user["event_type_priority"]:
+                  user["event_type_priority"].append("tournament")
          
-         self._save_db()
+            return user
+
+         self._update(user_id, apply)
          
          return tournament_metadata
          
       except Exception as e:
-         print(f"Error tracking tournament click: {e}")
+         log.warning("track_tournament_click_failed", user_id=user_id, tournament_id=tournament_id, error=str(e))
          return None
 
    def set_user_stats(self, user_id, user_data):
       user = self.get_user(user_id)
 
-      if "age" in user_data:
-         user["age"] = user_data["age"]
-      if "sport_interests" in user_data:
-         user["sport_interests"] = user_data["sport_interests"]  
-      if "city" in user_data:
-         user["city"] = user_data["city"].lower()
-      if "district" in user_data:
-         user["district"] = user_data["district"].lower()
-      if "event_type_priority" in user_data:
-         user["event_type_priority"] = user_data["event_type_priority"]
-      if "user_name" in user_data:
-         user["user_name"] = user_data["user_name"]
+      def apply(user):
+         if "age" in user_data:
+            user["age"] = user_data["age"]
+         if "sport_interests" in user_data:
+            user["sport_interests"] = user_data["sport_interests"]  
+         if "city" in user_data:
+            user["city"] = user_data["city"].lower()
+         if "district" in user_data:
+            user["district"] = user_data["district"].lower()
+         if "event_type_priority" in user_data:
+            user["event_type_priority"] = user_data["event_type_priority"]
+         if "user_name" in user_data:
+            user["user_name"] = user_data["user_name"]
 
-      self._save_db()
-      return user
+         return user
+
+      return self._update(user_id, apply)
    
    def get_user_stats(self, user_id):
       """Get statistics about user interactions"""
@@ -340,7 +397,7 @@ class ClickTracker:
       favorite_sports = []
       for sport_id, count in sorted(user.get("sports_liked_count", {}).items(), key=lambda x: x[1], reverse=True)[:5]:
          try:
-            sport_data = list_sport_records(api, base_id, sport_id)
+            sport_data = self._get_sport(sport_id)
             sport_name = sport_data.get("fields", {}).get("Sport Name", "Unknown")
             favorite_sports.append((sport_id, sport_name, count))
          except:
@@ -349,7 +406,7 @@ class ClickTracker:
       favorite_teams = []
       for team_id in user.get("teams_liked", [])[:5]:
          try:
-            team_data = list_teams_records(api, base_id, team_id)
+            team_data = self._get_team(team_id)
             team_name = team_data.get("fields", {}).get("Team Name", "Unknown")
             favorite_teams.append((team_id, team_name))
          except:
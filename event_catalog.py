@@ -0,0 +1,182 @@
+import sys
+import threading
+from datetime import datetime
+from event_times import parse_event_time
+
+# liked-event metadata written by ClickTracker; any other key is kept in the record's `extra` dict
+EVENT_FIELDS = ("event_id", "event_type", "event_time", "event_date", "start_date", "end_date", "sport_id", "sport_name", "home_team_id", "away_team_id", "home_team", "away_team",
+                "tournament_name", "category_id", "location_id", "match_ids")
+_FIELD_SET = frozenset(EVENT_FIELDS)
+_MISSING = object()
+
+def _intern(value):
+   if isinstance(value, str):
+      return sys.intern(value)
+   if isinstance(value, list):
+      return tuple(_intern(item) for item in value)
+   return value
+
+class EventRecord:
+   """Metadata of one liked event, stored once in the catalog and shared by every profile that liked it.
+
+      Reads like the event dict it replaces (get, [], in, keys) and `id` is its small integer catalog ID.
+      `ts` is the event time parsed when the record is created or refreshed (see event_times); it is
+      not one of the event's keys, so it never reaches saved profiles or API responses.
+   """
+   __slots__ = ("id", "extra", "ts") + EVENT_FIELDS
+
+   def __init__(self, record_id):
+      self.id = record_id
+      self.extra = None
+      self.ts = None
+      for field in EVENT_FIELDS:
+         setattr(self, field, _MISSING)
+
+   def update(self, event):
+      for key, value in event.items():
+         # event_ts was stored on liked events by earlier versions; ts replaces it
+         if key not in ("timestamp", "event_ts"):
+            self[key] = value
+      self.ts = parse_event_time(self.get("event_date") or self.get("start_date"))
+
+   def __setitem__(self, key, value):
+      value = _intern(value)
+      if key in _FIELD_SET:
+         setattr(self, key, value)
+      else:
+         if self.extra is None:
+            self.extra = {}
+         self.extra[sys.intern(key)] = value
+
+   def __getitem__(self, key):
+      if key in _FIELD_SET:
+         value = getattr(self, key)
+      else:
+         value = self.extra.get(key, _MISSING) if self.extra else _MISSING
+      if value is _MISSING:
+         raise KeyError(key)
+      return value
+
+   def get(self, key, default=None):
+      try:
+         return self[key]
+      except KeyError:
+         return default
+
+   def __contains__(self, key):
+      return self.get(key, _MISSING) is not _MISSING
+
+   def keys(self):
+      return [field for field in EVENT_FIELDS if getattr(self, field) is not _MISSING] + list(self.extra or ())
+
+   def to_dict(self):
+      event = {key: self[key] for key in self.keys()}
+      if isinstance(self.match_ids, tuple):
+         event["match_ids"] = list(self.match_ids)
+      return event
+
+class LikedClick:
+   """One entry of a profile's liked-event history: a catalog record plus when the user clicked it.
+
+      `clicked_at` is the saved ISO timestamp, or seconds since the epoch for entries built from the
+      aggregates; "timestamp" reads it back as ISO either way.
+   """
+   __slots__ = ("event", "clicked_at")
+
+   def __init__(self, event, clicked_at=None):
+      self.event = event
+      self.clicked_at = clicked_at
+
+   @property
+   def ts(self):
+      return self.event.ts
+
+   @property
+   def timestamp(self):
+      if isinstance(self.clicked_at, float):
+         return datetime.fromtimestamp(self.clicked_at).isoformat()
+      return self.clicked_at
+
+   def __getitem__(self, key):
+      if key == "timestamp":
+         if self.clicked_at is None:
+            raise KeyError(key)
+         return self.timestamp
+      return self.event[key]
+
+   def __setitem__(self, key, value):
+      if key == "timestamp":
+         self.clicked_at = value
+      else:
+         self.event[key] = value
+
+   def get(self, key, default=None):
+      try:
+         return self[key]
+      except KeyError:
+         return default
+
+   def __contains__(self, key):
+      return self.clicked_at is not None if key == "timestamp" else key in self.event
+
+   def __eq__(self, other):
+      if not isinstance(other, LikedClick):
+         return NotImplemented
+      return self.event is other.event and self.clicked_at == other.clicked_at
+
+   __hash__ = None
+
+   def keys(self):
+      keys = self.event.keys()
+      if self.clicked_at is not None:
+         keys.append("timestamp")
+      return keys
+
+   def to_dict(self):
+      event = self.event.to_dict()
+      if self.clicked_at is not None:
+         event["timestamp"] = self.timestamp
+      return event
+
+class EventCatalog:
+   """Interns liked-event metadata: one EventRecord per event_id, numbered in insertion order"""
+   def __init__(self):
+      self.records = []
+      self.by_event_id = {}
+      self.lock = threading.Lock()
+
+   def __len__(self):
+      return len(self.records)
+
+   def __getitem__(self, record_id):
+      return self.records[record_id]
+
+   def intern(self, event, refresh=False):
+      """The shared record for an event dict; `refresh` overwrites known records with the dict's metadata"""
+      if isinstance(event, EventRecord):
+         return event
+      if isinstance(event, LikedClick):
+         return event.event
+      event_id = event.get("event_id")
+      record = self.by_event_id.get(event_id) if event_id else None
+      if record is None:
+         with self.lock:
+            record = self.by_event_id.get(event_id) if event_id else None
+            if record is None:
+               record = EventRecord(len(self.records))
+               record.update(event)
+               self.records.append(record)
+               if event_id:
+                  self.by_event_id[record.event_id] = record
+               return record
+      if refresh:
+         record.update(event)
+      return record
+
+catalog = EventCatalog()
+
+def to_json(value):
+   """json.dumps `default=` hook that writes records and clicks back out as plain event dicts"""
+   if hasattr(value, "to_dict"):
+      return value.to_dict()
+   raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
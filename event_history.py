@@ -0,0 +1,167 @@
+import time
+from array import array
+from datetime import datetime
+import numpy as np
+from event_catalog import catalog, LikedClick
+
+# raw clicks kept in a profile's events_liked, oldest dropped first
+HISTORY_SIZE = 100
+# distinct events kept in event_stats; the least relevant (lowest decayed score) are evicted
+MAX_TRACKED_EVENTS = 500
+# a click's weight halves every HALF_LIFE seconds
+HALF_LIFE = 30 * 24 * 3600
+
+def _clicked_at(event, default):
+   try:
+      return datetime.fromisoformat(event["timestamp"]).timestamp()
+   except (KeyError, TypeError, ValueError):
+      return default
+
+def _decay(score, last, now):
+   return score * 0.5 ** (max(now - last, 0.0) / HALF_LIFE)
+
+class EventStats:
+   """Per-user liked-event aggregates as parallel arrays indexed by position.
+
+      ids are EventCatalog record IDs; counts, decayed scores and last-click times (epoch seconds)
+      line up with them. Saved profiles hold the to_dict() form, keyed by event_id.
+   """
+   __slots__ = ("ids", "counts", "scores", "last")
+
+   def __init__(self):
+      self.ids = array('i')
+      self.counts = array('i')
+      self.scores = array('d')
+      self.last = array('d')
+
+   def __len__(self):
+      return len(self.ids)
+
+   def __eq__(self, other):
+      if not isinstance(other, EventStats):
+         return NotImplemented
+      return self.ids == other.ids and self.counts == other.counts and self.scores == other.scores and self.last == other.last
+
+   __hash__ = None
+
+   def add(self, record, clicked_at, count=1, score=1.0):
+      try:
+         i = self.ids.index(record.id)
+      except ValueError:
+         self.ids.append(record.id)
+         self.counts.append(count)
+         self.scores.append(score)
+         self.last.append(clicked_at)
+         return
+      self.scores[i] = _decay(self.scores[i], self.last[i], clicked_at) + score
+      self.counts[i] += count
+      self.last[i] = max(self.last[i], clicked_at)
+
+   def decayed(self, now):
+      """Every event's score decayed to `now`, as a float64 array"""
+      if not self.ids:
+         return np.zeros(0)
+      age = np.maximum(now - np.frombuffer(self.last, dtype=np.float64), 0.0)
+      return np.frombuffer(self.scores, dtype=np.float64) * 0.5 ** (age / HALF_LIFE)
+
+   def evict(self, now, keep=MAX_TRACKED_EVENTS):
+      if len(self.ids) <= keep:
+         return
+      kept = np.sort(np.argsort(-self.decayed(now), kind='stable')[:keep]).tolist()
+      for name in self.__slots__:
+         values = getattr(self, name)
+         setattr(self, name, array(values.typecode, [values[i] for i in kept]))
+
+   def items(self):
+      """(EventRecord, click count) pairs"""
+      records = catalog.records
+      return [(records[record_id], count) for record_id, count in zip(self.ids, self.counts)]
+
+   def ranked(self, now):
+      """(EventRecord, last click) pairs, highest decayed score first"""
+      records = catalog.records
+      return [(records[self.ids[i]], self.last[i]) for i in np.argsort(-self.decayed(now), kind='stable').tolist()]
+
+   def _stat(self, i):
+      record = catalog.records[self.ids[i]]
+      return {"event": record.to_dict(), "count": self.counts[i], "score": self.scores[i], "last": self.last[i]}
+
+   def keys(self):
+      """event_ids, so dict(stats) and FastAPI's jsonable_encoder see the saved to_dict() form"""
+      records = catalog.records
+      return [records[record_id].event_id for record_id in self.ids]
+
+   def __getitem__(self, event_id):
+      records = catalog.records
+      for i, record_id in enumerate(self.ids):
+         if records[record_id].event_id == event_id:
+            return self._stat(i)
+      raise KeyError(event_id)
+
+   def to_dict(self):
+      records = catalog.records
+      return {records[record_id].event_id: self._stat(i) for i, record_id in enumerate(self.ids)}
+
+   @classmethod
+   def from_dict(cls, stats):
+      self = cls()
+      for stat in stats.values():
+         self.add(catalog.intern(stat["event"]), stat["last"], stat["count"], stat["score"])
+      return self
+
+def _history(user):
+   """The profile's events_liked, with plain event dicts swapped for interned LikedClick entries"""
+   history = user.get("events_liked")
+   if history is None:
+      history = user["events_liked"] = []
+   for i, event in enumerate(history):
+      if not isinstance(event, LikedClick):
+         history[i] = LikedClick(catalog.intern(event), event.get("timestamp"))
+   return history
+
+def _build_stats(user):
+   """EventStats from a profile's saved event_stats, or rebuilt from its events_liked for older profiles"""
+   stats = user.get("event_stats")
+   if stats is not None:
+      return EventStats.from_dict(stats)
+   stats = EventStats()
+   now = time.time()
+   clicks = [(_clicked_at(click, now), click) for click in user.get("events_liked") or ()]
+   clicks.sort(key=lambda pair: pair[0])
+   for clicked_at, click in clicks:
+      if click.get("event_id"):
+         stats.add(catalog.intern(click), clicked_at)
+   stats.evict(now)
+   return stats
+
+def compact_profile(user):
+   """Intern a loaded profile's liked events in place and build its EventStats, once per profile"""
+   _history(user)
+   if not isinstance(user.get("event_stats"), EventStats):
+      user["event_stats"] = _build_stats(user)
+   return user
+
+def event_stats(user):
+   """The profile's EventStats; read-only, so a profile that was never compacted gets a throwaway copy"""
+   stats = user.get("event_stats")
+   if isinstance(stats, EventStats):
+      return stats
+   return _build_stats(user)
+
+def record_event(user, event, now=None):
+   """Append a click to the capped events_liked history and fold it into the per-event aggregates"""
+   now = time.time() if now is None else now
+   stats = compact_profile(user)["event_stats"]
+   record = catalog.intern(event, refresh=True)
+   history = _history(user)
+   history.append(LikedClick(record, event.get("timestamp")))
+   if len(history) > HISTORY_SIZE:
+      del history[:-HISTORY_SIZE]
+   if record.get("event_id"):
+      stats.add(record, now)
+      stats.evict(now)
+
+def liked_events(user, now=None):
+   """One entry per liked event (catalog metadata plus the last click), most relevant first by decayed score"""
+   now = time.time() if now is None else now
+   return [LikedClick(record, last) for record, last in event_stats(user).ranked(now)]
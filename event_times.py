@@ -0,0 +1,46 @@
+import time
+from datetime import datetime
+import numpy as np
+
+# liked events written before the click tracker stored ISO dates use month/day/year
+LEGACY_DATE_FORMAT = '%m/%d/%Y'
+
+def parse_event_time(value):
+   """Seconds since the epoch for an event date string (%m/%d/%Y or ISO 8601), None if unparseable"""
+   if not isinstance(value, str) or not value:
+      return None
+   try:
+      return int(datetime.strptime(value, LEGACY_DATE_FORMAT).timestamp())
+   except ValueError:
+      pass
+   try:
+      return int(datetime.fromisoformat(value).timestamp())
+   except ValueError:
+      return None
+
+def event_time(event):
+   """An event's time in seconds since the epoch; tournaments fall back to their start date.
+
+      Catalog records and liked clicks carry it pre-parsed as `ts`, plain dicts are parsed (not modified).
+   """
+   if isinstance(event, dict):
+      return parse_event_time(event.get("event_date") or event.get("start_date"))
+   return event.ts
+
+def event_times(events):
+   """datetime64[s] array of the events' times (NaT where unknown)"""
+   return np.array([event_time(event) for event in events], dtype='datetime64[s]')
+
+def now():
+   return np.datetime64(int(time.time()), 's')
+
+def upcoming_events(events, limit=None, current_time=None):
+   """Events that take place after `current_time` (default: now), earliest first, in a stable order"""
+   if not events:
+      return []
+   times = event_times(events)
+   order = np.argsort(times, kind='stable')
+   order = order[times[order] > (now() if current_time is None else current_time)]
+   if limit is not None:
+      order = order[:limit]
+   return [events[i] for i in order.tolist()]
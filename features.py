@@ -0,0 +1,153 @@
+import numpy as np
+import scipy.sparse as sp
+from event_history import event_stats
+
+AGE_GROUPS = ['PRESCHOOL', 'PRIMARY_SCHOOL', 'JUNIORS', 'ADULTS', 'VETERANS']
+EVENT_TYPES = ['MATCH', 'TRAINING', 'PLAYER', 'CLUB', 'TOURNAMENT', 'LEAGUE']
+
+# per-sport count blocks, in column order after the sport_interests block
+SPORT_COUNT_FIELDS = ['sports_liked_count', 'team_liked_sport', 'player_liked_sports_count', 'training_sports_liked']
+
+def encode_location(city, district):
+   location = f"{city.lower()}_{district.lower()}"
+   loc_hash = abs(hash(location)) % 1000 +1
+   return loc_hash / 10000
+
+class UserFeatureEncoder:
+   """Columnar encoder from user profiles to a float32 feature matrix.
+
+      Column layout: age, location, sport_interests, the SPORT_COUNT_FIELDS blocks,
+      event_type_priority, liked-event clicks per sport, liked-event clicks per event type
+      (summed from the event_stats aggregates, so they are not limited to the capped history).
+   """
+   def __init__(self, sports_ids):
+      self.sports_ids = sports_ids if isinstance(sports_ids, dict) else {sport: i for i, sport in enumerate(sports_ids)}
+      self.sports_num = len(self.sports_ids)
+      self.types_num = len(EVENT_TYPES)
+      self.age_index = {age: i for i, age in enumerate(AGE_GROUPS)}
+      self.type_index = {event_type: i for i, event_type in enumerate(EVENT_TYPES)}
+
+      s, t = self.sports_num, self.types_num
+      self.interests_offset = 2
+      self.count_offsets = [2 + s * (i + 1) for i in range(len(SPORT_COUNT_FIELDS))]
+      self.priority_offset = 2 + s * (len(SPORT_COUNT_FIELDS) + 1)
+      self.event_sport_offset = self.priority_offset + t
+      self.event_type_offset = self.event_sport_offset + s
+      self.dim = self.event_type_offset + t
+
+      # sport id -> absolute column, one table per block
+      self.interest_columns = {sport: self.interests_offset + i for sport, i in self.sports_ids.items()}
+      self.count_columns = [{sport: offset + i for sport, i in self.sports_ids.items()} for offset in self.count_offsets]
+      self.event_sport_columns = {sport: self.event_sport_offset + i for sport, i in self.sports_ids.items()}
+      self.priority_columns = {event_type: self.priority_offset + i for event_type, i in self.type_index.items()}
+      self.event_type_columns = {event_type: self.event_type_offset + i for event_type, i in self.type_index.items()}
+
+   def _age(self, user):
+      age = user.get('age', 'JUNIORS')
+      return self.age_index.get(age, 0) if isinstance(age, str) else 0
+
+   def _location(self, user):
+      city = user.get('city') or ''
+      district = user.get('district') or ''
+      return encode_location(city, district)
+
+   def _scatter(self, user, row, set_rows, set_cols, set_vals, add_rows, add_cols, add_vals):
+      """Append the sparse entries of one user to the assignment / accumulation index lists"""
+      interest_columns = self.interest_columns
+      for sport in user.get('sport_interests') or ():
+         col = interest_columns.get(sport)
+         if col is not None:
+            set_rows.append(row)
+            set_cols.append(col)
+            set_vals.append(1.0)
+
+      for field, columns in zip(SPORT_COUNT_FIELDS, self.count_columns):
+         for sport, count in (user.get(field) or {}).items():
+            col = columns.get(sport)
+            if col is not None:
+               set_rows.append(row)
+               set_cols.append(col)
+               set_vals.append(count)
+
+      priority_columns = self.priority_columns
+      for event_type in user.get('event_type_priority') or ():
+         col = priority_columns.get(event_type.upper())
+         if col is not None:
+            set_rows.append(row)
+            set_cols.append(col)
+            set_vals.append(1.0)
+
+      event_sport_columns = self.event_sport_columns
+      event_type_columns = self.event_type_columns
+      for event, count in event_stats(user).items():
+         col = event_sport_columns.get(event.sport_id)
+         if col is not None:
+            add_rows.append(row)
+            add_cols.append(col)
+            add_vals.append(count)
+         event_type = event.event_type
+         col = event_type_columns.get(event_type.upper()) if isinstance(event_type, str) else None
+         if col is not None:
+            add_rows.append(row)
+            add_cols.append(col)
+            add_vals.append(count)
+
+   def _fill(self, out, row_offset, users):
+      set_rows, set_cols, set_vals, add_rows, add_cols, add_vals = [], [], [], [], [], []
+      for row, user in enumerate(users, row_offset):
+         self._scatter(user, row, set_rows, set_cols, set_vals, add_rows, add_cols, add_vals)
+      if set_rows:
+         out[set_rows, set_cols] = set_vals
+      if add_rows:
+         np.add.at(out, (np.array(add_rows), np.array(add_cols)), np.array(add_vals, dtype=np.float32))
+
+   def encode_all(self, users, user_ids=None):
+      """Encode `users` (dict user_id -> profile) into a new (n, dim) float32 matrix in `user_ids` order"""
+      if user_ids is None:
+         user_ids = list(users.keys())
+      profiles = [users[user_id] for user_id in user_ids]
+      out = np.zeros((len(profiles), self.dim), dtype=np.float32)
+      out[:, 0] = [self._age(user) for user in profiles]
+      out[:, 1] = [self._location(user) for user in profiles]
+      self._fill(out, 0, profiles)
+      return out
+
+   def encode_sparse(self, users, user_ids=None):
+      """encode_all() as a (n, dim) float32 CSR matrix, without materializing the dense rows"""
+      if user_ids is None:
+         user_ids = list(users.keys())
+      profiles = [users[user_id] for user_id in user_ids]
+      n = len(profiles)
+      set_rows, set_cols, set_vals, add_rows, add_cols, add_vals = [], [], [], [], [], []
+      for row, user in enumerate(profiles):
+         self._scatter(user, row, set_rows, set_cols, set_vals, add_rows, add_cols, add_vals)
+
+      # assignments overwrite, so keep only the last value written to each cell
+      keys = np.array(set_rows, dtype=np.int64) * self.dim + np.array(set_cols, dtype=np.int64)
+      _, last = np.unique(keys[::-1], return_index=True)
+      last = len(keys) - 1 - last
+
+      rows = np.concatenate([np.arange(n), np.arange(n), np.array(set_rows, dtype=np.int64)[last], np.array(add_rows, dtype=np.int64)])
+      cols = np.concatenate([np.zeros(n, dtype=np.int64), np.ones(n, dtype=np.int64),
+                             np.array(set_cols, dtype=np.int64)[last], np.array(add_cols, dtype=np.int64)])
+      vals = np.concatenate([
+         np.array([self._age(user) for user in profiles], dtype=np.float32),
+         np.array([self._location(user) for user in profiles], dtype=np.float32),
+         np.array(set_vals, dtype=np.float32)[last],
+         np.array(add_vals, dtype=np.float32)
+      ])
+      # duplicate (row, col) pairs are summed, which is what np.add.at does for the dense path
+      out = sp.csr_matrix((vals, (rows, cols)), shape=(n, self.dim), dtype=np.float32)
+      out.eliminate_zeros()
+      return out
+
+   def encode_user(self, user, out=None):
+      """Encode one profile into `out` (e.g. a row view of the feature matrix) or a new vector"""
+      if out is None:
+         out = np.zeros(self.dim, dtype=np.float32)
+      else:
+         out[:] = 0
+      out[0] = self._age(user)
+      out[1] = self._location(user)
+      self._fill(out[None, :], 0, [user])
+      return out
@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime
+
+# RECOMMENDA_LOG_LEVEL=DEBUG turns on the per-request debug events; the default keeps them free
+DEFAULT_LEVEL = os.environ.get("RECOMMENDA_LOG_LEVEL", "INFO").upper()
+
+class JsonFormatter(logging.Formatter):
+   """One JSON object per line: timestamp, level, logger, event and the structured fields"""
+   def format(self, record):
+      entry = {
+         "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+         "level": record.levelname,
+         "logger": record.name,
+         "event": record.getMessage()
+      }
+      entry.update(getattr(record, "fields", {}))
+      if record.exc_info:
+         entry["exc"] = self.formatException(record.exc_info)
+      return json.dumps(entry, ensure_ascii=False, default=str)
+
+_configured = False
+
+def configure(level=None, stream=None):
+   """Attach the JSON handler to the "recommenda" logger; later calls only change the level"""
+   global _configured
+   root = logging.getLogger("recommenda")
+   root.setLevel(level or DEFAULT_LEVEL)
+   if not _configured:
+      handler = logging.StreamHandler(stream or sys.stderr)
+      handler.setFormatter(JsonFormatter())
+      root.addHandler(handler)
+      root.propagate = False
+      _configured = True
+
+class StructuredLogger:
+   """Level-gated structured logger.
+
+      Nothing is formatted unless the level is enabled: field values that are callables are only
+      called then, and `sample_rate` < 1 additionally keeps just that fraction of the events.
+   """
+   def __init__(self, name):
+      self.logger = logging.getLogger(f"recommenda.{name}")
+
+   def enabled(self, level=logging.DEBUG):
+      return self.logger.isEnabledFor(level)
+
+   def _log(self, level, event, sample_rate, exc_info, fields):
+      if not self.logger.isEnabledFor(level):
+         return
+      if sample_rate < 1.0 and random.random() >= sample_rate:
+         return
+      fields = {key: value() if callable(value) else value for key, value in fields.items()}
+      self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+   def debug(self, event, sample_rate=1.0, **fields):
+      self._log(logging.DEBUG, event, sample_rate, False, fields)
+
+   def info(self, event, sample_rate=1.0, **fields):
+      self._log(logging.INFO, event, sample_rate, False, fields)
+
+   def warning(self, event, sample_rate=1.0, exc_info=False, **fields):
+      self._log(logging.WARNING, event, sample_rate, exc_info, fields)
+
+   def error(self, event, sample_rate=1.0, exc_info=False, **fields):
+      self._log(logging.ERROR, event, sample_rate, exc_info, fields)
+
+def get_logger(name):
+   configure()
+   return StructuredLogger(name)
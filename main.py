@@ -1,19 +1,72 @@
+import time
+startup_started = time.perf_counter()
 from API import *
+from API import api_key, base_id
+from airtable_cache import cache_stats
+import metrics
+from log import get_logger
+from request_context import request_scope
+from catalog import Catalog
+from async_api import AsyncAirtable
+from match_store import UpcomingMatchesStore
+from storage import open_store
+from event_catalog import to_json
+from profiles import ProfileRepository
 from recommender import Recommender, RuleBasedRecommender
 from click_tracker import ClickTracker
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import json
+import os
 from typing import List, Dict, Optional, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, conlist
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 
 database_path = "user_clicks.json"
-sports_ids = get_all_sport_ids(api, base_id)
-locations_ids = get_all_location_ids(api, base_id)
+precomputed_path = "precomputed"
+catalog_cache_path = "catalog_cache.json"
+# upper bounds for /api/recommend/batch requests
+batch_max_users = 10000
+batch_max_limit = 100
+# set RECOMMENDA_SERVER_TIMING=1 to return per-stage timings in a Server-Timing response header
+server_timing = os.environ.get("RECOMMENDA_SERVER_TIMING", "0") == "1"
+# "cached" starts from catalog_cache.json and syncs Airtable in the background (a first start
+# without a cache still loads the catalog synchronously); "eager" fetches everything before serving
+startup_mode = os.environ.get("RECOMMENDA_STARTUP", "cached")
+log = get_logger("api")
+metrics.record_startup("imports", time.perf_counter() - startup_started)
 
-recommender = Recommender(database_path, sports_ids, locations_ids)
-click_tracker = ClickTracker(database_path, recommender)
+profile_store = open_store(database_path)
+# loaded by the Recommender below, which encodes profiles as they are read from the snapshot
+profiles = ProfileRepository(profile_store, load=False)
+catalog = Catalog(api, base_id, cache_path=catalog_cache_path)
+with metrics.startup_phase("catalog"):
+   cached = startup_mode == "cached" and catalog.load_cached()
+   if not cached:
+      catalog.load()
+   catalog.start_refresh(immediate=cached)
+sports_ids = catalog.sport_ids()
+locations_ids = catalog.location_ids()
+
+match_store = UpcomingMatchesStore(api, base_id)
+with metrics.startup_phase("match_store"):
+   if startup_mode != "cached":
+      match_store.sync()
+   match_store.start_sync(immediate=startup_mode == "cached")
+
+with metrics.startup_phase("recommender"):
+   recommender = Recommender(database_path, sports_ids, locations_ids, catalog=catalog, match_store=match_store, profiles=profiles)
+click_tracker = ClickTracker(database_path, recommender, catalog=catalog, profiles=profiles)
+recommender.start_cache_warmer()
+with metrics.startup_phase("precomputed"):
+   # reloaded by the cache warmer whenever precompute.py swaps in a new output
+   recommender.load_precomputed(precomputed_path)
+async_airtable = AsyncAirtable(api_key, base_id)
 ruleBasedRecommender = RuleBasedRecommender()
+metrics.record_startup("total", time.perf_counter() - startup_started)
+log.info("startup", mode=startup_mode, catalog_source=catalog.source, users=len(profiles),
+         **{f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in metrics.startup_phases.items()})
 
 app = FastAPI(title="AlterSport API")
 
@@ -25,6 +78,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+   timings, token = metrics.start_request()
+   start = time.perf_counter()
+   try:
+      with request_scope() as context:
+         response = await call_next(request)
+   finally:
+      route = request.scope.get("route")
+      metrics.end_request(token, route.path if route is not None else "unmatched", time.perf_counter() - start)
+   if server_timing:
+      response.headers["Server-Timing"] = f'{timings.server_timing()}, memo;desc="{context.saved} saved"'
+   return response
+
 class UserQuizInit(BaseModel):
    user_id: Optional[str] = None
    user_name: Optional[str] = None
@@ -45,6 +112,10 @@ class UserUpdate(BaseModel):
    sport_interests: Optional[List[str]] = None
    event_type_priority: Optional[List[str]] = None
 
+class BatchRecommendationRequest(BaseModel):
+   user_ids: conlist(str, max_length=batch_max_users)
+   limit: conint(gt=0, le=batch_max_limit) = 5
+
 class DateRangeRequest(BaseModel):
    start_date: str
    end_date: str
@@ -60,6 +131,15 @@ def get_user_or_error(user_id: str):
       raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
    return user
 
+@app.on_event("shutdown")
+async def close_clients():
+   catalog.stop_refresh()
+   match_store.stop_sync()
+   recommender.close()
+   profiles.compact()
+   profile_store.close()
+   await async_airtable.aclose()
+
 @app.post("/api/users/initialize/{user_id}")
 async def initialize_user(user_id):
    if user_id is None:
@@ -68,7 +148,7 @@ async def initialize_user(user_id):
       user = click_tracker.initialize_user(user_id)
       return {"user_id": user_id, "profile": user}
    except Exception as e:
-      print(f"Error initializing user: {str(e)}")
+      log.error("initialize_user_failed", user_id=user_id, error=str(e))
       raise HTTPException(status_code=500, detail=str(e)) 
    
 
@@ -91,19 +171,17 @@ from recommender import GroupSportType, AgeGroup, ActivitiesEnjoyed
 @app.post("/api/users/update/{user_id}")
 async def update_after_wizard(user_id: str, user_data: UserQuizInit = None):
    group_style_enum = GroupSportType[user_data.group_style.upper()] if user_data.group_style else GroupSportType.DEFAULT
-   print(f"Group style enum: {group_style_enum}")
    age_group_enum = AgeGroup[user_data.age.upper()] if user_data.age else AgeGroup.ADULTS
-   print(f"Age group enum: {age_group_enum}")
    activity_enums = []
    for activity in user_data.activities:
       activity_enums.append(ActivitiesEnjoyed[activity.upper()])
-   print(f"Activity enums: {activity_enums}")
    recommended_sport = ruleBasedRecommender.get_user_recommendations(
       group_style=group_style_enum,
       activities=activity_enums,
       age_group=age_group_enum
    )
-   print(f"Recommended sport: {recommended_sport}")
+   log.debug("wizard_recommendation", user_id=user_id, group_style=group_style_enum.name, age_group=age_group_enum.name,
+             activities=lambda: [activity.name for activity in activity_enums], recommended_sport=recommended_sport)
    
    data_dict = user_data.dict()
    if recommended_sport:
@@ -113,7 +191,6 @@ async def update_after_wizard(user_id: str, user_data: UserQuizInit = None):
             data_dict['sport_interests'].append(recommended_sport)
                
    data_dict["user_id"] = user_id
-   print(f"Data dict: {data_dict}")
 
    try:
       user = click_tracker.update_user(user_id, data_dict)
@@ -184,11 +261,10 @@ async def get_homepage_recommendations(user_id: str, limit: int = 10):
       user = click_tracker.get_user(user_id)
       if not user:
          user = click_tracker.initialize_user(user_id)
-      recommender._load_database()
-      recommendations = recommender.get_homepage_recommendations(user_id, limit)
+      recommendations = await recommender.aget_homepage_recommendations(user_id, async_airtable, limit)
       return {"user_id": user_id, "recommendations": recommendations}
    except Exception as e:
-      print(f"Homepage recommendation error: {str(e)}")
+      log.error("homepage_recommendation_failed", user_id=user_id, error=str(e))
       raise HTTPException(status_code=500, detail=str(e))
      
 @app.get("/api/recommend/{user_id}/sport/{sport_id}")
@@ -231,11 +307,19 @@ async def get_user_favorites(user_id: str, limit: int = 5):
 async def get_real_time_match_recommendations(user_id: str, limit: int = 5):
    get_user_or_error(user_id)
    try:
-      matches = recommender.get_real_time_match_recommendations(user_id, limit)
+      matches = await recommender.aget_real_time_match_recommendations(user_id, async_airtable, limit)
       return {"user_id": user_id, "matches": matches}
    except Exception as e:
       raise HTTPException(status_code=500, detail=str(e))
    
+@app.post("/api/recommend/batch")
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+   """Stream match recommendations for many users as newline-delimited JSON, one line per user"""
+   def lines():
+      for result in recommender.recommend_batch(request.user_ids, request.limit):
+         yield json.dumps(result, ensure_ascii=False, default=to_json) + "\n"
+   return StreamingResponse(lines(), media_type="application/x-ndjson")
+   
 @app.post("/api/events/date-range")
 async def get_events_by_dates(request: DateRangeRequest):
    try:
@@ -256,7 +340,7 @@ async def get_events_by_dates(request: DateRangeRequest):
 async def get_sports():
    """Get all available sports"""
    try:
-      sports = list_sport_records(api, base_id)
+      sports = catalog.records('sports')
       return {"sports": sports}
    except Exception as e:
       raise HTTPException(status_code=500, detail=str(e))
@@ -265,7 +349,7 @@ async def get_sports():
 async def get_teams():
    """Get all available teams"""
    try:
-      teams = list_teams_records(api, base_id)
+      teams = catalog.records('teams')
       return {"teams": teams}
    except Exception as e:
       raise HTTPException(status_code=500, detail=str(e))
@@ -274,7 +358,7 @@ async def get_teams():
 async def get_locations():
    """Get all available locations"""
    try:
-      locations = list_locations_records(api, base_id)
+      locations = catalog.records('locations')
       return {"locations": locations}
    except Exception as e:
       raise HTTPException(status_code=500, detail=str(e))
@@ -299,9 +383,37 @@ async def get_user_clicks():
    except Exception as e:
       raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/neighbours/recall")
+async def get_neighbour_recall(k: int = 3, sample_size: int = 200, backend: Optional[str] = None):
+   """Recall of the neighbour search backend against exact search"""
+   try:
+      recall = recommender.neighbour_recall(k, sample_size, backend)
+      return {
+         "backend": backend or recommender.similarity_index.backend.name,
+         "k": k,
+         "sample_size": sample_size,
+         "recall": recall
+      }
+   except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+   return metrics.registry.render()
+
 @app.get("/api/health")
 async def health_check():
-   return {"status": "healthy", "sports_count": len(sports_ids), "locations_count": len(locations_ids)}
+   return {
+      "status": "healthy",
+      "sports_count": len(sports_ids),
+      "locations_count": len(locations_ids),
+      "startup": {"mode": startup_mode, **metrics.startup_phases},
+      "catalog": catalog.stats(),
+      "upcoming_matches": match_store.stats(),
+      "recommendation_cache": recommender.recommendation_cache.stats(),
+      "memory": recommender.memory_stats(),
+      "airtable_cache": cache_stats()
+   }
 
 if __name__ == "__main__":
    uvicorn.run(app, host="0.0.0.0", port=8888)
\ No newline at end of file
@@ -0,0 +1,160 @@
+import hashlib
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from API import get_similar_upcoming_matches, upcoming_matches_formula
+from metrics import count_upstream, span
+from log import get_logger
+
+log = get_logger("match_store")
+
+class _Snapshot:
+   __slots__ = ("records", "dates", "by_sport", "by_team", "by_location", "fingerprint")
+
+   def __init__(self, records):
+      self.records = sorted(records, key=lambda match: match['fields'].get('Match Date', ''))
+      self.dates = [match['fields'].get('Match Date', '') for match in self.records]
+      digest = hashlib.sha1()
+      for match, match_date in zip(self.records, self.dates):
+         digest.update(f"{match.get('id')}@{match_date};".encode('utf-8'))
+      self.fingerprint = digest.hexdigest()
+      self.by_sport, self.by_team, self.by_location = {}, {}, {}
+      for position, match in enumerate(self.records):
+         fields = match['fields']
+         for sport_id in fields.get('Sport', []):
+            self.by_sport.setdefault(sport_id, []).append(position)
+         for team_id in fields.get('Home Team', []) + fields.get('Away Team', []):
+            self.by_team.setdefault(team_id, []).append(position)
+         for location_id in fields.get('Location', []):
+            self.by_location.setdefault(location_id, []).append(position)
+
+class UpcomingMatchesStore:
+   """Locally materialized copy of the upcoming part of the Događanje table.
+
+      Holds every match of the next `horizon_days` days, re-synced in a background thread, with
+      position indexes by date, sport, team and location. get_similar_upcoming_matches answers
+      the same queries as API.get_similar_upcoming_matches from memory.
+   """
+   def __init__(self, api, base_id, horizon_days=30, sync_interval=300):
+      self.api = api
+      self.base_id = base_id
+      self.horizon_days = horizon_days
+      self.sync_interval = sync_interval
+      self.snapshot = None
+      self.version = 0
+      self.synced_at = None
+      self._stop = threading.Event()
+      self._thread = None
+
+   def sync(self):
+      """Fetch the next `horizon_days` of matches and swap in a freshly indexed snapshot"""
+      count_upstream('Događanje', 'all')
+      with span("match_sync"):
+         records = self.api.table(self.base_id, 'Događanje').all(
+            formula=upcoming_matches_formula(self.horizon_days),
+            sort=["Match Date"]
+         )
+      snapshot = _Snapshot(records)
+      changed = self.snapshot is None or snapshot.records != self.snapshot.records
+      self.snapshot = snapshot
+      self.synced_at = datetime.now()
+      if changed:
+         self.version += 1
+
+   @property
+   def fingerprint(self):
+      """Digest of the synced matches' IDs and dates, comparable across processes (None before the first sync)"""
+      snapshot = self.snapshot
+      return snapshot.fingerprint if snapshot is not None else None
+
+   def _ensure_synced(self):
+      if self.snapshot is None:
+         self.sync()
+
+   def start_sync(self, immediate=False):
+      """Re-sync every `sync_interval` seconds in a daemon thread; `immediate` also syncs right away"""
+      if self._thread is not None:
+         return
+      self._stop.clear()
+      self._thread = threading.Thread(target=self._sync_loop, args=(immediate,), name="match-store-sync", daemon=True)
+      self._thread.start()
+
+   def stop_sync(self):
+      self._stop.set()
+      self._thread = None
+
+   def _sync_loop(self, immediate):
+      if immediate:
+         self._sync()
+      while not self._stop.wait(self.sync_interval):
+         self._sync()
+
+   def _sync(self):
+      try:
+         self.sync()
+      except Exception as e:
+         log.warning("match_sync_failed", error=str(e))
+
+   @staticmethod
+   def _positions(index, keys, lo, hi, within=None):
+      positions = set()
+      for key in keys:
+         entries = index.get(key, [])
+         positions.update(entries[bisect_left(entries, lo):bisect_left(entries, hi)])
+      if within is not None:
+         positions &= within
+      return positions
+
+   def get_similar_upcoming_matches(self, sport_id=None, location_id=None, team_id=None, days_ahead=7):
+      """In-memory equivalent of API.get_similar_upcoming_matches"""
+      if days_ahead > self.horizon_days:
+         return get_similar_upcoming_matches(self.api, self.base_id, sport_id=sport_id, location_id=location_id,
+                                             team_id=team_id, days_ahead=days_ahead)
+      try:
+         self._ensure_synced()
+      except Exception:
+         return []
+      snapshot = self.snapshot
+
+      # same window as the Airtable formula: IS_AFTER(today) and IS_BEFORE(today + days_ahead)
+      today = datetime.now().date()
+      lo = bisect_right(snapshot.dates, today.isoformat())
+      hi = bisect_left(snapshot.dates, (today + timedelta(days=days_ahead)).isoformat())
+      if lo >= hi:
+         return []
+      records = snapshot.records
+
+      def as_records(positions):
+         return [records[p] for p in sorted(positions)]
+
+      if sport_id is not None:
+         sport_ids = sport_id if isinstance(sport_id, list) else [sport_id]
+         by_sport = self._positions(snapshot.by_sport, sport_ids, lo, hi)
+         if not by_sport:
+            return records[lo:hi]
+      else:
+         by_sport = set(range(lo, hi))
+
+      if team_id is not None:
+         team_ids = team_id if isinstance(team_id, list) else [team_id]
+         by_team = self._positions(snapshot.by_team, team_ids, lo, hi, within=by_sport)
+         if not by_team and sport_id is not None:
+            return as_records(by_sport)
+         filtered = by_team
+      else:
+         filtered = by_sport
+
+      if location_id is not None:
+         by_location = self._positions(snapshot.by_location, [location_id], lo, hi, within=filtered)
+         if not by_location:
+            return as_records(filtered)
+         return as_records(by_location)
+
+      return as_records(filtered)
+
+   def stats(self):
+      return {
+         "matches": len(self.snapshot.records) if self.snapshot else 0,
+         "version": self.version,
+         "synced_at": self.synced_at.isoformat() if self.synced_at else None
+      }
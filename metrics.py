@@ -0,0 +1,175 @@
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Histogram:
+   __slots__ = ("counts", "count", "total")
+
+   def __init__(self):
+      self.counts = [0] * (len(BUCKETS) + 1)
+      self.count = 0
+      self.total = 0.0
+
+   def observe(self, value):
+      self.counts[bisect_left(BUCKETS, value)] += 1
+      self.count += 1
+      self.total += value
+
+class MetricsRegistry:
+   """Process-wide counters and latency histograms, rendered in the Prometheus text format"""
+   def __init__(self):
+      self.counters = {}
+      self.histograms = {}
+      self.help = {}
+      self.lock = threading.Lock()
+
+   def inc(self, name, labels=(), amount=1):
+      key = (name, tuple(labels))
+      with self.lock:
+         self.counters[key] = self.counters.get(key, 0) + amount
+
+   def observe(self, name, value, labels=()):
+      key = (name, tuple(labels))
+      with self.lock:
+         histogram = self.histograms.get(key)
+         if histogram is None:
+            histogram = self.histograms[key] = _Histogram()
+         histogram.observe(value)
+
+   def describe(self, name, text):
+      self.help[name] = text
+
+   @staticmethod
+   def _labels(labels, extra=()):
+      pairs = list(labels) + list(extra)
+      if not pairs:
+         return ""
+      escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+      return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+   def render(self):
+      lines = []
+      with self.lock:
+         counters = sorted(self.counters.items())
+         histograms = sorted(self.histograms.items())
+         histogram_copies = [(key, list(h.counts), h.count, h.total) for key, h in histograms]
+
+      seen = set()
+      for (name, labels), value in counters:
+         if name not in seen:
+            seen.add(name)
+            if name in self.help:
+               lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} counter")
+         lines.append(f"{name}{self._labels(labels)} {value}")
+
+      for (name, labels), counts, count, total in histogram_copies:
+         if name not in seen:
+            seen.add(name)
+            if name in self.help:
+               lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+         cumulative = 0
+         for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+         lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+         lines.append(f"{name}_sum{self._labels(labels)} {total}")
+         lines.append(f"{name}_count{self._labels(labels)} {count}")
+      return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+registry.describe("recommenda_span_seconds", "Time spent in an instrumented stage")
+registry.describe("recommenda_request_seconds", "HTTP request latency by route")
+registry.describe("recommenda_upstream_calls_total", "Airtable requests by table and method")
+registry.describe("recommenda_route_upstream_calls_total", "Airtable requests made while serving HTTP requests, by route")
+registry.describe("recommenda_startup_seconds_total", "Time spent in each phase of process start-up")
+
+# phase -> seconds, in the order the phases finished
+startup_phases = {}
+
+def record_startup(phase, seconds):
+   startup_phases[phase] = seconds
+   registry.inc("recommenda_startup_seconds_total", [("phase", phase)], seconds)
+
+@contextmanager
+def startup_phase(phase):
+   """Time one phase of start-up; reported as recommenda_startup_seconds_total and by /api/health"""
+   start = time.perf_counter()
+   try:
+      yield
+   finally:
+      record_startup(phase, time.perf_counter() - start)
+
+class RequestTimings:
+   """Per-request accumulation of span durations and upstream calls"""
+   def __init__(self):
+      self.spans = {}
+      self.upstream_calls = 0
+
+   def add(self, name, seconds):
+      total, count = self.spans.get(name, (0.0, 0))
+      self.spans[name] = (total + seconds, count + 1)
+
+   def server_timing(self):
+      """Server-Timing header value: one entry per span with its summed duration in ms"""
+      entries = [f"{name};dur={total * 1000:.2f};desc=\"x{count}\"" for name, (total, count) in self.spans.items()]
+      entries.append(f"upstream;desc=\"{self.upstream_calls} calls\"")
+      return ", ".join(entries)
+
+_current = ContextVar("request_timings", default=None)
+
+def start_request():
+   """Start collecting spans for the current request; returns (timings, token for end_request)"""
+   timings = RequestTimings()
+   return timings, _current.set(timings)
+
+def end_request(token, route, seconds):
+   timings = _current.get()
+   _current.reset(token)
+   registry.observe("recommenda_request_seconds", seconds, [("route", route)])
+   if timings is not None:
+      registry.inc("recommenda_route_upstream_calls_total", [("route", route)], timings.upstream_calls)
+   return timings
+
+@contextmanager
+def span(name):
+   """Time a stage; recorded in the span histogram and, inside a request, in its Server-Timing"""
+   start = time.perf_counter()
+   try:
+      yield
+   finally:
+      seconds = time.perf_counter() - start
+      registry.observe("recommenda_span_seconds", seconds, [("span", name)])
+      timings = _current.get()
+      if timings is not None:
+         timings.add(name, seconds)
+
+def timed(name):
+   """Decorator form of span() for plain and async functions"""
+   def decorator(fn):
+      if inspect.iscoroutinefunction(fn):
+         @wraps(fn)
+         async def async_wrapper(*args, **kwargs):
+            with span(name):
+               return await fn(*args, **kwargs)
+         return async_wrapper
+
+      @wraps(fn)
+      def wrapper(*args, **kwargs):
+         with span(name):
+            return fn(*args, **kwargs)
+      return wrapper
+   return decorator
+
+def count_upstream(table, method):
+   registry.inc("recommenda_upstream_calls_total", [("table", table), ("method", method)])
+   timings = _current.get()
+   if timings is not None:
+      timings.upstream_calls += 1
@@ -0,0 +1,26 @@
+import argparse
+import time
+from click_log import load_database
+from storage import SQLiteProfileStore
+
+def migrate(json_path, sqlite_path, batch_size=500):
+   """Import every profile from a user_clicks.json snapshot (plus its click log) into a SQLite store"""
+   users = load_database(json_path)["users"]
+   store = SQLiteProfileStore(sqlite_path)
+   user_ids = list(users.keys())
+   for start in range(0, len(user_ids), batch_size):
+      batch = user_ids[start:start + batch_size]
+      store.put_many({user_id: users[user_id] for user_id in batch})
+   store.compact()
+   store.close()
+   return len(user_ids)
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Import user_clicks.json into a SQLite profile store")
+   parser.add_argument("source", nargs="?", default="user_clicks.json")
+   parser.add_argument("target", nargs="?", default="user_clicks.db")
+   args = parser.parse_args()
+
+   start = time.perf_counter()
+   count = migrate(args.source, args.target)
+   print(f"Migrated {count} users from {args.source} to {args.target} in {time.perf_counter() - start:.2f}s")
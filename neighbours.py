@@ -0,0 +1,267 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+import numpy as np
+import scipy.sparse as sp
+
+def _top_k(scores, k):
+   """Indices of the k largest scores, sorted by descending score"""
+   if k >= len(scores):
+      return np.argsort(-scores, kind='stable')
+   top = np.argpartition(-scores, k - 1)[:k]
+   return top[np.argsort(-scores[top], kind='stable')]
+
+def _top_k_rows(scores, k):
+   """Column indices of the k largest scores of every row, each row sorted by descending score"""
+   k = min(k, scores.shape[1])
+   if k == 0:
+      return np.empty((len(scores), 0), dtype=np.int64)
+   top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+   order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+   return np.take_along_axis(top, order, axis=1)
+
+def _dense(product):
+   """Matrix products involving a CSR operand come back sparse; the top-k code needs an ndarray"""
+   return product.toarray() if sp.issparse(product) else product
+
+def dot_rows(matrix, vector):
+   """Scores of every row of `matrix` against one vector (1-d array or 1 x d CSR row)"""
+   return np.asarray(_dense(matrix @ vector.T)).ravel()
+
+class ExactNeighbourSearch:
+   """Brute-force cosine top-k over a normalized dense or CSR feature matrix, computed in row blocks"""
+   name = "exact"
+
+   def __init__(self, block_size=8192):
+      self.block_size = block_size
+      self.matrix = None
+
+   def fit(self, matrix):
+      self.matrix = matrix
+
+   def update(self, matrix, rows):
+      self.matrix = matrix
+
+   def query(self, vector, k, exclude=None):
+      n = self.matrix.shape[0]
+      if n == 0 or k <= 0:
+         return np.empty(0, dtype=np.int64), np.empty(0)
+
+      best_idx, best_scores = [], []
+      for start in range(0, n, self.block_size):
+         block = dot_rows(self.matrix[start:start + self.block_size], vector)
+         if exclude is not None and start <= exclude < start + len(block):
+            block[exclude - start] = -np.inf
+         top = _top_k(block, k)
+         best_idx.append(top + start)
+         best_scores.append(block[top])
+
+      idx = np.concatenate(best_idx)
+      scores = np.concatenate(best_scores)
+      top = _top_k(scores, k)
+      keep = np.isfinite(scores[top])
+      return idx[top][keep], scores[top][keep]
+
+   def query_many(self, vectors, k, exclude=None):
+      """Top-k for a batch of query vectors with one matrix product per row block.
+
+         Returns (indices, scores) arrays of shape (len(vectors), k); missing entries have score -inf.
+      """
+      q = vectors.shape[0]
+      best_idx = np.empty((q, 0), dtype=np.int64)
+      best_scores = np.empty((q, 0), dtype=vectors.dtype)
+      rows = np.arange(q)
+      for start in range(0, self.matrix.shape[0], self.block_size):
+         block = _dense(vectors @ self.matrix[start:start + self.block_size].T)
+         if exclude is not None:
+            inside = (exclude >= start) & (exclude < start + block.shape[1])
+            block[rows[inside], exclude[inside] - start] = -np.inf
+         top = _top_k_rows(block, k)
+         idx = np.hstack([best_idx, top + start])
+         scores = np.hstack([best_scores, np.take_along_axis(block, top, axis=1)])
+         keep = _top_k_rows(scores, k)
+         best_idx = np.take_along_axis(idx, keep, axis=1)
+         best_scores = np.take_along_axis(scores, keep, axis=1)
+      return best_idx, best_scores
+
+class LSHNeighbourSearch:
+   """Approximate cosine top-k using random-hyperplane LSH.
+
+      Each of `num_tables` tables hashes a row to `num_bits` sign bits; candidates are the rows
+      sharing a bucket with the query in any table and are re-ranked by exact cosine.
+   """
+   name = "lsh"
+
+   def __init__(self, num_tables=8, num_bits=10, seed=0, block_size=8192):
+      self.num_tables = num_tables
+      self.num_bits = num_bits
+      self.seed = seed
+      self.exact = ExactNeighbourSearch(block_size)
+      self.matrix = None
+      self.planes = None
+      self.codes = None
+      self.buckets = []
+      self._weights = 1 << np.arange(num_bits, dtype=np.int64)
+
+   def _hash(self, vectors):
+      # (tables, rows) bucket codes; one product against all planes works for dense and CSR rows
+      t, d, b = self.planes.shape
+      projected = _dense(vectors @ self.planes.transpose(1, 0, 2).reshape(d, t * b))
+      bits = np.asarray(projected).reshape(-1, t, b).transpose(1, 0, 2) > 0
+      return bits.astype(np.int64) @ self._weights
+
+   def fit(self, matrix):
+      self.matrix = matrix
+      self.exact.fit(matrix)
+      rng = np.random.default_rng(self.seed)
+      self.planes = rng.standard_normal((self.num_tables, matrix.shape[1], self.num_bits))
+      self.codes = self._hash(matrix)
+      self.buckets = []
+      for table_codes in self.codes:
+         table = {}
+         for row, code in enumerate(table_codes.tolist()):
+            table.setdefault(code, set()).add(row)
+         self.buckets.append(table)
+
+   def update(self, matrix, rows):
+      self.matrix = matrix
+      self.exact.update(matrix, rows)
+      rows = np.asarray(rows)
+      if self.codes.shape[1] < matrix.shape[0]:
+         grown = np.full((self.num_tables, matrix.shape[0]), -1, dtype=np.int64)
+         grown[:, :self.codes.shape[1]] = self.codes
+         self.codes = grown
+
+      new_codes = self._hash(matrix[rows])
+      for t, table in enumerate(self.buckets):
+         for row, code in zip(rows.tolist(), new_codes[t].tolist()):
+            old = self.codes[t, row]
+            if old == code:
+               continue
+            if old in table:
+               table[old].discard(row)
+            table.setdefault(code, set()).add(row)
+            self.codes[t, row] = code
+
+   def query(self, vector, k, exclude=None):
+      codes = self._hash(vector if sp.issparse(vector) else vector[None, :])[:, 0]
+      candidates = set()
+      for table, code in zip(self.buckets, codes.tolist()):
+         candidates.update(table.get(code, ()))
+      candidates.discard(exclude)
+
+      if len(candidates) < k:
+         return self.exact.query(vector, k, exclude)
+
+      rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+      scores = dot_rows(self.matrix[rows], vector)
+      top = _top_k(scores, k)
+      return rows[top], scores[top]
+
+   def query_many(self, vectors, k, exclude=None):
+      idx = np.zeros((vectors.shape[0], k), dtype=np.int64)
+      scores = np.full((vectors.shape[0], k), -np.inf, dtype=vectors.dtype)
+      for i in range(vectors.shape[0]):
+         found, found_scores = self.query(vectors[i], k, None if exclude is None else int(exclude[i]))
+         idx[i, :len(found)] = found
+         scores[i, :len(found)] = found_scores
+      return idx, scores
+
+def _limit_blas_threads():
+   # one BLAS thread per worker process, otherwise workers oversubscribe the cores
+   try:
+      from threadpoolctl import threadpool_limits
+      threadpool_limits(1)
+   except ImportError:
+      pass
+
+def _top_k_worker(shm_name, shape, dtype, rows, k, block_size):
+   shm = shared_memory.SharedMemory(name=shm_name)
+   try:
+      matrix = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+      search = ExactNeighbourSearch(block_size)
+      search.fit(matrix)
+      idx, scores = search.query_many(matrix[rows], k, exclude=rows)
+      del matrix, search
+      return idx, scores
+   finally:
+      shm.close()
+
+def make_pool(workers=None):
+   """Process pool for parallel_top_k.
+
+      Spawned workers import the parent's __main__ module when they start, so keep one pool
+      for the life of the caller rather than one per call.
+   """
+   return ProcessPoolExecutor(workers or os.cpu_count() or 1, mp_context=get_context("spawn"),
+                              initializer=_limit_blas_threads)
+
+def parallel_top_k(matrix, k, rows=None, workers=None, rows_per_task=2048, block_size=8192, pool=None):
+   """Exact top-k neighbours of `rows` (default: all rows) of a dense matrix, split into row blocks over a process pool.
+
+      The matrix is copied once into shared memory; workers attach to it instead of receiving a
+      pickled copy. `pool` (see make_pool) is used if given, otherwise a pool of `workers` is
+      started for this call. Returns (indices, scores) of shape (len(rows), k) with -inf for
+      missing entries.
+   """
+   rows = np.arange(len(matrix)) if rows is None else np.asarray(rows)
+   matrix = np.ascontiguousarray(matrix)
+   idx = np.zeros((len(rows), k), dtype=np.int64)
+   scores = np.full((len(rows), k), -np.inf, dtype=matrix.dtype)
+   # a row has at most n - 1 neighbours
+   found = min(k, len(matrix) - 1)
+   if found <= 0 or not len(rows):
+      return idx, scores
+   if pool is None:
+      with make_pool(workers) as pool:
+         return parallel_top_k(matrix, k, rows, rows_per_task=rows_per_task, block_size=block_size, pool=pool)
+
+   shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+   try:
+      shared = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)
+      shared[:] = matrix
+      futures = {
+         pool.submit(_top_k_worker, shm.name, matrix.shape, matrix.dtype, rows[start:start + rows_per_task], found, block_size): start
+         for start in range(0, len(rows), rows_per_task)
+      }
+      for future, start in futures.items():
+         block_idx, block_scores = future.result()
+         idx[start:start + len(block_idx), :found] = block_idx
+         scores[start:start + len(block_idx), :found] = block_scores
+      del shared
+      return idx, scores
+   finally:
+      shm.close()
+      shm.unlink()
+
+NEIGHBOUR_BACKENDS = {
+   ExactNeighbourSearch.name: ExactNeighbourSearch,
+   LSHNeighbourSearch.name: LSHNeighbourSearch,
+}
+
+def make_backend(backend):
+   if isinstance(backend, str):
+      if backend not in NEIGHBOUR_BACKENDS:
+         raise ValueError(f"Unknown neighbour backend '{backend}', expected one of {list(NEIGHBOUR_BACKENDS)}")
+      return NEIGHBOUR_BACKENDS[backend]()
+   return backend
+
+def neighbour_recall(candidate, matrix, k=3, sample_size=200, seed=0):
+   """Fraction of the exact top-k neighbours that `candidate` also returns, over a sample of rows"""
+   if k <= 0 or sample_size <= 0:
+      raise ValueError("k and sample_size must be positive")
+   n = matrix.shape[0]
+   if n < 2:
+      return 1.0
+   exact = ExactNeighbourSearch()
+   exact.fit(matrix)
+
+   rng = np.random.default_rng(seed)
+   sample = rng.choice(n, size=min(sample_size, n), replace=False)
+   k = min(k, n - 1)
+   hits = 0
+   for row in sample.tolist():
+      expected, _ = exact.query(matrix[row], k, exclude=row)
+      found, _ = candidate.query(matrix[row], k, exclude=row)
+      hits += len(set(expected.tolist()) & set(found.tolist()))
+   return hits / (len(sample) * k)
@@ -0,0 +1,168 @@
+import argparse
+import json
+import mmap
+import os
+import shutil
+import time
+from datetime import datetime
+import numpy as np
+from event_catalog import to_json
+from log import get_logger
+
+log = get_logger("precompute")
+
+PRECOMPUTED_ENDPOINTS = ["matches", "events"]
+
+def write_precomputed(path, user_ids, neighbours, payloads, limit, k, matches_fingerprint=None):
+   """Write precomputed results as a directory of memory-mappable files.
+
+      meta.json         user order, creation time, limit, k and the upcoming-matches fingerprint
+      neighbours.npy    int32 (n, k) row indices of each user's neighbours, -1 padded
+      scores.npy        float16 (n, k) neighbour similarities
+      offsets.npy       int64 (n + 1) byte offsets of each user's record in payload.bin
+      payload.bin       concatenated UTF-8 JSON records {"matches": [...], "events": [...]}
+
+      The files go into a new `path`.<ns> directory and `path` is then switched to it as a symlink,
+      so a reader sees either the previous output or the complete new one.
+   """
+   tmp_path = f"{path}.{time.time_ns()}"
+   os.makedirs(tmp_path)
+
+   row_of = {user_id: i for i, user_id in enumerate(user_ids)}
+   neighbour_rows = np.full((len(user_ids), k), -1, dtype=np.int32)
+   neighbour_scores = np.zeros((len(user_ids), k), dtype=np.float16)
+   for i, user_id in enumerate(user_ids):
+      for j, (similar_id, score) in enumerate(neighbours.get(user_id, [])[:k]):
+         neighbour_rows[i, j] = row_of.get(similar_id, -1)
+         neighbour_scores[i, j] = score
+   np.save(os.path.join(tmp_path, "neighbours.npy"), neighbour_rows)
+   np.save(os.path.join(tmp_path, "scores.npy"), neighbour_scores)
+
+   offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+   with open(os.path.join(tmp_path, "payload.bin"), 'wb') as f:
+      for i, user_id in enumerate(user_ids):
+         data = json.dumps(payloads[user_id], ensure_ascii=False, separators=(',', ':'), default=to_json).encode('utf-8')
+         f.write(data)
+         offsets[i + 1] = offsets[i] + len(data)
+   np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+
+   with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+      json.dump({
+         "users": list(user_ids),
+         "created_at": datetime.now().isoformat(),
+         "limit": limit,
+         "k": k,
+         "endpoints": PRECOMPUTED_ENDPOINTS,
+         "matches_fingerprint": matches_fingerprint
+      }, f, ensure_ascii=False)
+
+   _swap(path, tmp_path)
+
+def _swap(path, target):
+   """Atomically point the symlink `path` at `target` (a sibling directory) and remove the old target"""
+   previous = os.path.realpath(path) if os.path.islink(path) else None
+   link = f"{path}.link"
+   if os.path.lexists(link):
+      os.remove(link)
+   os.symlink(os.path.basename(target), link)
+   if os.path.isdir(path) and not os.path.islink(path):
+      # output written as a plain directory by an older version; replaced non-atomically this once
+      shutil.rmtree(path)
+   os.replace(link, path)
+   if previous is not None and previous != os.path.realpath(target):
+      # servers that already mapped the old files keep reading them until they reload
+      shutil.rmtree(previous, ignore_errors=True)
+
+class PrecomputedRecommendations:
+   """Read-only, memory-mapped view of a precompute.py output directory with O(1) per-user lookups"""
+   def __init__(self, path):
+      self.path = path
+      with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+         meta = json.load(f)
+      self.user_ids = meta["users"]
+      self.rows = {user_id: i for i, user_id in enumerate(self.user_ids)}
+      self.created_at = datetime.fromisoformat(meta["created_at"])
+      self.limit = meta["limit"]
+      self.k = meta["k"]
+      self.endpoints = set(meta["endpoints"])
+      # UpcomingMatchesStore.fingerprint the matches were ranked from
+      self.matches_fingerprint = meta.get("matches_fingerprint")
+      self.neighbour_rows = np.load(os.path.join(path, "neighbours.npy"), mmap_mode='r')
+      self.neighbour_scores = np.load(os.path.join(path, "scores.npy"), mmap_mode='r')
+      self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+      self._file = open(os.path.join(path, "payload.bin"), 'rb')
+      size = os.fstat(self._file.fileno()).st_size
+      self.payload = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+   def __contains__(self, user_id):
+      return user_id in self.rows
+
+   def get(self, user_id):
+      """The stored record of a user ({"matches": [...], "events": [...]}) or None"""
+      row = self.rows.get(user_id)
+      if row is None:
+         return None
+      start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+      return json.loads(self.payload[start:end].decode('utf-8'))
+
+   def neighbours(self, user_id):
+      row = self.rows.get(user_id)
+      if row is None:
+         return []
+      return [
+         (self.user_ids[r], float(s))
+         for r, s in zip(self.neighbour_rows[row].tolist(), self.neighbour_scores[row].tolist()) if r >= 0
+      ]
+
+   def close(self):
+      if isinstance(self.payload, mmap.mmap):
+         self.payload.close()
+      self._file.close()
+
+def precompute(recommender, out_path, limit=10, k=3):
+   """Compute neighbours, ranked upcoming matches and events for every user with `recommender`"""
+   recommender._refresh_user_similarity()
+   user_ids = list(recommender.users.keys())
+   neighbours = recommender.similarity_index.neighbours_many(user_ids, k)
+
+   payloads = {}
+   for result in recommender.recommend_batch(user_ids, limit):
+      payloads[result["user_id"]] = {"matches": result["matches"], "events": []}
+   for user_id in user_ids:
+      try:
+         events = recommender._compute_event_recommendations(user_id, limit)
+         payloads[user_id]["events"] = events.get("recommended_events", []) if events else []
+      except Exception as e:
+         log.warning("precompute_events_failed", user_id=user_id, error=str(e))
+
+   match_store = recommender.match_store
+   write_precomputed(out_path, user_ids, neighbours, payloads, limit, k,
+                     match_store.fingerprint if match_store is not None else None)
+   return len(user_ids)
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Precompute recommendations for every user")
+   parser.add_argument("--database", default="user_clicks.json", help="profile store (.json or .db)")
+   parser.add_argument("--out", default="precomputed", help="output directory")
+   parser.add_argument("--limit", type=int, default=10, help="results stored per user and endpoint")
+   parser.add_argument("--k", type=int, default=3, help="neighbours stored per user")
+   parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes for the neighbour computation")
+   args = parser.parse_args()
+
+   from API import api, base_id
+   from catalog import Catalog
+   from match_store import UpcomingMatchesStore
+   from recommender import Recommender
+
+   start = time.perf_counter()
+   catalog = Catalog(api, base_id)
+   catalog.load()
+   match_store = UpcomingMatchesStore(api, base_id)
+   match_store.sync()
+   recommender = Recommender(args.database, catalog.sport_ids(), catalog.location_ids(), catalog=catalog, match_store=match_store,
+                              workers=args.workers)
+   try:
+      count = precompute(recommender, args.out, args.limit, args.k)
+   finally:
+      recommender.close()
+   print(f"Precomputed recommendations for {count} users into {args.out} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,112 @@
+import threading
+from datetime import datetime
+from event_history import compact_profile
+
+class ProfileRepository:
+   """Single in-process owner of user profiles, shared by ClickTracker and Recommender.
+
+      Profiles are loaded once from a ProfileStore and mutated in place, with their liked events
+      interned into the shared event catalog (event_history.compact_profile). save() stamps one
+      user's updated_at, persists it and notifies subscribers with (user_id, profile); update() does the
+      same for a read-modify-write that shared stores run in one transaction; reload()
+      notifies with (None, None), meaning every profile may have changed.
+
+      With load=False nothing is read until stream() is consumed, so a caller can process the
+      profiles (e.g. encode them) while the snapshot is still being parsed.
+   """
+   def __init__(self, store, load=True):
+      self.store = store
+      self.users = {}
+      self.loaded = False
+      self.subscribers = []
+      self.lock = threading.RLock()
+      if load:
+         for _ in self.stream():
+            pass
+
+   def stream(self):
+      """Load the store one profile at a time, yielding (user_id, profile) as each one is added to users"""
+      for user_id, profile in self.store.iter_all(self.users):
+         compact_profile(profile)
+         yield user_id, profile
+      self.loaded = True
+
+   @staticmethod
+   def _compact(users):
+      for profile in users.values():
+         compact_profile(profile)
+      return users
+
+   def __contains__(self, user_id):
+      return user_id in self.users
+
+   def __len__(self):
+      return len(self.users)
+
+   def subscribe(self, callback):
+      self.subscribers.append(callback)
+
+   def _notify(self, user_id, profile):
+      for callback in self.subscribers:
+         callback(user_id, profile)
+
+   def get(self, user_id):
+      """Return the live profile dict for user_id, or None"""
+      if self.store.shared:
+         # another worker may have updated this user since we loaded it
+         profile = self.store.get(user_id)
+         if profile is not None and compact_profile(profile) != self.users.get(user_id):
+            with self.lock:
+               self.users[user_id] = profile
+            self._notify(user_id, profile)
+      return self.users.get(user_id)
+
+   def put(self, user_id, profile):
+      """Replace a user's profile, persist it and notify subscribers"""
+      compact_profile(profile)
+      with self.lock:
+         self.users[user_id] = profile
+      self.save(user_id)
+
+   def save(self, user_id):
+      """Persist a profile that was mutated in place, stamping updated_at, and notify subscribers"""
+      profile = self.users[user_id]
+      with self.lock:
+         profile["updated_at"] = datetime.now().isoformat()
+         self.store.put(user_id, profile)
+      self._notify(user_id, profile)
+
+   def update(self, user_id, apply):
+      """Apply apply(profile or None) -> profile to the user's stored profile, stamp updated_at, persist and notify.
+
+         Shared stores re-read and write the profile in one transaction, so updates from other
+         workers between our last read and this write are kept.
+      """
+      def stamped(profile):
+         if profile is not None:
+            compact_profile(profile)
+         profile = compact_profile(apply(profile))
+         profile["updated_at"] = datetime.now().isoformat()
+         return profile
+
+      with self.lock:
+         if self.store.shared:
+            profile = self.store.update(user_id, stamped)
+         else:
+            profile = stamped(self.users.get(user_id))
+            self.store.put(user_id, profile)
+         self.users[user_id] = profile
+      self._notify(user_id, profile)
+      return profile
+
+   def reload(self):
+      with self.lock:
+         users = self._compact(self.store.load_all())
+         if users is not self.users:
+            self.users.clear()
+            self.users.update(users)
+      self._notify(None, None)
+
+   def compact(self):
+      with self.lock:
+         self.store.compact()
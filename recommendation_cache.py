@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict
+
+class RecommendationCache:
+   """LRU cache of recommendation results keyed by (user_id, endpoint, args).
+
+      Each entry remembers the neighbours it was computed from, so invalidating a user also drops
+      the results of every user that had them as a neighbour. A change of `data_version` (e.g. a
+      new upcoming-matches snapshot) drops everything. Recently requested keys are remembered so
+      a background worker can recompute them after invalidation.
+
+      Results are computed outside the lock, so get() also returns the current generation and
+      put() drops a value if its user, one of its neighbours or the whole cache was invalidated
+      after that generation was read. Only the latest `maxsize` per-user changes are remembered;
+      a value read before the oldest of them is dropped as if the whole cache had been cleared.
+   """
+   def __init__(self, maxsize=20000, active_window=900):
+      self.maxsize = maxsize
+      self.active_window = active_window
+      self.entries = OrderedDict()
+      self.keys_by_user = {}
+      self.dependents = {}
+      self.requested = {}
+      self.data_version = None
+      self.generation = 0
+      self.changed_at = OrderedDict()
+      self.cleared_at = 0
+      self.lock = threading.RLock()
+      self.hits = 0
+      self.misses = 0
+      self.invalidations = 0
+
+   def _check_version(self, data_version):
+      if data_version != self.data_version:
+         self._clear()
+         self.data_version = data_version
+
+   def get(self, user_id, endpoint, args, data_version):
+      key = (user_id, endpoint, args)
+      with self.lock:
+         self.requested[key] = time.monotonic()
+         self._check_version(data_version)
+         if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key], self.generation
+         self.misses += 1
+         return False, None, self.generation
+
+   def _stale(self, user_id, neighbour_ids, generation):
+      if self.cleared_at > generation or self.changed_at.get(user_id, 0) > generation:
+         return True
+      return any(self.changed_at.get(neighbour_id, 0) > generation for neighbour_id in neighbour_ids)
+
+   def put(self, user_id, endpoint, args, value, neighbour_ids, data_version, generation=None):
+      """Cache a result computed from the state seen at `generation` (as returned by get)"""
+      key = (user_id, endpoint, args)
+      with self.lock:
+         if data_version != self.data_version:
+            return
+         if generation is not None and self._stale(user_id, neighbour_ids, generation):
+            return
+         self.entries[key] = value
+         self.entries.move_to_end(key)
+         self.keys_by_user.setdefault(user_id, set()).add(key)
+         for neighbour_id in neighbour_ids:
+            self.dependents.setdefault(neighbour_id, set()).add(user_id)
+         while len(self.entries) > self.maxsize:
+            old_key, _ = self.entries.popitem(last=False)
+            self.keys_by_user.get(old_key[0], set()).discard(old_key)
+
+   def invalidate_user(self, user_id):
+      """Drop the results of user_id and of every user whose results used user_id as a neighbour"""
+      with self.lock:
+         self.generation += 1
+         self.changed_at[user_id] = self.generation
+         self.changed_at.move_to_end(user_id)
+         if len(self.changed_at) > self.maxsize:
+            self._prune_changes()
+         affected = {user_id} | self.dependents.pop(user_id, set())
+         for affected_id in affected:
+            for key in self.keys_by_user.pop(affected_id, ()):
+               if self.entries.pop(key, None) is not None:
+                  self.invalidations += 1
+
+   def _prune_changes(self):
+      # changed_at is ordered by generation; forget the older half and raise the floor to match
+      for _ in range(len(self.changed_at) // 2):
+         _, self.cleared_at = self.changed_at.popitem(last=False)
+
+   def _clear(self):
+      self.generation += 1
+      self.cleared_at = self.generation
+      self.changed_at.clear()
+      self.invalidations += len(self.entries)
+      self.entries.clear()
+      self.keys_by_user.clear()
+      self.dependents.clear()
+
+   def clear(self):
+      with self.lock:
+         self._clear()
+
+   def stale_active_keys(self, data_version=None):
+      """Keys requested within the active window that currently have no cached result under `data_version`"""
+      cutoff = time.monotonic() - self.active_window
+      with self.lock:
+         if data_version is not None:
+            self._check_version(data_version)
+         for key, requested_at in list(self.requested.items()):
+            if requested_at < cutoff:
+               del self.requested[key]
+         return [key for key in self.requested if key not in self.entries]
+
+   def stats(self):
+      with self.lock:
+         return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self.entries),
+            "active_keys": len(self.requested)
+         }
@@ -1,9 +1,23 @@
 from enum import Enum
-import json
-import pandas as pd
+import os
+import threading
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from API import api, base_id, get_similar_upcoming_matches, list_teams_records, list_sport_records
+from features import UserFeatureEncoder
+from event_times import upcoming_events
+from event_history import liked_events
+from similarity_index import UserSimilarityIndex
+from datetime import date, datetime, timedelta
+from API import api, base_id, get_similar_upcoming_matches, filter_matches
+from catalog import Catalog
+from storage import open_store
+from profiles import ProfileRepository
+from recommendation_cache import RecommendationCache
+from precompute import PrecomputedRecommendations
+from metrics import span, timed
+from log import get_logger
+from request_context import mark_incomplete, memoized, remember, request_scope
+
+log = get_logger("recommender")
 
 class EventType(Enum):
    MATCH = 1    
@@ -45,158 +59,332 @@ class Recommendation(Enum):
    MATCHES = 1
    EVENTS = 2
 
+def _resident_memory():
+   """Resident set size of this process in bytes, or None where /proc is unavailable"""
+   try:
+      with open('/proc/self/statm') as f:
+         return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+   except (OSError, ValueError, AttributeError):
+      return None
+
+def _last_change(profile):
+   """When a profile was last saved, or its newest liked-event click for profiles saved before updated_at"""
+   stamp = profile.get("updated_at")
+   if stamp is None:
+      history = profile.get("events_liked") or []
+      stamp = history[-1].get("timestamp") if history else None
+   try:
+      return datetime.fromisoformat(stamp)
+   except (TypeError, ValueError):
+      return None
+
+def _logo_url(team):
+   """A team record's first logo URL, or None for an unknown team or one without a logo"""
+   logos = team.get('fields', {}).get('Team Logo')
+   return logos[0]['url'] if logos else None
+
 class Recommender:
-   def __init__(self, database_path, sports_ids, location_ids):
+   # cache endpoint name -> compute method, used by the cache warmer
+   CACHED_ENDPOINTS = {
+      "homepage": "_compute_homepage_recommendations",
+      "sport": "_compute_sport_recommendations",
+      "events": "_compute_event_recommendations",
+      "tournaments": "_compute_tournament_recommendations",
+      "favorites": "_compute_user_favorites",
+      "matches": "_compute_real_time_match_recommendations",
+   }
+   
+   def __init__(self, database_path, sports_ids, location_ids, neighbour_backend="exact", catalog=None, match_store=None, store=None, profiles=None, workers=1,
+                feature_representation="auto"):
       self.database_path = database_path
-      with open(database_path, 'r', encoding='utf-8') as f:
-         self.database = json.load(f)
-      self.users = self.database.get('users', {})
-      self.user_ids = {user : i for i, user in enumerate(self.users.keys())}
+      self.catalog = catalog if catalog is not None else Catalog(api, base_id)
+      self.match_store = match_store
+      if profiles is None:
+         profiles = ProfileRepository(store if store is not None else open_store(database_path), load=False)
+      self.profiles = profiles
+      self.users = profiles.users
+      self.database = {"users": self.users}
       self.sports_ids = {sport: i for i, sport in enumerate(sports_ids)}
       self.sports_num = len(self.sports_ids)
-      self._build_user_similarity_matrix()
+      self.encoder = UserFeatureEncoder(self.sports_ids)
+      self.similarity_index = UserSimilarityIndex(self.encoder, neighbour_backend, workers,
+                                                  representation=feature_representation)
+      # an unloaded repository is encoded while its snapshot is still being read
+      self._build_user_similarity_matrix(None if profiles.loaded else profiles.stream())
+      self.recommendation_cache = RecommendationCache()
+      self._neighbour_ids = {}
+      self._warmer = None
+      self._warmer_stop = threading.Event()
+      self.precomputed = None
+      self._precomputed_path = None
+      self._precomputed_target = None
+      self._active_since_precompute = set()
+      profiles.subscribe(self._on_profile_change)
+
+   @property
+   def user_ids(self):
+      return self.similarity_index.user_ids
    
    def _load_database(self):
-      with open(self.database_path, 'r', encoding='utf-8') as f:
-         self.database = json.load(f)
-      self.users = self.database.get('users', {})
-      self.user_ids = {user : i for i, user in enumerate(self.users.keys())}
-      
-   def _encode_location(self, city, distict):
-      location = f"{city.lower()}_{distict.lower()}"
-      loc_hash = abs(hash(location)) % 1000 +1
-      return loc_hash / 10000
+      self.profiles.reload()
    
-   def _build_user_similarity_matrix(self):
-      """Build similarity matrix between users based on their profiles using fixed-length sport vectors"""
-      features = []
-      
-      for user_id in self.database['users'].keys():
-         user = self.users[user_id] 
-
-         age_feature = user.get('age', 'JUNIORS')
-         age_feature = AgeGroup[age_feature.upper()].value - 1 if age_feature in AgeGroup.__members__ else 0
-         
-         city = user.get('city', '').lower() if user.get('city') else ''
-         district = user.get('district', '').lower() if user.get('district') else ''
-         location_feature = self._encode_location(city, district)
-         
-         
-         sport_interests_vector = [0] * (self.sports_num)
-         sports_liked_vector = [0] * (self.sports_num)
-         team_sport_vector = [0] * (self.sports_num)
-         player_sports_vector = [0] * (self.sports_num)
-         training_sports_vector = [0] * (self.sports_num)
-         
-         for sport in user.get('sport_interests', []):
-            if sport in self.sports_ids:
-               sport_id = self.sports_ids[sport]
-               sport_interests_vector[sport_id] = 1
-         
-         for sport, count in user.get('sports_liked_count', {}).items():
-            if sport in self.sports_ids:
-               sport_id = self.sports_ids[sport]
-               sports_liked_vector[sport_id] = count
-         
-         for sport, count in user.get('team_liked_sport', {}).items():
-            if sport in self.sports_ids:
-               sport_id = self.sports_ids[sport]
-               team_sport_vector[sport_id] = count
-         
-         for sport, count in user.get('player_liked_sports_count', {}).items():
-            if sport in self.sports_ids:
-               sport_id = self.sports_ids[sport]
-               player_sports_vector[sport_id] = count
-      
-         for sport, count in user.get('training_sports_liked', {}).items():
-            if sport in self.sports_ids:
-               sport_id = self.sports_ids[sport]
-               training_sports_vector[sport_id] = count
-         
-         event_type_vector = [0] * len(EventType)
-         for event_type in user.get('event_type_priority', []):
-               event_id = EventType[event_type.upper()].value - 1  
-               event_type_vector[event_id] = 1
- 
-         event_liked_vector = [0] * (self.sports_num)
-         event_type_liked_vector = [0] * len(EventType)
-         
-         for event in user.get('events_liked', []):
-            event_sport = event.get('sport_id', '')
-            if event_sport in self.sports_ids:
-               sport_id = self.sports_ids[event_sport]
-               event_liked_vector[sport_id] += 1
-            
-            event_type = event.get('event_type', '')
-            try:
-               event_type_id = EventType[event_type.upper()].value - 1
-               event_type_liked_vector[event_type_id] += 1
-            except (KeyError, ValueError):
-               continue
-      
-         user_vector = [
-               age_feature,
-               location_feature
-         ]
-         
-         user_vector.extend(sport_interests_vector)
-         user_vector.extend(sports_liked_vector)
-         user_vector.extend(team_sport_vector)
-         user_vector.extend(player_sports_vector)
-         user_vector.extend(training_sports_vector)
-         user_vector.extend(event_type_vector)
-         user_vector.extend(event_liked_vector)
-         user_vector.extend(event_type_liked_vector)
-         
-         features.append(user_vector)
+   def _on_profile_change(self, user_id, profile):
+      if user_id is None:
+         # reloaded profiles that changed since the precompute run are caught by their updated_at
+         self.similarity_index.mark_all_dirty(self.users)
+         self.recommendation_cache.clear()
+      else:
+         self.similarity_index.mark_dirty(user_id)
+         self.recommendation_cache.invalidate_user(user_id)
+         self._active_since_precompute.add(user_id)
       
-      features_array = np.array(features)
-      self.user_similarity = cosine_similarity(features_array)
+   @timed("similarity_build")
+   def _build_user_similarity_matrix(self, users=None):
+      """Build similarity matrix between users based on their profiles using fixed-length sport vectors"""
+      if users is not None:
+         self.similarity_index.build(users)
+         return
+      with self.profiles.lock:
+         self.similarity_index.build(self.users)
+      
+   @timed("similarity_refresh")
+   def _refresh_user_similarity(self):
+      """Re-encode only the users that changed since the last refresh"""
+      # profiles are added and mutated under the repository lock (ClickTracker, ProfileRepository)
+      with self.profiles.lock:
+         self.similarity_index.refresh(self.users)
       
    def _get_similar_users(self, user_id, n=3):
-      """Get similar users based on similarity matrix - optimized version"""
-      if user_id not in self.user_ids:
-         return []
-      user_index = self.user_ids[user_id]
-         
-      similarities = self.user_similarity[user_index]
-      
-      idx_to_user = {idx: uid for uid, idx in self.user_ids.items()}
+      """Get the n most similar users from the neighbour index"""
+      self._refresh_user_similarity()
       
-      top_indices = np.argsort(similarities)[-n-1:][::-1]
+      with span("neighbour_lookup"):
+         neighbours = self.similarity_index.neighbours(user_id, n)
+      self._neighbour_ids[user_id] = [similar_id for similar_id, score in neighbours]
       
       similar_users = []
-      for idx in top_indices:
-         if idx != user_index and idx in idx_to_user:
-               similar_id = idx_to_user[idx]
-               profile = self.get_user_profile(similar_id)
-               if profile:
-                  similar_users.append(profile)
-                  if len(similar_users) >= n:
-                     break
+      for similar_id, score in neighbours:
+         profile = self.get_user_profile(similar_id)
+         if profile:
+            similar_users.append(profile)
       
       return similar_users
    
+   @property
+   def workers(self):
+      """Worker processes used for bulk neighbour computation (1 = in-process)"""
+      return self.similarity_index.workers
+   
+   @workers.setter
+   def workers(self, value):
+      self.similarity_index.workers = max(1, int(value))
+   
+   def memory_stats(self):
+      """Memory held by the similarity index plus the resident size of the whole process"""
+      stats = self.similarity_index.memory_usage()
+      stats["process_rss_bytes"] = _resident_memory()
+      return stats
+   
+   def neighbour_recall(self, k=3, sample_size=200, backend=None):
+      """Recall of the neighbour backend (or a candidate backend) against exact search"""
+      self._refresh_user_similarity()
+      return self.similarity_index.recall(k, sample_size, backend)
+   
    def update_user(self, user_id, user_data):
-      if user_id not in self.user_ids:
-         self.user_ids[user_id] = len(self.users)
-      user = self.get_user_profile(user_id)
-      self.users.update({"user_id": user_id, **user_data})     
-      self._build_user_similarity_matrix()
+      """Store the latest profile for a user; the repository notification schedules it for re-encoding"""
+      self.profiles.put(user_id, user_data)
+      remember("profile", user_id, user_data)
    
+   @timed("profile_load")
    def get_user_profile(self, user_id):
-      print(self.users)
-      if user_id in self.user_ids:
-         return self.users[user_id]
-      return None
+      log.debug("profile_load", user_id=user_id)
+      return memoized("profile", user_id, self.users.get)
+   
+   def _get_team(self, team_id, fetch=True):
+      if not fetch:
+         return self.catalog.get_team(team_id, fetch=False)
+      return memoized("team", team_id, self.catalog.get_team)
+   
+   def _get_sport(self, sport_id, fetch=True):
+      if not fetch:
+         return self.catalog.get_sport(sport_id, fetch=False)
+      return memoized("sport", sport_id, self.catalog.get_sport)
+   
+   def _data_version(self):
+      return self.match_store.version if self.match_store is not None else 0
+   
+   def _cached(self, endpoint, user_id, args, compute):
+      version = self._data_version()
+      found, value, generation = self.recommendation_cache.get(user_id, endpoint, args, version)
+      if found:
+         return value
+      value = self._from_precomputed(endpoint, user_id, args)
+      if value is None:
+         with request_scope() as context:
+            value = compute()
+         if context.incomplete:
+            return value
+      self.recommendation_cache.put(user_id, endpoint, args, value, self._neighbour_ids.get(user_id, ()), version,
+                                    generation)
+      return value
+   
+   async def _acached(self, endpoint, user_id, args, compute):
+      version = self._data_version()
+      found, value, generation = self.recommendation_cache.get(user_id, endpoint, args, version)
+      if found:
+         return value
+      value = self._from_precomputed(endpoint, user_id, args)
+      if value is None:
+         with request_scope() as context:
+            value = await compute()
+         if context.incomplete:
+            return value
+      self.recommendation_cache.put(user_id, endpoint, args, value, self._neighbour_ids.get(user_id, ()), version,
+                                    generation)
+      return value
+   
+   def load_precomputed(self, path):
+      """Serve matches/events from a precompute.py output for users that have not changed since.
+
+         A missing `path` is not an error: reload_precomputed (run by the cache warmer) loads it once
+         precompute.py has written it, and loads every later output it swaps in.
+      """
+      self._precomputed_path = path
+      if not os.path.isdir(path):
+         return
+      self._precomputed_target = os.path.realpath(path)
+      self.precomputed = PrecomputedRecommendations(path)
+      self._active_since_precompute = set()
+      self.recommendation_cache.clear()
+   
+   def reload_precomputed(self):
+      """Load the precompute output again if precompute.py has swapped in a new one since; True if it did"""
+      path = self._precomputed_path
+      if path is None or not os.path.isdir(path) or os.path.realpath(path) == self._precomputed_target:
+         return False
+      try:
+         self.load_precomputed(path)
+      except (OSError, ValueError, KeyError) as e:
+         log.warning("precomputed_reload_failed", path=path, error=str(e))
+         return False
+      log.info("precomputed_reloaded", path=path, users=len(self.precomputed.user_ids))
+      return True
+   
+   def _changed_since(self, user_id, precomputed):
+      """Whether a user's profile changed after `precomputed` was written, in this process or before it started"""
+      if user_id in self._active_since_precompute:
+         return True
+      profile = self.users.get(user_id)
+      changed_at = _last_change(profile) if profile else None
+      return changed_at is not None and changed_at > precomputed.created_at
+
+   def _from_precomputed(self, endpoint, user_id, args):
+      """Precomputed result of an endpoint, or None for new or changed users (and, for events, changed neighbours)"""
+      precomputed = self.precomputed
+      if precomputed is None or endpoint not in precomputed.endpoints:
+         return None
+      limit = args[-1]
+      if limit is None or limit > precomputed.limit or self._changed_since(user_id, precomputed):
+         return None
+      record = precomputed.get(user_id)
+      if record is None:
+         return None
+      if endpoint == "matches":
+         # ranked against other upcoming matches than the ones live now: recompute
+         if self.match_store is None or precomputed.matches_fingerprint != self.match_store.fingerprint:
+            return None
+         today = date.today().isoformat()
+         matches = [match for match in record["matches"] if (match.get("event_date") or "") > today]
+         # too many have already been played; a live query also picks up matches added since
+         return matches[:limit] if len(matches) >= limit else None
+      neighbour_ids = [similar_id for similar_id, score in precomputed.neighbours(user_id)]
+      if any(self._changed_since(similar_id, precomputed) for similar_id in neighbour_ids):
+         return None
+      # the cached result then depends on the precomputed neighbours
+      self._neighbour_ids[user_id] = neighbour_ids
+      return {"recommended_events": record["events"][:limit]}
    
    def get_homepage_recommendations(self, user_id, limit=10):
-      self._build_user_similarity_matrix()
-      print(user_id)
+      return self._cached("homepage", user_id, (limit,), lambda: self._compute_homepage_recommendations(user_id, limit))
+   
+   async def aget_homepage_recommendations(self, user_id, airtable, limit=10):
+      return await self._acached("homepage", user_id, (limit,),
+                                 lambda: self._acompute_homepage_recommendations(user_id, airtable, limit))
+   
+   def get_sport_recommendations(self, user_id, sport_name, limit=5):
+      return self._cached("sport", user_id, (sport_name, limit),
+                          lambda: self._compute_sport_recommendations(user_id, sport_name, limit))
+   
+   def get_event_recommendations(self, user_id, limit=5):
+      return self._cached("events", user_id, (limit,), lambda: self._compute_event_recommendations(user_id, limit))
+   
+   def get_tournament_recommendations(self, user_id, limit=5):
+      return self._cached("tournaments", user_id, (limit,), lambda: self._compute_tournament_recommendations(user_id, limit))
+   
+   def get_user_favorites(self, user_id, limit=5):
+      return self._cached("favorites", user_id, (limit,), lambda: self._compute_user_favorites(user_id, limit))
+   
+   def get_real_time_match_recommendations(self, user_id, limit=5):
+      return self._cached("matches", user_id, (limit,), lambda: self._compute_real_time_match_recommendations(user_id, limit))
+   
+   async def aget_real_time_match_recommendations(self, user_id, airtable, limit=5):
+      return await self._acached("matches", user_id, (limit,),
+                                 lambda: self._acompute_real_time_match_recommendations(user_id, airtable, limit))
+   
+   def warm_cache(self):
+      """Recompute the results of recently requested (user, endpoint) pairs that were invalidated.
+
+         Results are computed and put() directly rather than through the public get_* methods, so
+         warming does not count as a request and a key still ages out of the active window.
+      """
+      cache = self.recommendation_cache
+      version = self._data_version()
+      warmed = 0
+      for user_id, endpoint, args in cache.stale_active_keys(version):
+         if user_id not in self.users:
+            continue
+         generation = cache.generation
+         try:
+            value = self._from_precomputed(endpoint, user_id, args)
+            if value is None:
+               with request_scope() as context:
+                  value = getattr(self, self.CACHED_ENDPOINTS[endpoint])(user_id, *args)
+               if context.incomplete:
+                  continue
+            cache.put(user_id, endpoint, args, value, self._neighbour_ids.get(user_id, ()), version, generation)
+            warmed += 1
+         except Exception as e:
+            log.warning("cache_warmup_failed", user_id=user_id, endpoint=endpoint, error=str(e))
+      return warmed
+   
+   def start_cache_warmer(self, interval=30):
+      if self._warmer is not None:
+         return
+      self._warmer_stop.clear()
+      self._warmer = threading.Thread(target=self._warm_loop, args=(interval,), name="recommendation-warmer", daemon=True)
+      self._warmer.start()
+   
+   def stop_cache_warmer(self):
+      self._warmer_stop.set()
+      self._warmer = None
+   
+   def close(self):
+      """Stop the cache warmer and the similarity index's worker processes"""
+      self.stop_cache_warmer()
+      self.similarity_index.close()
+   
+   def _warm_loop(self, interval):
+      while not self._warmer_stop.wait(interval):
+         self.reload_precomputed()
+         self.warm_cache()
+   
+   def _compute_homepage_recommendations(self, user_id, limit=10):
+      self._refresh_user_similarity()
       user = self.get_user_profile(user_id)
       
       similar_users = self._get_similar_users(user_id)
-      print(f"Similar user : {similar_users}")
+      log.debug("homepage_neighbours", user_id=user_id,
+                similar_user_ids=lambda: [similar.get('user_id') for similar in similar_users])
       recommendations = {
          "favorite_sports": self._get_favorite_sports(user, limit),
          "upcoming_events": self._get_upcoming_events(user, similar_users, limit),
@@ -205,7 +393,21 @@ class Recommender:
       
       return recommendations
    
-   def get_sport_recommendations(self, user_id, sport_name, limit=5):
+   async def _acompute_homepage_recommendations(self, user_id, airtable, limit=10):
+      """Async variant of _compute_homepage_recommendations using an AsyncAirtable client"""
+      self._refresh_user_similarity()
+      user = self.get_user_profile(user_id)
+      
+      similar_users = self._get_similar_users(user_id)
+      recommendations = {
+         "favorite_sports": self._get_favorite_sports(user, limit),
+         "upcoming_events": await self._aget_upcoming_events(user, similar_users, airtable, limit),
+         "recommended_teams": self._get_recommended_teams(user, similar_users, limit, fetch=False)
+      }
+      
+      return recommendations
+   
+   def _compute_sport_recommendations(self, user_id, sport_name, limit=5):
       user = self.get_user_profile(user_id)
       
       similar_users = self._get_similar_users(user_id)
@@ -224,7 +426,7 @@ class Recommender:
       
       return recommendations
    
-   def get_event_recommendations(self, user_id, limit=5):
+   def _compute_event_recommendations(self, user_id, limit=5):
       """Get recommendations for the events page"""
       user = self.get_user_profile(user_id)
       if not user:
@@ -238,7 +440,7 @@ class Recommender:
       
       return recommendations
    
-   def get_tournament_recommendations(self, user_id, limit=5):
+   def _compute_tournament_recommendations(self, user_id, limit=5):
       """Get tournament recommendations"""
       user = self.get_user_profile(user_id)
       if not user:
@@ -270,7 +472,8 @@ class Recommender:
       
       return []
          
-   def _get_recommended_teams(self, user, similar_users, limit=5):
+   @timed("enrichment")
+   def _get_recommended_teams(self, user, similar_users, limit=5, fetch=True):
       """Get recommended teams based on user preferences and similar users"""
       user_teams = set(user.get('teams_liked', []))
       
@@ -298,7 +501,7 @@ class Recommender:
       for team_info in unique_teams[:limit]:
          team_id = team_info['team']
          try:
-               team_record = list_teams_records(api, base_id, team_id)
+               team_record = self._get_team(team_id, fetch)
                if team_record and 'fields' in team_record:
                   team_info['name'] = team_record['fields'].get('Team Name', 'Unknown Team')
                   if 'Team Logo' in team_record['fields'] and team_record['fields']['Team Logo']:
@@ -343,13 +546,13 @@ class Recommender:
       all_events = []
       
       if 'events_liked' in user:
-         for event in user.get('events_liked', []):
+         for event in liked_events(user):
                if event.get('event_sport') == sport_id:
                   all_events.append(event)
       
       for similar_user in similar_users:
          if 'events_liked' in similar_user:
-               for event in similar_user.get('events_liked', []):
+               for event in liked_events(similar_user):
                   if event.get('event_sport') == sport_id:
                      all_events.append(event)
       
@@ -360,14 +563,7 @@ class Recommender:
                unique_events[event_id] = event
       
       events_list = list(unique_events.values())
-      sorted_events = sorted(events_list, 
-                           key=lambda x: pd.to_datetime(x.get('event_date', '1/1/2000'), format='%m/%d/%Y'))
-      
-      today = pd.Timestamp.now()
-      upcoming = [e for e in sorted_events if pd.to_datetime(e.get('event_date', '1/1/2000'), 
-                                                            format='%m/%d/%Y') > today]
-      
-      return upcoming[:limit]
+      return upcoming_events(events_list, limit)
    
    def _get_training_by_sport(self, user, similar_users, sport_id, limit=5):
       """Get training opportunities for a specific sport"""
@@ -404,18 +600,11 @@ class Recommender:
       events = []
       
       if 'events_liked' in user:
-         for event in user.get('events_liked', []):
+         for event in liked_events(user):
                if event.get('event_sport') in favorite_sports:
                   events.append(event)
       
-      sorted_events = sorted(events, 
-                           key=lambda x: pd.to_datetime(x.get('event_date', '1/1/2000'), format='%m/%d/%Y'))
-      
-      today = pd.Timestamp.now()
-      upcoming = [e for e in sorted_events if pd.to_datetime(e.get('event_date', '1/1/2000'), 
-                                                            format='%m/%d/%Y') > today]
-      
-      return upcoming[:limit]
+      return upcoming_events(events, limit)
    
    def _get_events_by_type(self, user, similar_users, event_type, limit=5):
       """Get events by their type (tournament, match, etc.)"""
@@ -423,22 +612,17 @@ class Recommender:
       
       all_events = []
       if 'events_liked' in user:
-         all_events.extend(user.get('events_liked', []))
+         all_events.extend(liked_events(user))
       
       for similar_user in similar_users:
          if 'events_liked' in similar_user:
-               all_events.extend(similar_user.get('events_liked', []))
+               all_events.extend(liked_events(similar_user))
       
       for event in all_events:
          if event.get('event_type') == event_type:
                type_events.append(event)
       
-      sorted_events = sorted(type_events, 
-                           key=lambda x: pd.to_datetime(x.get('event_date', '1/1/2000'), format='%m/%d/%Y'))
-      
-      today = pd.Timestamp.now()
-      upcoming = [e for e in sorted_events if pd.to_datetime(e.get('event_date', '1/1/2000'), 
-                                                            format='%m/%d/%Y') > today]
+      upcoming = upcoming_events(type_events)
       
       unique_events = {}
       for event in upcoming:
@@ -448,7 +632,7 @@ class Recommender:
       
       return list(unique_events.values())[:limit]
    
-   def get_user_favorites(self, user_id, limit=5):
+   def _compute_user_favorites(self, user_id, limit=5):
       user = self.get_user_profile(user_id)
       if not user:
          return {}
@@ -460,88 +644,110 @@ class Recommender:
       }
       
       if 'events_liked' in user:
-         events = user['events_liked']
-         sorted_events = sorted(events, 
-                                 key=lambda x: pd.to_datetime(x.get('event_date', '1/1/2000'), format='%m/%d/%Y'))
-         
-         today = pd.Timestamp.now()
-         upcoming = [e for e in sorted_events if pd.to_datetime(e.get('event_date', '1/1/2000'), 
-                                                               format='%m/%d/%Y') > today]
-         favorites["events"] = upcoming[:limit]
+         favorites["events"] = upcoming_events(liked_events(user), limit)
       
       return favorites
    
    def _get_upcoming_events(self, user, similar_users, limit=5):
       """Get upcoming events based on user preferences and similar users"""
+      all_events = self._get_liked_events(user, similar_users)
+      try:
+         query = self._upcoming_events_query(user)
+         if query is not None:
+            api_matches = self._fetch_upcoming_matches(query)
+            all_events.extend(self._format_upcoming_event(match) for match in api_matches)
+      except (KeyError, IndexError, TypeError) as e:
+         # a malformed match record: keep the liked events rather than dropping the section
+         log.warning("upcoming_events_failed", user_id=user.get('user_id'), error=str(e))
+         mark_incomplete()
+      
+      return all_events[:limit]
+   
+   async def _aget_upcoming_events(self, user, similar_users, airtable, limit=5):
+      """Async variant of _get_upcoming_events; team/sport lookups for all matches are fetched concurrently"""
+      all_events = self._get_liked_events(user, similar_users)
+      try:
+         query = self._upcoming_events_query(user)
+         if query is not None:
+            api_matches = await self._afetch_upcoming_matches(query, airtable)
+            await airtable.prefetch_match_entities(self.catalog, api_matches)
+            # anything the prefetch could not resolve is not looked up again on the event loop
+            all_events.extend(self._format_upcoming_event(match, fetch=False) for match in api_matches)
+      except (KeyError, IndexError, TypeError) as e:
+         log.warning("upcoming_events_failed", user_id=user.get('user_id'), error=str(e))
+         mark_incomplete()
+      
+      return all_events[:limit]
+   
+   @timed("match_fetch")
+   def _fetch_upcoming_matches(self, query):
+      """Upcoming matches from the local store when one is attached, otherwise straight from Airtable"""
+      if self.match_store is not None:
+         return self.match_store.get_similar_upcoming_matches(**query)
+      return get_similar_upcoming_matches(api, base_id, **query)
+   
+   @timed("match_fetch")
+   async def _afetch_upcoming_matches(self, query, airtable):
+      if self.match_store is not None:
+         return self.match_store.get_similar_upcoming_matches(**query)
+      return await airtable.get_similar_upcoming_matches(**query)
+   
+   def _get_liked_events(self, user, similar_users):
       all_events = []
-      print(f"user : {user}")
+      log.debug("liked_events", user_id=lambda: user.get('user_id'), liked=lambda: len(user.get('events_liked', [])))
       if 'events_liked' in user:
-         all_events.extend(user['events_liked'])
+         all_events.extend(liked_events(user))
       
       for similar_user in similar_users:
          if 'events_liked' in similar_user:
-               all_events.extend(similar_user['events_liked'])
-      
-     
-      try:
-         if 'sports_liked_count' in user:
-            if 'sport_interests' in user:
-               favorite_sports = user['sport_interests'][:3]
-            else:
-               favorite_sports = sorted(user['sports_liked_count'].items(), key=lambda x: x[1], reverse=True)
-               favorite_sports = [sport for sport, count in favorite_sports[:3]] 
-            
-            favorite_teams = user.get('teams_liked', [])[:10]
-            
-            api_matches = get_similar_upcoming_matches(
-                  api, 
-                  base_id,
-                  sport_id=favorite_sports if favorite_sports else None,
-                  team_id=favorite_teams if favorite_teams else None,
-                  days_ahead=7
-            )
-            
-            for match in api_matches:
-               fields = match.get('fields', {})
-               
-               print(f"fields : {fields}")
-               
-               home_team = fields.get('Home Team', [''])[0] if fields.get('Home Team') else None
-               away_team = fields.get('Away Team', [''])[0] if fields.get('Away Team') else None
-               
-               home_team_data  = list_teams_records(
-                  api, base_id, team_id=home_team
-               )
-               
-               away_team_data  = list_teams_records(
-                  api, base_id, team_id=away_team
-               )
-               
-               event = {
-                  "event_id": match.get('id', ''),
-                  "event_type": "MATCH",
-                  "event_date": fields.get('Match Date', ''),
-                  "sport_id": fields.get('Sport', [''])[0] if fields.get('Sport') else None,
-                  "home_team_id": home_team,
-                  "home_team_logo" : home_team_data['fields']['Team Logo'][0]['url'],
-                  "away_team_id": away_team,
-                  "away_team_logo" : away_team_data['fields']['Team Logo'][0]['url'],
-                  "location_id": fields.get('Location', [''])[0] if fields.get('Location') else '',
-                  "from_api": True ,
-                  "kategorija" : fields.get('Kategorija', ['']) if fields.get('Kategorija') else None
-               }
-               all_events.append(event)
-      except:
-         return []
+               all_events.extend(liked_events(similar_user))
+      return all_events
+   
+   def _upcoming_events_query(self, user):
+      """Arguments for get_similar_upcoming_matches on the homepage, or None if the user has no click history"""
+      if 'sports_liked_count' not in user:
+         return None
+      if 'sport_interests' in user:
+         favorite_sports = user['sport_interests'][:3]
+      else:
+         favorite_sports = sorted(user['sports_liked_count'].items(), key=lambda x: x[1], reverse=True)
+         favorite_sports = [sport for sport, count in favorite_sports[:3]] 
       
-      return all_events[:limit]
+      favorite_teams = user.get('teams_liked', [])[:10]
+      return {
+         "sport_id": favorite_sports if favorite_sports else None,
+         "team_id": favorite_teams if favorite_teams else None,
+         "days_ahead": 7
+      }
+   
+   @timed("enrichment")
+   def _format_upcoming_event(self, match, fetch=True):
+      fields = match.get('fields', {})
+      
+      log.debug("upcoming_match", sample_rate=0.1, match_id=match.get('id'), fields=fields)
+      
+      home_team = fields.get('Home Team', [''])[0] if fields.get('Home Team') else None
+      away_team = fields.get('Away Team', [''])[0] if fields.get('Away Team') else None
+      
+      home_team_data = self._get_team(home_team, fetch) or {}
+      away_team_data = self._get_team(away_team, fetch) or {}
+      
+      return {
+         "event_id": match.get('id', ''),
+         "event_type": "MATCH",
+         "event_date": fields.get('Match Date', ''),
+         "sport_id": fields.get('Sport', [''])[0] if fields.get('Sport') else None,
+         "home_team_id": home_team,
+         "home_team_logo" : _logo_url(home_team_data),
+         "away_team_id": away_team,
+         "away_team_logo" : _logo_url(away_team_data),
+         "location_id": fields.get('Location', [''])[0] if fields.get('Location') else '',
+         "from_api": True ,
+         "kategorija" : fields.get('Kategorija', ['']) if fields.get('Kategorija') else None
+      }
 
-   def get_real_time_match_recommendations(self, user_id, limit=5):
-      self._build_user_similarity_matrix()
-      user = self.get_user_profile(user_id)
-      if not user:
-         return []
-      
+   def _real_time_match_queries(self, user):
+      """Successively wider get_similar_upcoming_matches queries, tried in order until one returns matches"""
       favorite_sports = []
       if 'sport_interests' in user:
          favorite_sports = user['sport_interests'][:3]
@@ -551,84 +757,157 @@ class Recommender:
       
       favorite_teams = user.get('teams_liked', [])[:5]  # Top 5 teams
       
-      matches = get_similar_upcoming_matches(
-         api, 
-         base_id,
-         sport_id=favorite_sports if favorite_sports else None,
-         team_id=favorite_teams if favorite_teams else None,
-         days_ahead=20 
-      )
-      
-      if not matches and favorite_sports:
-         matches = get_similar_upcoming_matches(
-            api,
-            base_id,
-            sport_id=favorite_sports,
-            days_ahead=7
-         )
+      queries = [{
+         "sport_id": favorite_sports if favorite_sports else None,
+         "team_id": favorite_teams if favorite_teams else None,
+         "days_ahead": 20
+      }]
+      if favorite_sports:
+         queries.append({"sport_id": favorite_sports, "days_ahead": 7})
+      queries.append({"days_ahead": 5})
+      return queries
+
+   def _compute_real_time_match_recommendations(self, user_id, limit=5):
+      self._refresh_user_similarity()
+      user = self.get_user_profile(user_id)
+      if not user:
+         return []
       
-      if not matches:
-         matches = get_similar_upcoming_matches(
-            api,
-            base_id,
-            days_ahead=5
-         )
+      matches = []
+      for query in self._real_time_match_queries(user):
+         matches = self._fetch_upcoming_matches(query)
+         if matches:
+            break
       
-      formatted_matches = []
-      for match in matches[:limit]:
-         fields = match.get('fields', {})
-         
-         home_team_id = fields.get('Home Team', [''])[0] if fields.get('Home Team') else ''
-         away_team_id = fields.get('Away Team', [''])[0] if fields.get('Away Team') else ''
-         home_team_name = "Unknown Team"
-         away_team_name = "Unknown Team"
-         home_team_logo = None
-         away_team_logo = None
+      return [self._format_match(match) for match in matches[:limit]]
+   
+   async def _acompute_real_time_match_recommendations(self, user_id, airtable, limit=5):
+      """Async variant of _compute_real_time_match_recommendations using an AsyncAirtable client"""
+      self._refresh_user_similarity()
+      user = self.get_user_profile(user_id)
+      if not user:
+         return []
+      
+      matches = []
+      for query in self._real_time_match_queries(user):
+         matches = await self._afetch_upcoming_matches(query, airtable)
+         if matches:
+            break
+      
+      matches = matches[:limit]
+      await airtable.prefetch_match_entities(self.catalog, matches)
+      return [self._format_match(match, fetch=False) for match in matches]
+   
+   def recommend_batch(self, user_ids, limit=5, chunk_size=1024):
+      """Real-time match recommendations for many users, yielded one user at a time.
 
-         try:
-            if home_team_id:
-                  home_team_info = list_teams_records(api, base_id, home_team_id)
-                  home_team_name = home_team_info.get('fields', {}).get('Team Name', 'Unknown Team')
-                  if 'Team Logo' in home_team_info.get('fields', {}) and home_team_info['fields']['Team Logo']:
-                     home_team_logo = home_team_info['fields']['Team Logo'][0]['url']
-            if away_team_id:
-                  away_team_info = list_teams_records(api, base_id, away_team_id)
-                  away_team_name = away_team_info.get('fields', {}).get('Team Name', 'Unknown Team')
-                  if 'Team Logo' in away_team_info.get('fields', {}) and away_team_info['fields']['Team Logo']:
-                     away_team_logo = away_team_info['fields']['Team Logo'][0]['url']
-         except Exception:
-            pass
-         
-         sport_id = fields.get('Sport', [''])[0] if fields.get('Sport') else ''
-         sport_name = "Unknown Sport"
-         
-         try:
-            if sport_id:
-                  sport_info = list_sport_records(api, base_id, sport_id)
-                  sport_name = sport_info.get('fields', {}).get('Sport Name', 'Unknown Sport')
-         except Exception:
-            pass
-         
-         formatted_match = {
-            "event_id": match.get('id', ''),
-            "event_type": "MATCH",
-            "event_time": fields.get('Match Time', ''),
-            "event_date": fields.get('Match Date', ''),
-            "sport_id": sport_id,
-            "sport_name": sport_name,
-            "home_team_id": home_team_id,
-            "away_team_id": away_team_id,
-            "home_team": home_team_name,
-            "away_team": away_team_name,
-            "home_team_logo": home_team_logo,	
-            "away_team_logo": away_team_logo,
-            "location_id": fields.get('Location', [''])[0] if fields.get('Location') else '',
-            "is_recommended": True
-         }
-         
-         formatted_matches.append(formatted_match)
+         Neighbours are computed per chunk of users with batched matrix products, the upcoming
+         matches are fetched once for the whole batch and every distinct match is formatted once.
+      """
+      if chunk_size <= 0:
+         raise ValueError("chunk_size must be positive")
+      self._refresh_user_similarity()
+      fetch = self._shared_match_fetcher()
+      version = self._data_version()
+      formatted = {}
+      
+      for start in range(0, len(user_ids), chunk_size):
+         generation = self.recommendation_cache.generation
+         chunk = user_ids[start:start + chunk_size]
+         neighbours = self.similarity_index.neighbours_many(chunk, 3)
+         for user_id in chunk:
+            user = self.users.get(user_id)
+            if not user:
+               yield {"user_id": user_id, "matches": [], "similar_users": [], "error": "User not found"}
+               continue
+            
+            matches = []
+            for query in self._real_time_match_queries(user):
+               matches = fetch(query)
+               if matches:
+                  break
+            
+            result = []
+            for match in matches[:limit]:
+               match_id = match.get('id', '')
+               if match_id not in formatted:
+                  formatted[match_id] = self._format_match(match)
+               result.append(formatted[match_id])
+            
+            neighbour_ids = [similar_id for similar_id, score in neighbours[user_id]]
+            self._neighbour_ids[user_id] = neighbour_ids
+            self.recommendation_cache.put(user_id, "matches", (limit,), result, neighbour_ids, version, generation)
+            yield {"user_id": user_id, "matches": result, "similar_users": neighbour_ids}
+   
+   def _shared_match_fetcher(self):
+      """A query -> matches function that serves a whole batch from a single upcoming-matches fetch"""
+      if self.match_store is not None:
+         return lambda query: self.match_store.get_similar_upcoming_matches(**query)
+      
+      max_days = max(query["days_ahead"] for query in self._real_time_match_queries({}))
+      records = get_similar_upcoming_matches(api, base_id, days_ahead=max_days)
+      today = date.today()
+      
+      def fetch(query):
+         end_date = (today + timedelta(days=query["days_ahead"])).isoformat()
+         window = [match for match in records if match['fields'].get('Match Date', '') < end_date]
+         if not window:
+            return []
+         return filter_matches(window, sport_id=query.get("sport_id"), team_id=query.get("team_id"))
+      return fetch
+   
+   @timed("enrichment")
+   def _format_match(self, match, fetch=True):
+      """A match as returned by the API; with fetch=False teams and sports missing from the catalog stay unknown"""
+      fields = match.get('fields', {})
+      
+      home_team_id = fields.get('Home Team', [''])[0] if fields.get('Home Team') else ''
+      away_team_id = fields.get('Away Team', [''])[0] if fields.get('Away Team') else ''
+      home_team_name = "Unknown Team"
+      away_team_name = "Unknown Team"
+      home_team_logo = None
+      away_team_logo = None
+
+      try:
+         if home_team_id:
+               home_team_info = self._get_team(home_team_id, fetch) or {}
+               home_team_name = home_team_info.get('fields', {}).get('Team Name', 'Unknown Team')
+               if 'Team Logo' in home_team_info.get('fields', {}) and home_team_info['fields']['Team Logo']:
+                  home_team_logo = home_team_info['fields']['Team Logo'][0]['url']
+         if away_team_id:
+               away_team_info = self._get_team(away_team_id, fetch) or {}
+               away_team_name = away_team_info.get('fields', {}).get('Team Name', 'Unknown Team')
+               if 'Team Logo' in away_team_info.get('fields', {}) and away_team_info['fields']['Team Logo']:
+                  away_team_logo = away_team_info['fields']['Team Logo'][0]['url']
+      except Exception:
+         pass
+      
+      sport_id = fields.get('Sport', [''])[0] if fields.get('Sport') else ''
+      sport_name = "Unknown Sport"
       
-      return formatted_matches
+      try:
+         if sport_id:
+               sport_info = self._get_sport(sport_id, fetch) or {}
+               sport_name = sport_info.get('fields', {}).get('Sport Name', 'Unknown Sport')
+      except Exception:
+         pass
+      
+      return {
+         "event_id": match.get('id', ''),
+         "event_type": "MATCH",
+         "event_time": fields.get('Match Time', ''),
+         "event_date": fields.get('Match Date', ''),
+         "sport_id": sport_id,
+         "sport_name": sport_name,
+         "home_team_id": home_team_id,
+         "away_team_id": away_team_id,
+         "home_team": home_team_name,
+         "away_team": away_team_name,
+         "home_team_logo": home_team_logo,	
+         "away_team_logo": away_team_logo,
+         "location_id": fields.get('Location', [''])[0] if fields.get('Location') else '',
+         "is_recommended": True
+      }
    
 
 from typing import List
@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from metrics import registry
+from log import get_logger
+
+log = get_logger("request_context")
+
+registry.describe("recommenda_memo_lookups_total", "Profile and record lookups made through a request context")
+registry.describe("recommenda_memo_saved_total", "Lookups answered from the request context instead of being repeated")
+
+class RequestContext:
+   """Memoizes profile and upstream record lookups for the lifetime of one request.
+
+      Values are keyed by (kind, id), so each distinct ID is resolved at most once per request;
+      `saved` counts the lookups that were answered from the memo. `incomplete` is set when an
+      upstream lookup failed and a result was built without it, so it should not be cached.
+   """
+   def __init__(self):
+      self.values = {}
+      self.lookups = 0
+      self.saved = 0
+      self.incomplete = False
+
+   def get(self, kind, key, fetch):
+      self.lookups += 1
+      memo_key = (kind, key)
+      if memo_key in self.values:
+         self.saved += 1
+         return self.values[memo_key]
+      value = self.values[memo_key] = fetch(key)
+      return value
+
+   def remember(self, kind, key, value):
+      self.values[(kind, key)] = value
+
+   def stats(self):
+      return {"lookups": self.lookups, "saved": self.saved, "distinct": len(self.values)}
+
+_current = ContextVar("request_context", default=None)
+
+def current_context():
+   return _current.get()
+
+@contextmanager
+def request_scope():
+   """Enter a request context, or reuse the one already active so nested calls share the memo"""
+   context = _current.get()
+   if context is not None:
+      yield context
+      return
+   context = RequestContext()
+   token = _current.set(context)
+   try:
+      yield context
+   finally:
+      _current.reset(token)
+      registry.inc("recommenda_memo_lookups_total", amount=context.lookups)
+      registry.inc("recommenda_memo_saved_total", amount=context.saved)
+      log.debug("request_memo", **context.stats())
+
+def memoized(kind, key, fetch):
+   """fetch(key), memoized in the active request context (a plain call outside of one)"""
+   context = _current.get()
+   if context is None:
+      return fetch(key)
+   return context.get(kind, key, fetch)
+
+def mark_incomplete():
+   """Flag the active request's results as built around a failed upstream lookup"""
+   context = _current.get()
+   if context is not None:
+      context.incomplete = True
+
+def remember(kind, key, value):
+   context = _current.get()
+   if context is not None:
+      context.remember(kind, key, value)
@@ -0,0 +1,350 @@
+import threading
+import numpy as np
+import scipy.sparse as sp
+from neighbours import ExactNeighbourSearch, dot_rows, make_backend, make_pool, neighbour_recall, parallel_top_k
+
+class UserSimilarityIndex:
+   """Persistent, row-normalized user feature matrix with a pluggable neighbour-search backend.
+
+      Only users marked dirty are re-encoded on refresh; their rows are rewritten in place and
+      the backend is told which rows changed. No N x N similarity matrix is ever materialized:
+      besides the float32 features only a top-k neighbour table is kept (int32 rows, float16
+      scores, -1 padded), patched on refresh for the rows whose neighbours could have changed.
+
+      Features are kept as a CSR matrix when the encoding is wide and mostly zeros ("auto"
+      decides at build time from the encoded density), otherwise as a dense array.
+
+      With workers > 1 large top-k queries run on a process pool that is started on first use
+      and kept until close().
+   """
+   # below this many query rows a process pool costs more than it saves
+   PARALLEL_MIN_ROWS = 4096
+
+   # float16 rounding slack when deciding whether a changed row may enter a cached top-k
+   TABLE_SLACK = 1e-3
+
+   # "auto" keeps features sparse only for at least this many columns at most this density
+   SPARSE_MIN_DIM = 256
+   SPARSE_MAX_DENSITY = 0.05
+
+   # profiles encoded per batch when building from a stream of (user_id, profile) pairs
+   STREAM_BATCH = 4096
+
+   def __init__(self, encoder, backend="exact", workers=1, table_k=3, representation="auto"):
+      if representation not in ("auto", "dense", "sparse"):
+         raise ValueError(f"Unknown representation '{representation}', expected 'auto', 'dense' or 'sparse'")
+      self.encoder = encoder
+      self.backend = make_backend(backend)
+      self.workers = workers
+      self.table_k = table_k
+      self.table_rows = None
+      self.table_scores = None
+      self.representation = representation
+      self.sparse = representation == "sparse"
+      self.user_ids = {}
+      self.row_users = []
+      self.features = None
+      self.normalized = None
+      self.dirty = set()
+      self.lock = threading.RLock()
+      self._pool = None
+      self._pool_workers = None
+
+   def __len__(self):
+      return len(self.row_users)
+
+   def build(self, users):
+      """Encode every user and fit the neighbour backend.
+
+         `users` is a dict, or an iterable of (user_id, profile) pairs that is encoded in batches as
+         it is consumed (e.g. ProfileRepository.stream()); a user repeated in the stream keeps its
+         first encoding and is marked dirty for the next refresh.
+      """
+      with self.lock:
+         if isinstance(users, dict):
+            self._build(users)
+         else:
+            self._build_stream(users)
+
+   def _build(self, users):
+      self.user_ids = {user_id: i for i, user_id in enumerate(users.keys())}
+      self.row_users = list(users.keys())
+      self.dirty = set()
+      if not users:
+         self._clear()
+         return
+      self._fit(self._encode_features(users))
+
+   def _build_stream(self, pairs):
+      self.user_ids = {}
+      self.row_users = []
+      self.dirty = set()
+      blocks, batch = [], {}
+      for user_id, profile in pairs:
+         if user_id in self.user_ids or user_id in batch:
+            self.dirty.add(user_id)
+            continue
+         batch[user_id] = profile
+         if len(batch) >= self.STREAM_BATCH:
+            blocks.append(self._encode_batch(batch))
+            batch = {}
+      if batch:
+         blocks.append(self._encode_batch(batch))
+      if not blocks:
+         self._clear()
+         return
+      features = sp.vstack(blocks, format='csr')
+      self._fit(self._choose_representation(features))
+
+   def _encode_batch(self, batch):
+      for user_id in batch:
+         self.user_ids[user_id] = len(self.row_users)
+         self.row_users.append(user_id)
+      return self.encoder.encode_sparse(batch)
+
+   def _clear(self):
+      self.features = None
+      self.normalized = None
+      self.table_rows = None
+      self.table_scores = None
+
+   def _fit(self, features):
+      self.features = features
+      self.normalized = self._normalize(self.features)
+      self.backend.fit(self.normalized)
+      n = len(self.row_users)
+      self.table_rows = np.full((n, self.table_k), -1, dtype=np.int32)
+      self.table_scores = np.full((n, self.table_k), -np.inf, dtype=np.float16)
+      self._fill_table(np.arange(n))
+
+   def _encode_features(self, users):
+      if self.representation == "dense":
+         self.sparse = False
+         return np.ascontiguousarray(self.encoder.encode_all(users, self.row_users), dtype=np.float32)
+
+      return self._choose_representation(self.encoder.encode_sparse(users, self.row_users))
+
+   def _choose_representation(self, features):
+      if self.representation == "dense":
+         self.sparse = False
+      elif self.representation == "auto":
+         n, dim = features.shape
+         density = features.nnz / max(n * dim, 1)
+         self.sparse = dim >= self.SPARSE_MIN_DIM and density <= self.SPARSE_MAX_DENSITY
+      if not self.sparse:
+         features = features.toarray()
+      return features
+
+   def mark_dirty(self, user_id):
+      with self.lock:
+         self.dirty.add(user_id)
+
+   def mark_all_dirty(self, users):
+      with self.lock:
+         self.dirty.update(users.keys())
+
+   def refresh(self, users):
+      """Re-encode dirty users and update their rows in place"""
+      with self.lock:
+         self._refresh(users)
+
+   def _refresh(self, users):
+      if not self.dirty:
+         return
+      if self.features is None:
+         self._build(users)
+         return
+
+      dirty = [user_id for user_id in self.dirty if user_id in users]
+      self.dirty = set()
+      if not dirty:
+         return
+      if len(dirty) * 2 > len(users):
+         self._build(users)
+         return
+
+      new_users = [user_id for user_id in dirty if user_id not in self.user_ids]
+      if new_users:
+         self._grow(new_users)
+
+      rows = np.array([self.user_ids[user_id] for user_id in dirty])
+      if self.sparse:
+         encoded = self.encoder.encode_sparse(users, dirty)
+         self.features = self._replace_rows(self.features, rows, encoded)
+         self.normalized = self._replace_rows(self.normalized, rows, self._normalize(encoded))
+      else:
+         for user_id, row in zip(dirty, rows.tolist()):
+            self.encoder.encode_user(users[user_id], out=self.features[row])
+         self.normalized[rows] = self._normalize(self.features[rows])
+      self.backend.update(self.normalized, rows)
+      self._patch_table(rows)
+
+   def _fill_table(self, rows, chunk_size=1024):
+      """Recompute the cached top-k of `rows`"""
+      if self._use_parallel(len(rows)):
+         idx, scores = parallel_top_k(self.normalized, self.table_k, rows, pool=self._executor())
+         self._store_table(rows, idx, scores)
+         return
+      for start in range(0, len(rows), chunk_size):
+         chunk = rows[start:start + chunk_size]
+         idx, scores = self.backend.query_many(self.normalized[chunk], self.table_k, exclude=chunk)
+         self._store_table(chunk, idx, scores)
+
+   def _store_table(self, rows, idx, scores):
+      found = np.isfinite(scores)
+      self.table_rows[rows] = np.where(found, idx, -1)
+      self.table_scores[rows] = np.where(found, scores, -np.inf)
+
+   def _patch_table(self, changed):
+      """Keep the top-k table exact after `changed` rows were rewritten.
+
+         A row must be recomputed if it changed itself, if it listed a changed row (whose score
+         may have dropped) or if a changed row now scores above its current k-th neighbour.
+      """
+      threshold = self.table_scores[:, -1].astype(np.float32) - self.TABLE_SLACK
+      stale = np.zeros(len(self.row_users), dtype=bool)
+      stale[changed] = True
+      for row in changed.tolist():
+         scores = dot_rows(self.normalized, self.normalized[row])
+         stale |= scores > threshold
+         stale |= (self.table_rows == row).any(axis=1)
+      self._fill_table(np.flatnonzero(stale))
+
+   def _table_neighbours(self, row, k):
+      return [
+         (self.row_users[r], float(s))
+         for r, s in zip(self.table_rows[row, :k].tolist(), self.table_scores[row, :k].tolist()) if r >= 0
+      ]
+
+   def neighbours(self, user_id, k):
+      """Return up to k (user_id, score) pairs most similar to user_id, excluding the user itself"""
+      if user_id not in self.user_ids:
+         return []
+      with self.lock:
+         row = self.user_ids[user_id]
+         if k <= self.table_k:
+            return self._table_neighbours(row, k)
+         rows, scores = self.backend.query(self.normalized[row], k, exclude=row)
+      return [(self.row_users[r], float(s)) for r, s in zip(rows.tolist(), scores.tolist())]
+
+   def neighbours_many(self, user_ids, k, chunk_size=1024):
+      """neighbours() for many users, computed with batched matrix products; unknown users get []"""
+      result = {user_id: [] for user_id in user_ids}
+      known = [user_id for user_id in user_ids if user_id in self.user_ids]
+      with self.lock:
+         if k <= self.table_k and self.table_rows is not None:
+            for user_id in known:
+               result[user_id] = self._table_neighbours(self.user_ids[user_id], k)
+            return result
+         if self._use_parallel(len(known)):
+            rows = np.array([self.user_ids[user_id] for user_id in known])
+            idx, scores = parallel_top_k(self.normalized, k, rows, pool=self._executor())
+            self._collect(result, known, idx, scores)
+            return result
+         for start in range(0, len(known), chunk_size):
+            chunk = known[start:start + chunk_size]
+            rows = np.array([self.user_ids[user_id] for user_id in chunk])
+            idx, scores = self.backend.query_many(self.normalized[rows], k, exclude=rows)
+            self._collect(result, chunk, idx, scores)
+      return result
+
+   def _use_parallel(self, query_rows):
+      # workers attach to a dense shared-memory copy, which would defeat a sparse matrix
+      return (self.workers > 1 and not self.sparse and isinstance(self.backend, ExactNeighbourSearch)
+              and query_rows >= self.PARALLEL_MIN_ROWS)
+
+   def _executor(self):
+      if self._pool is not None and self._pool_workers != self.workers:
+         self._pool.shutdown()
+         self._pool = None
+      if self._pool is None:
+         self._pool = make_pool(self.workers)
+         self._pool_workers = self.workers
+      return self._pool
+
+   def close(self):
+      """Shut down the worker pool, if one was started"""
+      with self.lock:
+         if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+   def _collect(self, result, user_ids, idx, scores):
+      for user_id, row_idx, row_scores in zip(user_ids, idx.tolist(), scores.tolist()):
+         result[user_id] = [
+            (self.row_users[r], s) for r, s in zip(row_idx, row_scores) if s != float('-inf')
+         ]
+
+   def recall(self, k=3, sample_size=200, backend=None):
+      """Recall of `backend` (default: the active one) against exact search on the current matrix"""
+      if self.normalized is None:
+         return 1.0
+      if backend is None:
+         candidate = self.backend
+      else:
+         candidate = make_backend(backend)
+         candidate.fit(self.normalized)
+      return neighbour_recall(candidate, self.normalized, k, sample_size)
+
+   def memory_usage(self):
+      """Bytes held by the feature matrices, the neighbour table and the backend's own structures"""
+      with self.lock:
+         usage = {
+            "users": len(self.row_users),
+            "sparse": self.sparse,
+            "features_bytes": self._nbytes(self.features),
+            "normalized_bytes": self._nbytes(self.normalized),
+            "neighbour_table_bytes": (self.table_rows.nbytes + self.table_scores.nbytes) if self.table_rows is not None else 0,
+            "backend_bytes": sum(
+               value.nbytes for name, value in vars(self.backend).items()
+               if isinstance(value, np.ndarray) and name != "matrix"
+            )
+         }
+      usage["total_bytes"] = sum(value for name, value in usage.items() if name.endswith("_bytes"))
+      return usage
+
+   def _grow(self, new_users):
+      start = len(self.row_users)
+      for offset, user_id in enumerate(new_users):
+         self.user_ids[user_id] = start + offset
+         self.row_users.append(user_id)
+
+      if self.sparse:
+         extra = sp.csr_matrix((len(new_users), self.features.shape[1]), dtype=np.float32)
+         self.features = sp.vstack([self.features, extra], format='csr')
+         self.normalized = sp.vstack([self.normalized, extra], format='csr')
+      else:
+         extra = np.zeros((len(new_users), self.features.shape[1]), dtype=np.float32)
+         self.features = np.vstack([self.features, extra])
+         self.normalized = np.vstack([self.normalized, extra])
+      self.table_rows = np.vstack([self.table_rows, np.full((len(new_users), self.table_k), -1, dtype=np.int32)])
+      self.table_scores = np.vstack([self.table_scores, np.full((len(new_users), self.table_k), -np.inf, dtype=np.float16)])
+
+   @staticmethod
+   def _replace_rows(matrix, rows, new_rows):
+      """Copy of CSR `matrix` with `rows` replaced by the rows of CSR `new_rows`"""
+      n = matrix.shape[0]
+      keep = np.ones(n, dtype=np.float32)
+      keep[rows] = 0
+      place = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, np.arange(len(rows)))), shape=(n, len(rows)))
+      result = (sp.diags(keep) @ matrix + place @ new_rows).tocsr()
+      result.eliminate_zeros()
+      return result
+
+   @staticmethod
+   def _nbytes(matrix):
+      if matrix is None:
+         return 0
+      if sp.issparse(matrix):
+         return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+      return matrix.nbytes
+
+   @staticmethod
+   def _normalize(matrix):
+      if sp.issparse(matrix):
+         norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+         norms[norms == 0] = 1.0
+         return (sp.diags(1.0 / norms) @ matrix).astype(np.float32).tocsr()
+      norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+      norms[norms == 0] = 1.0
+      return (matrix / norms).astype(np.float32, copy=False)
@@ -0,0 +1,134 @@
+import json
+import os
+from event_catalog import to_json
+
+try:
+   import msgpack
+except ImportError:
+   msgpack = None
+
+# snapshots with these extensions are msgpack, anything else is JSON
+MSGPACK_SUFFIXES = ('.msgpack', '.mpk')
+# characters read from a JSON snapshot at a time
+CHUNK_SIZE = 1 << 20
+# characters that can continue a JSON number
+_NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+def snapshot_format(path):
+   return "msgpack" if str(path).endswith(MSGPACK_SUFFIXES) else "json"
+
+def _require_msgpack():
+   if msgpack is None:
+      raise RuntimeError("msgpack snapshots need the msgpack package (pip install msgpack)")
+
+class _JsonStream:
+   """Pulls JSON values one at a time out of a file read in CHUNK_SIZE pieces"""
+   def __init__(self, f, chunk_size):
+      self.f = f
+      self.chunk_size = chunk_size
+      self.decoder = json.JSONDecoder()
+      self.buffer = ""
+      self.pos = 0
+      self.eof = False
+
+   def _fill(self):
+      chunk = self.f.read(self.chunk_size)
+      if not chunk:
+         self.eof = True
+         return False
+      self.buffer = self.buffer[self.pos:] + chunk
+      self.pos = 0
+      return True
+
+   def peek(self):
+      """The next non-whitespace character, or '' at the end of the file"""
+      while True:
+         buffer, pos = self.buffer, self.pos
+         while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+            pos += 1
+         self.pos = pos
+         if pos < len(buffer):
+            return buffer[pos]
+         if not self._fill():
+            return ""
+
+   def expect(self, char):
+      if self.peek() != char:
+         raise json.JSONDecodeError(f"Expecting {char!r}", self.buffer, self.pos)
+      self.pos += 1
+
+   def skip(self, char):
+      if self.peek() == char:
+         self.pos += 1
+
+   def value(self):
+      self.peek()
+      while True:
+         try:
+            value, end = self.decoder.raw_decode(self.buffer, self.pos)
+         except json.JSONDecodeError:
+            if self._fill():
+               continue
+            raise
+         # a bare number cut off by the end of the chunk ("12", "1.", "1.5e") still parses, just short,
+         # so read on until something other than a number character follows its start
+         if not isinstance(value, (dict, list, str)) and not self.eof:
+            token_end = self.pos
+            while token_end < len(self.buffer) and self.buffer[token_end] in _NUMBER_CHARS:
+               token_end += 1
+            if token_end == len(self.buffer) and self._fill():
+               continue
+         self.pos = end
+         return value
+
+def iter_json_users(path, chunk_size=CHUNK_SIZE):
+   """Yield (user_id, profile) from the "users" object of a JSON snapshot without parsing the whole file first"""
+   with open(path, 'r', encoding='utf-8') as f:
+      stream = _JsonStream(f, chunk_size)
+      stream.expect('{')
+      while stream.peek() != '}':
+         key = stream.value()
+         stream.expect(':')
+         if key != "users":
+            # nothing but the users is kept in the profile database
+            stream.value()
+         else:
+            stream.expect('{')
+            while stream.peek() != '}':
+               user_id = stream.value()
+               stream.expect(':')
+               yield user_id, stream.value()
+               stream.skip(',')
+            stream.expect('}')
+         stream.skip(',')
+
+def iter_msgpack_users(path):
+   """Yield (user_id, profile) from a msgpack snapshot, a sequence of [user_id, profile] arrays"""
+   _require_msgpack()
+   with open(path, 'rb') as f:
+      for user_id, profile in msgpack.Unpacker(f, raw=False, strict_map_key=False):
+         yield user_id, profile
+
+def iter_snapshot(path):
+   """Yield (user_id, profile) for every user in the snapshot at `path` (nothing if it does not exist)"""
+   if not os.path.exists(path):
+      return iter(())
+   if snapshot_format(path) == "msgpack":
+      return iter_msgpack_users(path)
+   return iter_json_users(path)
+
+def write_msgpack_users(path, users):
+   """Write (user_id, profile) pairs as a msgpack snapshot"""
+   _require_msgpack()
+   packer = msgpack.Packer(default=to_json, use_bin_type=True)
+   with open(path, 'wb') as f:
+      for user_id, profile in users:
+         f.write(packer.pack([user_id, profile]))
+
+def write_snapshot(path, db, format=None):
+   """Write the profile database to `path`, as indented JSON or as a msgpack stream of its users"""
+   if (format or snapshot_format(path)) == "msgpack":
+      write_msgpack_users(path, db["users"].items())
+      return
+   with open(path, 'w', encoding='utf-8') as f:
+      json.dump(db, f, indent=4, ensure_ascii=False, default=to_json)
@@ -0,0 +1,267 @@
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from click_log import ClickLog
+from event_catalog import to_json
+
+LIST_FIELDS = ['sport_interests', 'teams_liked', 'event_type_priority', 'training_liked_teams', 'training_location']
+COUNT_FIELDS = ['sports_liked_count', 'team_liked_sport', 'team_liked_location', 'player_liked_sports_count',
+                'training_sports_liked', 'events_clicked', 'sports_clicked', 'teams_clicked']
+SCALAR_COLUMNS = ['user_name', 'age', 'city', 'district']
+
+class ProfileStore(ABC):
+   """Persistence backend for user profiles, shared by ClickTracker and Recommender"""
+   # True when other processes may write to the same store, so callers should re-read before updating
+   shared = False
+
+   @abstractmethod
+   def load_all(self):
+      """Return {user_id: profile} for every user"""
+
+   def iter_all(self, users):
+      """Yield (user_id, profile) for every user as it is loaded, storing each one into `users`"""
+      for user_id, profile in self.load_all().items():
+         users[user_id] = profile
+         yield user_id, profile
+
+   @abstractmethod
+   def get(self, user_id):
+      """Return the stored profile for user_id, or None"""
+
+   @abstractmethod
+   def put(self, user_id, profile):
+      """Replace the stored profile for user_id"""
+
+   def update(self, user_id, apply):
+      """Store apply(profile or None) -> profile for user_id; only atomic across processes where overridden"""
+      profile = apply(self.get(user_id))
+      self.put(user_id, profile)
+      return profile
+
+   def compact(self):
+      pass
+
+   def close(self):
+      pass
+
+class JsonProfileStore(ProfileStore):
+   """user_clicks.json (or .msgpack) snapshot plus append-only click log"""
+   def __init__(self, path):
+      self.path = path
+      self.log = ClickLog(path)
+
+   def load_all(self):
+      if self.log.db is None:
+         self.log.load()
+      return self.log.db["users"]
+
+   def iter_all(self, users):
+      """Stream the snapshot and log; `users` becomes the live users dict of the store"""
+      if self.log.db is not None:
+         yield from super().iter_all(users)
+         return
+      yield from self.log.iter_load(users)
+
+   def get(self, user_id):
+      return self.load_all().get(user_id)
+
+   def put(self, user_id, profile):
+      self.load_all()[user_id] = profile
+      self.log.append(user_id, profile)
+
+   def compact(self):
+      self.load_all()
+      self.log.compact()
+
+   def close(self):
+      self.log.close()
+
+class SQLiteProfileStore(ProfileStore):
+   """Normalized SQLite profile store in WAL mode with per-user point reads and updates.
+
+      Reads see one consistent snapshot and put() replaces a whole profile atomically. update() reads,
+      edits and writes a profile inside one BEGIN IMMEDIATE transaction, so workers updating the
+      same user at once are serialized and neither loses the other's clicks.
+   """
+   shared = True
+
+   SCHEMA = """
+      CREATE TABLE IF NOT EXISTS users (
+         user_id TEXT PRIMARY KEY,
+         user_name,
+         age,
+         city,
+         district,
+         attributes TEXT NOT NULL DEFAULT '{}'
+      );
+      CREATE TABLE IF NOT EXISTS user_lists (
+         user_id TEXT NOT NULL,
+         field TEXT NOT NULL,
+         position INTEGER NOT NULL,
+         value,
+         PRIMARY KEY (user_id, field, position)
+      );
+      CREATE TABLE IF NOT EXISTS click_counts (
+         user_id TEXT NOT NULL,
+         field TEXT NOT NULL,
+         key TEXT NOT NULL,
+         count,
+         PRIMARY KEY (user_id, field, key)
+      );
+      CREATE TABLE IF NOT EXISTS liked_events (
+         user_id TEXT NOT NULL,
+         position INTEGER NOT NULL,
+         event_id TEXT,
+         event_type TEXT,
+         sport_id TEXT,
+         payload TEXT NOT NULL,
+         PRIMARY KEY (user_id, position)
+      );
+      CREATE INDEX IF NOT EXISTS liked_events_event ON liked_events (event_id);
+   """
+
+   def __init__(self, path, timeout=30.0):
+      self.path = path
+      self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+      self.lock = threading.Lock()
+      self.conn.execute("PRAGMA journal_mode=WAL")
+      self.conn.execute("PRAGMA synchronous=NORMAL")
+      self.conn.executescript(self.SCHEMA)
+
+   @staticmethod
+   def _empty_profile(user_id):
+      profile = {"user_id": user_id}
+      for field in LIST_FIELDS:
+         profile[field] = []
+      for field in COUNT_FIELDS:
+         profile[field] = {}
+      profile["events_liked"] = []
+      return profile
+
+   def _assemble(self, user_rows, list_rows, count_rows, event_rows):
+      users = {}
+      for user_id, user_name, age, city, district, attributes in user_rows:
+         profile = self._empty_profile(user_id)
+         profile.update(json.loads(attributes))
+         profile.update({"user_name": user_name, "age": age, "city": city, "district": district})
+         users[user_id] = profile
+      for user_id, field, value in list_rows:
+         if user_id in users:
+            users[user_id][field].append(value)
+      for user_id, field, key, count in count_rows:
+         if user_id in users:
+            users[user_id][field][key] = count
+      for user_id, payload in event_rows:
+         if user_id in users:
+            users[user_id]["events_liked"].append(json.loads(payload))
+      return users
+
+   @staticmethod
+   def _fetch(cur, where="", params=()):
+      return (
+         cur.execute(f"SELECT user_id, user_name, age, city, district, attributes FROM users {where}", params).fetchall(),
+         cur.execute(f"SELECT user_id, field, value FROM user_lists {where} ORDER BY user_id, field, position", params).fetchall(),
+         cur.execute(f"SELECT user_id, field, key, count FROM click_counts {where}", params).fetchall(),
+         cur.execute(f"SELECT user_id, payload FROM liked_events {where} ORDER BY user_id, position", params).fetchall(),
+      )
+
+   def _select(self, where="", params=()):
+      with self.lock:
+         cur = self.conn.cursor()
+         # one read transaction, so a put() from another worker cannot land between the four tables
+         cur.execute("BEGIN")
+         try:
+            rows = self._fetch(cur, where, params)
+         finally:
+            cur.execute("COMMIT")
+      return self._assemble(*rows)
+
+   def load_all(self):
+      return self._select()
+
+   def get(self, user_id):
+      return self._select("WHERE user_id = ?", (user_id,)).get(user_id)
+
+   @staticmethod
+   def _rows(user_id, profile):
+      known = set(SCALAR_COLUMNS) | set(LIST_FIELDS) | set(COUNT_FIELDS) | {"user_id", "events_liked"}
+      attributes = {key: value for key, value in profile.items() if key not in known}
+      user_row = (user_id, *(profile.get(column) for column in SCALAR_COLUMNS), json.dumps(attributes, ensure_ascii=False, default=to_json))
+      list_rows = [
+         (user_id, field, position, value)
+         for field in LIST_FIELDS
+         for position, value in enumerate(profile.get(field) or [])
+      ]
+      count_rows = [
+         (user_id, field, key, count)
+         for field in COUNT_FIELDS
+         for key, count in (profile.get(field) or {}).items()
+      ]
+      event_rows = [
+         (user_id, position, event.get("event_id"), event.get("event_type"), event.get("sport_id"),
+          json.dumps(event, ensure_ascii=False, default=to_json))
+         for position, event in enumerate(profile.get("events_liked") or [])
+      ]
+      return user_row, list_rows, count_rows, event_rows
+
+   def _write(self, cur, user_id, profile):
+      user_row, list_rows, count_rows, event_rows = self._rows(user_id, profile)
+      cur.execute(
+         "INSERT INTO users (user_id, user_name, age, city, district, attributes) VALUES (?, ?, ?, ?, ?, ?) "
+         "ON CONFLICT(user_id) DO UPDATE SET user_name = excluded.user_name, age = excluded.age, "
+         "city = excluded.city, district = excluded.district, attributes = excluded.attributes",
+         user_row
+      )
+      for table in ("user_lists", "click_counts", "liked_events"):
+         cur.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+      cur.executemany("INSERT INTO user_lists (user_id, field, position, value) VALUES (?, ?, ?, ?)", list_rows)
+      cur.executemany("INSERT INTO click_counts (user_id, field, key, count) VALUES (?, ?, ?, ?)", count_rows)
+      cur.executemany(
+         "INSERT INTO liked_events (user_id, position, event_id, event_type, sport_id, payload) VALUES (?, ?, ?, ?, ?, ?)",
+         event_rows
+      )
+
+   def put(self, user_id, profile):
+      self.put_many({user_id: profile})
+
+   def put_many(self, profiles):
+      """Write several profiles in one transaction"""
+      with self.lock:
+         cur = self.conn.cursor()
+         cur.execute("BEGIN IMMEDIATE")
+         try:
+            for user_id, profile in profiles.items():
+               self._write(cur, user_id, profile)
+            cur.execute("COMMIT")
+         except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+   def update(self, user_id, apply):
+      """Read, apply and write one profile under a write lock, so concurrent updates from other workers queue up"""
+      with self.lock:
+         cur = self.conn.cursor()
+         cur.execute("BEGIN IMMEDIATE")
+         try:
+            profile = apply(self._assemble(*self._fetch(cur, "WHERE user_id = ?", (user_id,))).get(user_id))
+            self._write(cur, user_id, profile)
+            cur.execute("COMMIT")
+         except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+      return profile
+
+   def compact(self):
+      with self.lock:
+         self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+   def close(self):
+      with self.lock:
+         self.conn.close()
+
+def open_store(path):
+   """Pick the backend from the file extension: .db/.sqlite/.sqlite3 -> SQLite, anything else -> JSON"""
+   if str(path).endswith(('.db', '.sqlite', '.sqlite3')):
+      return SQLiteProfileStore(path)
+   return JsonProfileStore(path)
@@ -0,0 +1,29 @@
+import os
+import pytest
+from benchmarks.fake_airtable import FakeAirtable
+from benchmarks.run import install_fake_airtable
+from benchmarks.synthetic import generate_users, write_database
+
+@pytest.fixture
+def airtable():
+   """A small FakeAirtable installed as every module's `api`"""
+   airtable = FakeAirtable(num_matches=200, num_tournaments=20)
+   install_fake_airtable(airtable)
+   return airtable
+
+@pytest.fixture
+def recommender(tmp_path, airtable):
+   """A Recommender over 30 synthetic users, with an in-memory catalog and upcoming-matches store"""
+   from catalog import Catalog
+   from match_store import UpcomingMatchesStore
+   from recommender import Recommender
+   path = os.path.join(tmp_path, "users.json")
+   write_database(path, generate_users(30, airtable, seed=1))
+   catalog = Catalog(airtable, "base")
+   catalog.load()
+   match_store = UpcomingMatchesStore(airtable, "base")
+   match_store.sync()
+   recommender = Recommender(path, catalog.sport_ids(), catalog.location_ids(), catalog=catalog, match_store=match_store)
+   yield recommender
+   recommender.close()
+   recommender.profiles.store.close()
@@ -0,0 +1,58 @@
+import importlib
+import json
+import sys
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.fake_airtable import FakeAirtable, EVENTS_TABLE
+from benchmarks.run import install_fake_airtable
+from benchmarks.synthetic import generate_users, write_database
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+   """main.py started in a scratch directory against FakeAirtable, with a few synthetic users"""
+   monkeypatch.chdir(tmp_path)
+   monkeypatch.setenv("RECOMMENDA_STARTUP", "eager")
+   (tmp_path / "api_keys.json").write_text(json.dumps({"AIRTABLE_API_KEY": "key", "AIRTABLE_BASE_ID": "base"}))
+   airtable = FakeAirtable(num_matches=200, num_tournaments=20)
+   install_fake_airtable(airtable)
+   write_database(str(tmp_path / "user_clicks.json"), generate_users(20, airtable, seed=1))
+   sys.modules.pop("main", None)
+   main = importlib.import_module("main")
+   with TestClient(main.app) as client:
+      yield client, airtable
+   sys.modules.pop("main", None)
+
+def test_profile_endpoints_serialize_event_stats(app):
+   client, airtable = app
+   user_id = "bench_user_0"
+   assert client.get(f"/api/users/{user_id}").status_code == 200
+   assert client.get("/api/get_user_clicks").status_code == 200
+
+   event_id = airtable.ids(EVENTS_TABLE)[0]
+   assert client.post(f"/api/track/{user_id}/event/{event_id}").status_code == 200
+   response = client.get(f"/api/users/{user_id}")
+   assert response.status_code == 200
+   profile = response.json()["profile"]
+   assert event_id in profile["event_stats"]
+   assert all("event_ts" not in event for event in profile["events_liked"])
+
+   update = {"user_name": "Ana", "age": "ADULTS", "city": "Zagreb", "district": "Centar",
+             "sport_interests": [], "event_type_priority": ["MATCH"]}
+   assert client.put(f"/api/users/{user_id}", json=update).status_code == 200
+   assert client.post("/api/users/initialize/new_user").status_code == 200
+
+def test_neighbour_recall_rejects_non_positive_arguments(app):
+   client, _ = app
+   assert client.get("/api/neighbours/recall", params={"k": 0}).status_code == 400
+   assert client.get("/api/neighbours/recall", params={"sample_size": 0}).status_code == 400
+   assert client.get("/api/neighbours/recall", params={"k": 2, "sample_size": 5}).status_code == 200
+
+def test_batch_recommendations_validate_request(app):
+   client, _ = app
+   response = client.post("/api/recommend/batch", json={"user_ids": ["bench_user_0", "bench_user_1"], "limit": 3})
+   assert response.status_code == 200
+   assert [json.loads(line)["user_id"] for line in response.text.splitlines()] == ["bench_user_0", "bench_user_1"]
+   assert client.post("/api/recommend/batch", json={"user_ids": ["bench_user_0"], "limit": None}).status_code == 422
+   assert client.post("/api/recommend/batch", json={"user_ids": ["bench_user_0"], "limit": 0}).status_code == 422
+   too_many = ["bench_user_0"] * (sys.modules["main"].batch_max_users + 1)
+   assert client.post("/api/recommend/batch", json={"user_ids": too_many}).status_code == 422
@@ -0,0 +1,40 @@
+import asyncio
+import httpx
+from async_api import AsyncAirtable
+
+def _airtable(teams, failing):
+   """AsyncAirtable on a mock transport: `failing` team IDs answer 429, other known teams 200, the rest 404"""
+   def handler(request):
+      record_id = request.url.path.rsplit("/", 1)[-1]
+      if record_id in failing:
+         return httpx.Response(429, json={"error": "RATE_LIMIT"})
+      if record_id in teams:
+         return httpx.Response(200, json=teams[record_id])
+      return httpx.Response(404, json={"error": "NOT_FOUND"})
+   airtable = AsyncAirtable("key", "base")
+   airtable.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://airtable.invalid/base")
+   return airtable
+
+def _match_team_ids(recommender, user_id, limit):
+   user = recommender.users[user_id]
+   for query in recommender._real_time_match_queries(user):
+      matches = recommender.match_store.get_similar_upcoming_matches(**query)
+      if matches:
+         return {match['fields']['Home Team'][0] for match in matches[:limit]}
+   return set()
+
+def test_failed_team_lookup_renders_unknown_and_is_not_cached(recommender):
+   user_id = "bench_user_0"
+   teams = dict(recommender.catalog.tables['teams'])
+   recommender.catalog.tables['teams'].clear()
+   failing = sorted(_match_team_ids(recommender, user_id, 5))[:1]
+   airtable = _airtable(teams, failing)
+
+   matches = asyncio.run(recommender.aget_real_time_match_recommendations(user_id, airtable, 5))
+   assert matches
+   assert {match["home_team"] for match in matches if match["home_team_id"] in failing} == {"Unknown Team"}
+   assert all(match["home_team"] != "Unknown Team" for match in matches if match["home_team_id"] not in failing)
+   assert not recommender.recommendation_cache.get(user_id, "matches", (5,), recommender._data_version())[0]
+
+   homepage = asyncio.run(recommender.aget_homepage_recommendations(user_id, airtable, 5))
+   assert homepage["upcoming_events"]
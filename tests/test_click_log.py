@@ -0,0 +1,52 @@
+import json
+import os
+from click_log import ClickLog, load_database
+from snapshot import iter_snapshot
+
+def _profile(user_id, clicks):
+   return {"user_id": user_id, "sports_clicked": {"s1": clicks}}
+
+def test_replay_applies_log_entries_over_the_snapshot(tmp_path):
+   path = os.path.join(tmp_path, "users.json")
+   log = ClickLog(path)
+   log.load()
+   log.db["users"]["u1"] = _profile("u1", 1)
+   log.compact()
+   for clicks in (2, 3):
+      log.db["users"]["u1"] = _profile("u1", clicks)
+      log.append("u1", log.db["users"]["u1"])
+   log.append("u2", _profile("u2", 1))
+   log.close()
+   # a torn write at the tail is dropped, not fatal
+   with open(f"{path}.log", 'a', encoding='utf-8') as f:
+      f.write('{"user_id": "u3", "prof')
+
+   assert dict(iter_snapshot(path)) == {"u1": _profile("u1", 1)}
+   assert load_database(path)["users"] == {"u1": _profile("u1", 3), "u2": _profile("u2", 1)}
+
+def test_load_folds_the_log_into_a_new_snapshot(tmp_path):
+   path = os.path.join(tmp_path, "users.json")
+   log = ClickLog(path)
+   log.load()
+   log.append("u1", _profile("u1", 1))
+   log.close()
+
+   reloaded = ClickLog(path)
+   assert reloaded.load()["users"] == {"u1": _profile("u1", 1)}
+   reloaded.close()
+   assert os.path.getsize(f"{path}.log") == 0
+   with open(path, encoding='utf-8') as f:
+      assert json.load(f)["users"] == {"u1": _profile("u1", 1)}
+
+def test_compacts_every_n_appends(tmp_path):
+   path = os.path.join(tmp_path, "users.json")
+   log = ClickLog(path, compact_every=3)
+   log.load()
+   for i in range(4):
+      log.db["users"][f"u{i}"] = _profile(f"u{i}", i)
+      log.append(f"u{i}", log.db["users"][f"u{i}"])
+   log.close()
+   assert set(dict(iter_snapshot(path))) == {"u0", "u1", "u2"}
+   with open(f"{path}.log", encoding='utf-8') as f:
+      assert [json.loads(line)["user_id"] for line in f] == ["u3"]
+   assert set(load_database(path)["users"]) == {"u0", "u1", "u2", "u3"}
@@ -0,0 +1,28 @@
+import itertools
+import pytest
+from API import get_similar_upcoming_matches
+from match_store import UpcomingMatchesStore
+
+def _ids(matches):
+   return [match['id'] for match in matches]
+
+@pytest.fixture
+def match_store(airtable):
+   store = UpcomingMatchesStore(airtable, "base")
+   store.sync()
+   return store
+
+def test_queries_match_the_airtable_filter(airtable, match_store):
+   fields = [match['fields'] for match in match_store.snapshot.records]
+   sport_ids = [None, fields[0]['Sport'][0], [fields[1]['Sport'][0], fields[2]['Sport'][0]], "recMissingSport"]
+   team_ids = [None, fields[0]['Home Team'][0], [fields[3]['Away Team'][0], "recMissingTeam"]]
+   location_ids = [None, fields[0]['Location'][0], "recMissingLocation"]
+   for sport_id, team_id, location_id, days_ahead in itertools.product(sport_ids, team_ids, location_ids, (1, 7, 30)):
+      query = dict(sport_id=sport_id, team_id=team_id, location_id=location_id, days_ahead=days_ahead)
+      assert _ids(match_store.get_similar_upcoming_matches(**query)) == \
+         _ids(get_similar_upcoming_matches(airtable, "base", **query)), query
+
+def test_queries_past_the_horizon_go_to_airtable(airtable, match_store):
+   airtable.reset_calls()
+   match_store.get_similar_upcoming_matches(days_ahead=match_store.horizon_days + 1)
+   assert airtable.calls
@@ -0,0 +1,79 @@
+import os
+from datetime import date, timedelta
+from benchmarks.fake_airtable import EVENTS_TABLE
+from click_tracker import ClickTracker
+from precompute import PrecomputedRecommendations, precompute, write_precomputed
+
+def _precompute(recommender, tmp_path, limit=10):
+   path = os.path.join(tmp_path, "precomputed")
+   precompute(recommender, path, limit, 3)
+   recommender.load_precomputed(path)
+   return path
+
+def test_write_swap_read_round_trip(tmp_path):
+   path = os.path.join(tmp_path, "precomputed")
+   payloads = {"u1": {"matches": [{"id": "m1"}], "events": []}, "u2": {"matches": [], "events": [{"event_id": "Š1"}]}}
+   write_precomputed(path, ["u1", "u2"], {"u1": [("u2", 0.5), ("gone", 0.25)]}, payloads, 10, 3, "abc")
+   first_target = os.path.realpath(path)
+   assert os.path.islink(path)
+
+   precomputed = PrecomputedRecommendations(path)
+   assert precomputed.get("u1") == payloads["u1"] and precomputed.get("u2") == payloads["u2"]
+   assert precomputed.get("u3") is None and "u3" not in precomputed
+   assert precomputed.neighbours("u1") == [("u2", 0.5)]
+   assert precomputed.neighbours("u2") == []
+   assert (precomputed.limit, precomputed.k, precomputed.matches_fingerprint) == (10, 3, "abc")
+
+   write_precomputed(path, ["u3"], {}, {"u3": {"matches": [], "events": []}}, 5, 3)
+   assert os.path.realpath(path) != first_target and not os.path.exists(first_target)
+   # the reader that mapped the previous output keeps serving it until it reloads
+   assert precomputed.get("u1") == payloads["u1"]
+   precomputed.close()
+
+   precomputed = PrecomputedRecommendations(path)
+   assert precomputed.user_ids == ["u3"] and precomputed.matches_fingerprint is None
+   precomputed.close()
+
+def test_changed_users_and_neighbours_fall_back_to_live(recommender, tmp_path):
+   _precompute(recommender, tmp_path)
+   user_id = "bench_user_0"
+   assert recommender._from_precomputed("events", user_id, (5,)) is not None
+   assert recommender._from_precomputed("events", user_id, (None,)) is None
+
+   neighbour_id = recommender.precomputed.neighbours(user_id)[0][0]
+   tracker = ClickTracker(recommender.database_path, recommender, catalog=recommender.catalog)
+   tracker.track_sport_click(neighbour_id, recommender.catalog.sport_ids()[0])
+   assert recommender._from_precomputed("events", user_id, (5,)) is None
+   assert recommender._from_precomputed("matches", neighbour_id, (5,)) is None
+
+   # a reload of every profile keeps the precomputed results
+   recommender._on_profile_change(None, None)
+   assert recommender.precomputed is not None
+
+def test_matches_need_enough_future_matches_from_the_same_snapshot(recommender, tmp_path):
+   _precompute(recommender, tmp_path)
+   served = [user_id for user_id in recommender.users if recommender._from_precomputed("matches", user_id, (3,))]
+   assert served
+   user_id = served[0]
+   record = recommender.precomputed.get(user_id)
+   if len(record["matches"]) > 3:
+      assert recommender._from_precomputed("matches", user_id, (len(record["matches"]) + 1,)) is None
+
+   # a match-store sync that brings in other matches makes the precomputed ranking stale
+   match_id = recommender.match_store.snapshot.records[0]['id']
+   recommender.match_store.api.tables[EVENTS_TABLE][match_id]['fields']['Match Date'] = \
+      (date.today() + timedelta(days=2)).isoformat() + "T00:00:01"
+   recommender.match_store.sync()
+   assert recommender._from_precomputed("matches", user_id, (3,)) is None
+
+def test_reload_picks_up_a_new_output(recommender, tmp_path):
+   path = os.path.join(tmp_path, "precomputed")
+   recommender.load_precomputed(path)
+   assert recommender.precomputed is None
+   precompute(recommender, path, 10, 3)
+   assert recommender.reload_precomputed()
+   first = recommender.precomputed
+   assert not recommender.reload_precomputed()
+   precompute(recommender, path, 5, 3)
+   assert recommender.reload_precomputed()
+   assert recommender.precomputed is not first and recommender.precomputed.limit == 5
@@ -0,0 +1,36 @@
+import time
+from recommendation_cache import RecommendationCache
+
+def test_put_drops_values_read_before_an_invalidation():
+   cache = RecommendationCache()
+   _, _, generation = cache.get("u", "matches", (5,), 0)
+   cache.invalidate_user("neighbour")
+   cache.put("u", "matches", (5,), ["stale"], ["neighbour"], 0, generation)
+   assert not cache.get("u", "matches", (5,), 0)[0]
+
+   _, _, generation = cache.get("u", "matches", (5,), 0)
+   cache.put("u", "matches", (5,), ["fresh"], ["neighbour"], 0, generation)
+   assert cache.get("u", "matches", (5,), 0)[:2] == (True, ["fresh"])
+
+def test_changed_at_is_bounded():
+   cache = RecommendationCache(maxsize=10)
+   _, _, generation = cache.get("u", "matches", (5,), 0)
+   for i in range(100):
+      cache.invalidate_user(f"user_{i}")
+   assert len(cache.changed_at) <= 10
+   # a value read before the forgotten changes is still rejected
+   cache.put("u", "matches", (5,), ["stale"], [], 0, generation)
+   assert not cache.get("u", "matches", (5,), 0)[0]
+
+def test_warmer_does_not_keep_keys_active(recommender):
+   cache = recommender.recommendation_cache
+   cache.active_window = 0.3
+   user_id = "bench_user_0"
+   recommender.get_real_time_match_recommendations(user_id, 5)
+   cache.invalidate_user(user_id)
+   assert recommender.warm_cache() == 1
+   assert cache.get(user_id, "matches", (5,), recommender._data_version())[0]
+   cache.invalidate_user(user_id)
+   time.sleep(0.4)
+   assert cache.stale_active_keys() == []
+   assert recommender.warm_cache() == 0
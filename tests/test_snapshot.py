@@ -0,0 +1,20 @@
+import json
+import os
+import pytest
+from snapshot import iter_json_users
+
+SNAPSHOTS = [
+   '{"users": {"u1": {"n": 12345}, "u2": 1.5e3}}',
+   '{"version": 2, "users": {"u1": {"xs": [1, -0.25, 3E+2, true, null], "s": "a,b}"}, "u2": -7}, "tail": 1e-3}',
+   json.dumps({"users": {"u1": {"age": 31, "score": 0.125, "name": "Ana Šarić"}, "u2": {"events_liked": [{"id": 1}]}}}, indent=4, ensure_ascii=False),
+]
+
+@pytest.mark.parametrize("text", SNAPSHOTS)
+def test_every_chunk_size_matches_json_load(tmp_path, text):
+   path = os.path.join(tmp_path, "users.json")
+   with open(path, 'w', encoding='utf-8') as f:
+      f.write(text)
+   with open(path, encoding='utf-8') as f:
+      expected = json.load(f)["users"]
+   for chunk_size in range(1, len(text) + 2):
+      assert dict(iter_json_users(path, chunk_size=chunk_size)) == expected, chunk_size
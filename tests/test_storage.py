@@ -0,0 +1,92 @@
+import os
+import threading
+from click_log import ClickLog
+from migrate_to_sqlite import migrate
+from storage import SQLiteProfileStore
+
+def _profile(user_id, **fields):
+   profile = SQLiteProfileStore._empty_profile(user_id)
+   profile.update({"user_name": None, "age": 25, "city": "zagreb", "district": None})
+   profile.update(fields)
+   return profile
+
+def test_sqlite_round_trips_every_profile_field(tmp_path):
+   path = os.path.join(tmp_path, "users.db")
+   profile = _profile(
+      "u1",
+      sport_interests=["s2", "s1"],
+      teams_clicked={"t1": 3},
+      events_liked=[{"event_id": "e1", "event_type": "MATCH", "sport_id": "s1", "timestamp": "2026-01-01T10:00:00"}],
+      event_type_priority=["tournament", "match"],
+      updated_at="2026-01-01T10:00:00"
+   )
+   store = SQLiteProfileStore(path)
+   store.put_many({"u1": profile, "u2": _profile("u2")})
+   store.close()
+
+   store = SQLiteProfileStore(path)
+   assert store.get("u1") == profile
+   assert store.get("missing") is None
+   assert set(store.load_all()) == {"u1", "u2"}
+   store.put("u1", _profile("u1"))
+   assert store.get("u1") == _profile("u1")
+   store.close()
+
+def test_migrate_imports_the_snapshot_and_its_log(tmp_path):
+   json_path = os.path.join(tmp_path, "users.json")
+   db_path = os.path.join(tmp_path, "users.db")
+   log = ClickLog(json_path)
+   log.load()
+   log.db["users"]["u1"] = _profile("u1", teams_liked=["t1"])
+   log.compact()
+   log.append("u1", _profile("u1", teams_liked=["t1", "t2"]))
+   log.append("u2", _profile("u2"))
+   log.close()
+
+   assert migrate(json_path, db_path, batch_size=1) == 2
+   store = SQLiteProfileStore(db_path)
+   assert store.load_all() == {"u1": _profile("u1", teams_liked=["t1", "t2"]), "u2": _profile("u2")}
+   store.close()
+
+def test_sqlite_updates_from_two_workers_keep_every_click(tmp_path, airtable):
+   from catalog import Catalog
+   from click_tracker import ClickTracker
+   path = os.path.join(tmp_path, "users.db")
+   catalog = Catalog(airtable, "base")
+   catalog.load()
+   trackers = [ClickTracker(path, catalog=catalog) for _ in range(2)]
+   trackers[0].initialize_user("u1")
+   sport_id = next(iter(catalog.sport_ids()))
+
+   def click(tracker):
+      for _ in range(25):
+         tracker.track_sport_click("u1", sport_id)
+
+   threads = [threading.Thread(target=click, args=(tracker,)) for tracker in trackers]
+   for thread in threads:
+      thread.start()
+   for thread in threads:
+      thread.join()
+
+   store = SQLiteProfileStore(path)
+   try:
+      assert store.get("u1")["sports_clicked"][sport_id] == 50
+   finally:
+      store.close()
+      for tracker in trackers:
+         tracker.profiles.store.close()
+
+def test_sqlite_update_rolls_back_on_error(tmp_path):
+   store = SQLiteProfileStore(os.path.join(tmp_path, "users.db"))
+   store.put("u1", {"user_id": "u1", "sports_clicked": {"s1": 1}})
+
+   def fail(profile):
+      profile["sports_clicked"]["s1"] += 1
+      raise ValueError
+
+   try:
+      store.update("u1", fail)
+   except ValueError:
+      pass
+   assert store.get("u1")["sports_clicked"] == {"s1": 1}
+   store.close()